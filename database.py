@@ -0,0 +1,1231 @@
+# Standard library imports
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from functools import partial
+
+# Third-party imports
+import bcrypt
+try:
+    import mysql.connector
+except ImportError:  # mysql-connector-python is only needed for the MySQL backend
+    mysql = None
+
+# Local imports
+from query_cache import QueryCache, read_tables, write_table
+from query_metrics import query_metrics
+from training_stats import advance_streak, current_streak, summarize_sets, week_start
+
+DB_CONFIG_PATH = 'db_config.json'
+
+# Keys in db_config.json that tune the shared pool instead of being passed to mysql.connector
+POOL_DEFAULTS = {
+    'pool_size': 5,
+    'max_overflow': 5,
+    'checkout_timeout': 10,
+    'pool_recycle': 1800,
+    'connect_timeout': 10,
+    'pool_pre_ping': True,
+}
+
+# Keys in db_config.json that select the storage backend
+BACKEND_KEYS = ('backend', 'sqlite_path')
+
+# Keys in db_config.json that control query instrumentation
+METRICS_DEFAULTS = {
+    'slow_query_ms': 200,
+    'explain_slow_queries': False,
+    'metrics_dump_path': None,
+    'metrics_dump_interval': 60,
+}
+
+# Keys in db_config.json that enable and size the read-through query cache
+CACHE_DEFAULTS = {
+    'query_cache': False,
+    'query_cache_size': 256,
+    'query_cache_ttl': 30,
+}
+
+# Keys in db_config.json for the local write-behind journal (see outbox.py)
+OUTBOX_DEFAULTS = {
+    'outbox_path': 'outbox.db',
+    'outbox_batch_size': 50,
+}
+
+# Keys in db_config.json for bulk imports (see importer.py). import_load_data needs "allow_local_infile": true
+# in db_config.json and local_infile enabled on the server.
+IMPORT_DEFAULTS = {
+    'import_batch_size': 5000,
+    'import_load_data': False,
+}
+
+# Everything in db_config.json that is an app setting rather than a mysql.connector argument
+APP_CONFIG_KEYS = (set(POOL_DEFAULTS) | set(BACKEND_KEYS) | set(METRICS_DEFAULTS) | set(CACHE_DEFAULTS) | set(OUTBOX_DEFAULTS)
+                   | set(IMPORT_DEFAULTS))
+
+
+def load_db_config(path=DB_CONFIG_PATH):
+    # Without a db_config.json the app runs on a local SQLite file instead of a MySQL server
+    if not os.path.exists(path):
+        logging.info(f"{path} not found, using the local SQLite database")
+        return {'backend': 'sqlite'}
+    with open(path, 'r') as json_file:
+        return json.load(json_file)
+
+
+def create_database_manager(db_config):
+    # "backend": "sqlite" in db_config.json selects the embedded database, MySQL is the default
+    if db_config.get('backend', 'mysql') == 'sqlite':
+        from sqlite_backend import SQLiteDatabaseManager
+        return SQLiteDatabaseManager(db_config)
+    return DatabaseManager(db_config)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no pooled connection becomes free within checkout_timeout seconds."""
+
+
+class SharedConnectionPool:
+    """
+    A single MySQL connection pool for the whole process.
+    Up to pool_size connections are kept open; under load up to max_overflow more are opened and closed
+    again once returned. A checkout waits at most checkout_timeout seconds for a free connection and then
+    raises PoolTimeoutError. Connections are checked before they are handed out: ones idle for longer than
+    pool_recycle seconds are replaced, and with pool_pre_ping a connection the server dropped is reconnected.
+    The time spent waiting is recorded so pool sizing can be tuned from real numbers.
+    """
+    def __init__(self, db_config):
+        options = {key: db_config.get(key, default) for key, default in POOL_DEFAULTS.items()}
+        self.connection_config = {key: value for key, value in db_config.items() if key not in APP_CONFIG_KEYS}
+        self.connection_config['connection_timeout'] = int(options['connect_timeout'])
+        self.pool_size = int(options['pool_size'])
+        self.max_overflow = int(options['max_overflow'])
+        self.checkout_timeout = float(options['checkout_timeout'])
+        self.recycle = float(options['pool_recycle']) if options['pool_recycle'] else None
+        self.pre_ping = bool(options['pool_pre_ping'])
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._idle = []  # (connection, returned_at); the most recently returned is reused first
+        self.opened = 0
+        self.checkouts = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.recycled = 0
+        self.reconnects = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _connect(self):
+        connection = mysql.connector.connect(**self.connection_config)
+        with self._lock:
+            self.created += 1
+        return connection
+
+    def _discard(self, connection):
+        # Close a connection for good and free its slot
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._available:
+            self.opened -= 1
+            self._available.notify()
+
+    def acquire(self, timeout=None):
+        start = time.perf_counter()
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while not self._idle and self.opened >= self.pool_size + self.max_overflow:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeoutError(f"No database connection free after {timeout:g}s "
+                                           f"({self.in_use} in use, pool_size={self.pool_size}, max_overflow={self.max_overflow})")
+                self.waiting += 1
+                try:
+                    self._available.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            if self._idle:
+                connection, returned_at = self._idle.pop()
+            else:
+                connection, returned_at = None, None
+                self.opened += 1
+            self.in_use += 1
+        try:
+            connection = self._checkout(connection, returned_at)
+        except Exception:
+            with self._available:
+                self.in_use -= 1
+                self.opened -= 1
+                self._available.notify()
+            raise
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+        return connection
+
+    def _checkout(self, connection, returned_at):
+        # Hand out a working connection for the slot: a new one, or the idle one once it passes its checks
+        if connection is None:
+            return self._connect()
+        if self.recycle is not None and time.monotonic() - returned_at > self.recycle:
+            # Idle long enough for the server (or a proxy) to have timed it out
+            self._close_quietly(connection)
+            with self._lock:
+                self.recycled += 1
+            return self._connect()
+        if self.pre_ping:
+            try:
+                if not connection.is_connected():
+                    # Revive a connection the server dropped while it sat idle in the pool
+                    connection.reconnect(attempts=1)
+                    with self._lock:
+                        self.reconnects += 1
+            except mysql.connector.Error:
+                self._close_quietly(connection)
+                return self._connect()
+        return connection
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def release(self, connection):
+        try:
+            # End the implicit transaction a read opened, so the next user doesn't see an old snapshot
+            if connection.in_transaction:
+                connection.rollback()
+            reusable = True
+        except mysql.connector.Error:
+            reusable = False
+        with self._available:
+            self.in_use -= 1
+            if reusable and len(self._idle) < self.pool_size:
+                self._idle.append((connection, time.monotonic()))
+                self._available.notify()
+                return
+        # Broken, or an overflow connection beyond pool_size
+        self._discard(connection)
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'open': self.opened,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'waiting': self.waiting,
+                'created': self.created,
+                'recycled': self.recycled,
+                'reconnects': self.reconnects,
+                'timeouts': self.timeouts,
+                'checkouts': self.checkouts,
+                'wait_total_ms': round(self.total_wait * 1000, 3),
+                'wait_avg_ms': round(self.total_wait * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.max_wait * 1000, 3),
+            }
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_shared_pool(db_config):
+    # The pool is created on first use, so importing this module never opens a connection
+    global _shared_pool
+    if _shared_pool is None:
+        with _shared_pool_lock:
+            if _shared_pool is None:
+                _shared_pool = SharedConnectionPool(db_config)
+    return _shared_pool
+
+
+def pool_stats():
+    return _shared_pool.stats() if _shared_pool is not None else {}
+
+
+def start_metrics_dump(db_config):
+    # Append a query_metrics snapshot (with pool statistics) to metrics_dump_path every metrics_dump_interval seconds
+    path = db_config.get('metrics_dump_path', METRICS_DEFAULTS['metrics_dump_path'])
+    if path:
+        interval = float(db_config.get('metrics_dump_interval', METRICS_DEFAULTS['metrics_dump_interval']))
+        query_metrics.start_periodic_dump(path, interval, extra=lambda: {'pool': pool_stats()})
+
+
+# Exercise name -> ExerciseID for the whole process. The catalog comes from the static exercises
+# module and rarely changes, so after one warm-up query plan saves resolve ids from memory.
+_exercise_ids = {}
+_exercise_ids_lock = threading.Lock()
+_exercise_ids_warmed = False
+
+
+class DatabaseManager:
+    # Statements whose syntax differs between storage backends; SQLiteDatabaseManager overrides them
+    ADD_DAILY_TOTALS_QUERY = """
+    INSERT INTO daily_totals (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE total_calories = total_calories + VALUES(total_calories),
+        total_protein = total_protein + VALUES(total_protein),
+        total_fats = total_fats + VALUES(total_fats),
+        total_carbs = total_carbs + VALUES(total_carbs);
+    """
+    REBUILD_DAILY_TOTALS_QUERY = """
+    INSERT INTO daily_totals (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    SELECT user_id, local_date, SUM(kcal), SUM(protein), SUM(fats), SUM(carbs)
+    FROM food_items
+    WHERE local_date >= %s AND local_date <= %s{user_filter}
+    GROUP BY user_id, local_date
+    ON DUPLICATE KEY UPDATE total_calories = VALUES(total_calories), total_protein = VALUES(total_protein),
+        total_fats = VALUES(total_fats), total_carbs = VALUES(total_carbs);
+    """
+    INSERT_EXERCISES_QUERY = "INSERT INTO exercises (Name) VALUES {values} ON DUPLICATE KEY UPDATE Name = Name;"
+    ADD_WEEKLY_STATS_QUERY = """
+    INSERT INTO weekly_stats (user_id, week_start, sessions, sets, reps, volume, days_mask)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE sessions = sessions + VALUES(sessions), sets = sets + VALUES(sets),
+        reps = reps + VALUES(reps), volume = volume + VALUES(volume), days_mask = days_mask | VALUES(days_mask);
+    """
+    # best_e1rm_at is assigned before best_e1rm because MySQL applies the assignments left to right
+    ADD_EXERCISE_STATS_QUERY = """
+    INSERT INTO exercise_stats (user_id, exercise_id, sessions, sets, volume, best_weight, best_e1rm, best_e1rm_at, last_performed)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE sessions = sessions + VALUES(sessions), sets = sets + VALUES(sets),
+        volume = volume + VALUES(volume), best_weight = GREATEST(best_weight, VALUES(best_weight)),
+        best_e1rm_at = CASE WHEN VALUES(best_e1rm) > best_e1rm THEN VALUES(best_e1rm_at) ELSE best_e1rm_at END,
+        best_e1rm = GREATEST(best_e1rm, VALUES(best_e1rm)),
+        last_performed = GREATEST(last_performed, VALUES(last_performed));
+    """
+    EXPLAIN_PREFIX = "EXPLAIN "
+    # Deleting from a key table also removes rows from these tables through ON DELETE CASCADE
+    CASCADING_TABLES = {
+        'workout_plans': ('workout_days', 'day_exercises'),
+        'workout_days': ('day_exercises',),
+    }
+
+    UPSERT_WEIGHT_LOGS_QUERY = """
+    INSERT INTO weight_logs (user_id, date, weight, bodyfat) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE weight = VALUES(weight), bodyfat = COALESCE(VALUES(bodyfat), bodyfat);
+    """
+
+    # Set by backends that create their schema themselves instead of through migrations.py
+    manages_own_schema = False
+    # Set by backends that can bulk load a file with LOAD DATA LOCAL INFILE
+    supports_load_data = True
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+        # The open unit of work is tracked per thread so concurrent callers never share a connection
+        self._local = threading.local()
+        query_metrics.configure(slow_query_ms=db_config.get('slow_query_ms', METRICS_DEFAULTS['slow_query_ms']),
+                                explain_slow_queries=db_config.get('explain_slow_queries', METRICS_DEFAULTS['explain_slow_queries']))
+        # Reads that pass cache_ttl are served from memory when "query_cache" is enabled in db_config.json
+        self.query_cache = None
+        if db_config.get('query_cache', CACHE_DEFAULTS['query_cache']):
+            self.query_cache = QueryCache(max_entries=int(db_config.get('query_cache_size', CACHE_DEFAULTS['query_cache_size'])),
+                                          default_ttl=float(db_config.get('query_cache_ttl', CACHE_DEFAULTS['query_cache_ttl'])))
+
+    @property
+    def connection_pool(self):
+        # Every DatabaseManager shares the process-wide pool, so constructing one is cheap
+        return get_shared_pool(self.db_config)
+
+    @property
+    def transaction_connection(self):
+        return getattr(self._local, 'connection', None)
+
+    @transaction_connection.setter
+    def transaction_connection(self, connection):
+        self._local.connection = connection
+
+    @property
+    def database_errors(self):
+        return (mysql.connector.Error, PoolTimeoutError)
+
+    @property
+    def permanent_errors(self):
+        # The subset of database_errors no retry can fix: the server rejected the statement or its data
+        return (mysql.connector.IntegrityError, mysql.connector.DataError, mysql.connector.ProgrammingError)
+
+    def start_transaction(self):
+        self.transaction_connection = self.connection_pool.acquire()
+        self._begin(self.transaction_connection)
+        self._local.after_commit = []
+
+    def _begin(self, connection):
+        connection.start_transaction()
+
+    def commit_transaction(self):
+        if self.transaction_connection:
+            callbacks = self._local.after_commit
+            try:
+                self.transaction_connection.commit()
+            finally:
+                self.connection_pool.release(self.transaction_connection)
+                self.transaction_connection = None
+                self._local.after_commit = []
+            for callback in callbacks:
+                callback()
+
+    def rollback_transaction(self):
+        if self.transaction_connection:
+            try:
+                self.transaction_connection.rollback()
+            finally:
+                self.connection_pool.release(self.transaction_connection)
+                self.transaction_connection = None
+                self._local.after_commit = []
+
+    def after_commit(self, callback):
+        # Run callback once the current unit of work commits (immediately when there is none),
+        # so in-memory state never reflects rows that were rolled back
+        if self.transaction_connection is not None:
+            self._local.after_commit.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def transaction(self):
+        # Unit of work: every execute_query/execute_many issued inside the block runs on the same
+        # connection and is committed or rolled back as a whole. Nested blocks join the outer one.
+        if self.transaction_connection is not None:
+            yield self
+            return
+        self.start_transaction()
+        try:
+            yield self
+        except Exception:
+            self.rollback_transaction()
+            raise
+        self.commit_transaction()
+
+    def execute_query(self, query, params=(), commit=False, fetch=None, cache_ttl=None):
+        # Statements are recorded under the name of the DatabaseManager method that issued them
+        method = sys._getframe(1).f_code.co_name
+        if self.query_cache is None:
+            return self._run(method, query, params, commit, fetch, many=False)
+        if fetch and cache_ttl is not None and self.transaction_connection is None:
+            return self._cached_read(method, query, params, fetch, cache_ttl)
+        result = self._run(method, query, params, commit, fetch, many=False)
+        self._invalidate_written_table(query)
+        return result
+
+    def execute_many(self, query, seq_params, commit=False):
+        # mysql.connector rewrites INSERT ... VALUES executemany calls into one multi-row statement
+        seq_params = list(seq_params)
+        if not seq_params:
+            return 0
+        method = sys._getframe(1).f_code.co_name
+        result = self._run(method, query, seq_params, commit, None, many=True)
+        if self.query_cache is not None:
+            self._invalidate_written_table(query)
+        return result
+
+    def _cached_read(self, method, query, params, fetch, cache_ttl):
+        key = (query, tuple(params), fetch)
+        hit, result = self.query_cache.get(key)
+        if not hit:
+            version = self.query_cache.version
+            result = self._run(method, query, params, False, fetch, many=False)
+            self.query_cache.put(key, result, read_tables(query), ttl=cache_ttl, version=version)
+        # Hand out a fresh list so callers can't modify the cached rows
+        return list(result) if fetch == 'all' and result is not None else result
+
+    def _invalidate_written_table(self, query):
+        table = write_table(query)
+        if table is None:
+            return
+        tags = (table,) + self.CASCADING_TABLES.get(table, ())
+        self.query_cache.invalidate(tags)
+        # Reads on other threads can still see the old rows until the unit of work commits
+        if self.transaction_connection is not None:
+            self.after_commit(partial(self.query_cache.invalidate, tags))
+
+    def _run(self, method, query, params, commit, fetch, many):
+        connection = self.transaction_connection
+        if connection is not None:
+            # Inside a unit of work the commit happens in commit_transaction
+            return self._timed_execute(method, 0.0, connection, query, params, False, fetch, many)
+        start = time.perf_counter()
+        connection = self.connection_pool.acquire()
+        waited = time.perf_counter() - start
+        try:
+            return self._timed_execute(method, waited, connection, query, params, commit, fetch, many)
+        finally:
+            self.connection_pool.release(connection)
+
+    def _timed_execute(self, method, waited, connection, query, params, commit, fetch, many):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = self._execute(connection, query, params, commit, fetch, many)
+            failed = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            query_metrics.record(method, waited, elapsed, failed=failed)
+            if not failed and query_metrics.is_slow(elapsed):
+                explain = self._explain(connection, query, params) if not many else None
+                query_metrics.log_slow_query(method, query, params if not many else f"{len(params)} rows", elapsed, explain)
+
+    def _explain(self, connection, query, params):
+        # Only reads are explained; running EXPLAIN on a write would be misleading on older servers
+        if not query_metrics.explain_slow_queries or not query.lstrip().lower().startswith('select'):
+            return None
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(self._prepare(self.EXPLAIN_PREFIX + query.lstrip()), params)
+                return [list(map(str, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except self.database_errors as e:
+            logging.error(f'Error explaining slow query: {e}')
+            return None
+
+    def _execute(self, connection, query, params, commit, fetch, many):
+        result = None
+        cursor_created = False
+        try:
+            cursor = connection.cursor()
+            cursor_created = True
+            query = self._prepare(query)
+            if many:
+                cursor.executemany(query, params)
+                result = cursor.rowcount
+            else:
+                cursor.execute(query, params)
+            if commit:
+                connection.commit()
+            if fetch == 'one':
+                result = cursor.fetchone()
+            elif fetch == 'all':
+                result = cursor.fetchall()
+            if not many and query.lower().startswith('insert'):
+                result = cursor.lastrowid
+        except self.database_errors as e:
+            logging.error(f'Database error: {e}')
+            if self.transaction_connection is None and connection.in_transaction:
+                connection.rollback()
+            raise
+        finally:
+            if cursor_created:
+                self._drain_cursor(cursor)
+                cursor.close()
+        return result
+
+    def _prepare(self, query):
+        # Hook for backends with a different parameter style; mysql.connector takes %s as is
+        return query
+
+    @staticmethod
+    def _drain_cursor(cursor):
+        try:
+            while cursor.nextset():
+                pass
+        except mysql.connector.Error as e:
+            logging.error(f'Error draining cursor: {e}')
+
+    def stream_query(self, query, params=(), chunk_size=1000):
+        # Yield the rows of a large read in lists of up to chunk_size rows. The rows come from an unbuffered
+        # (server-side) cursor, so only one chunk is held in memory however many rows the query returns.
+        # The pooled connection stays checked out until the generator is exhausted or closed.
+        method = sys._getframe(1).f_code.co_name
+        start = time.perf_counter()
+        connection = self.connection_pool.acquire()
+        waited = time.perf_counter() - start
+        cursor = None
+        failed = True
+        try:
+            cursor = self._stream_cursor(connection)
+            cursor.execute(self._prepare(query), params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+            failed = False
+        except self.database_errors as e:
+            logging.error(f'Database error: {e}')
+            raise
+        finally:
+            if cursor is not None:
+                self._close_stream(connection, cursor)
+            self.connection_pool.release(connection)
+            query_metrics.record(method, waited, time.perf_counter() - start - waited, failed=failed)
+
+    def _stream_cursor(self, connection):
+        return connection.cursor(buffered=False)
+
+    def _close_stream(self, connection, cursor):
+        # An unbuffered result that was abandoned half way must be read to the end before the connection is reused
+        try:
+            if connection.unread_result:
+                connection.consume_results()
+            cursor.close()
+        except mysql.connector.Error as e:
+            logging.error(f'Error closing streaming cursor: {e}')
+            
+    # nutrition database methods -----------------------------------------------------------------------------------------
+    def update_user_profile(self, user):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        query = """UPDATE userdata SET gender = %s, age = %s, height = %s, weight = %s,
+        experience_level = %s, bodyfat = %s, activity_level = %s, goal = %s, calories = %s, equipment = %s,
+        training_style = %s, training_frequency = %s, prioritized_muscle_groups = %s, timestamp= %s WHERE id = %s;"""
+        params = (user.gender, user.age, user.height, user.weight, user.experience_level,
+                    user.bodyfat, user.activity_level, user.goal, user.calories, user.equipment, user.training_style,
+                    user.training_frequency, user.prioritized_muscle_groups, timestamp, user.user_id)
+        self.execute_query(query, params=params, commit=True)
+
+    # Columns of userdata that update_user_fields may write
+    USER_PROFILE_COLUMNS = ('email', 'gender', 'age', 'height', 'weight', 'experience_level', 'bodyfat', 'activity_level',
+                            'goal', 'calories', 'equipment', 'training_style', 'training_frequency', 'prioritized_muscle_groups')
+
+    def update_user_fields(self, user_id, changes):
+        # Single UPDATE of only the changed profile columns, e.g. {'calories': 2500}
+        unknown = set(changes) - set(self.USER_PROFILE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown user fields: {', '.join(sorted(unknown))}")
+        if not changes:
+            return
+        columns = [column for column in self.USER_PROFILE_COLUMNS if column in changes]
+        assignments = ', '.join(f"{column} = %s" for column in columns)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        query = f"UPDATE userdata SET {assignments}, timestamp = %s WHERE id = %s;"
+        params = tuple(changes[column] for column in columns) + (timestamp, user_id)
+        self.execute_query(query, params=params, commit=True)
+
+    def insert_user(self, username, email, password, user_id):
+        if isinstance(password, str):
+            password = password.encode('utf-8')
+        hashed_password = bcrypt.hashpw(password, bcrypt.gensalt()).decode('utf-8')
+        query = "UPDATE userdata SET username = %s, email = %s, password = %s WHERE id = %s;"
+        self.execute_query(query, params=(username, email, hashed_password, user_id), commit=True)
+
+    def insert_user_id(self, user_id):
+        query = "INSERT INTO userdata (id) VALUES (%s)"
+        self.execute_query(query, params=(user_id,), commit=True)
+        
+    def get_user(self, user_id):
+        query = "SELECT * FROM userdata WHERE id = %s;"
+        return self.execute_query(query, params=(user_id,), fetch='one', cache_ttl=300)
+
+    def get_user_by_username(self, username):
+        query = "SELECT id, username, password FROM userdata WHERE username = %s;"
+        return self.execute_query(query, params=(username,), fetch='one')
+
+    def update_exercise_plan(self, user_id, plan_data):
+        query = "SELECT plan_id FROM exercise_plans WHERE user_id = %s;"
+        existing_plan = self.execute_query(query, params=(user_id,), fetch='one')
+        
+        if existing_plan:
+            update_parts = [f"{day} = %s" for day in plan_data.keys()]
+            update_query = f"UPDATE exercise_plans SET {', '.join(update_parts)} WHERE user_id = %s;"
+            params = tuple(plan_data.values()) + (user_id,)
+        else:
+            columns = ', '.join(plan_data.keys())
+            placeholders = ', '.join(['%s'] * len(plan_data))
+            insert_query = f"INSERT INTO exercise_plans (user_id, {columns}) VALUES (%s, {placeholders});"
+            params = (user_id,) + tuple(plan_data.values())
+
+        return self.execute_query(update_query if existing_plan else insert_query, params=params, commit=True)
+    
+    def insert_chat(self, user_id, message, sender, timestamp=None):
+        # timestamp is passed when the message is replayed from the outbox after it was sent
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        query = "INSERT INTO chats (user_id, message, timestamp, sender) VALUES (%s, %s, %s, %s);"
+        self.execute_query(query, params=(user_id, message, timestamp, sender), commit=True)
+
+
+    def get_chats_by_user_id(self, user_id):
+        query = "SELECT * FROM chats WHERE user_id = %s ORDER BY timestamp DESC;"
+        return self.execute_query(query, params=(user_id,), fetch='all')
+
+    def get_chats_page(self, user_id, before_timestamp=None, before_chat_id=None, limit=50):
+        # Keyset pagination over idx_chats_user_time: returns up to `limit` messages older than the
+        # (before_timestamp, before_chat_id) cursor, newest first. Pass the last row's timestamp and chat_id
+        # to get the next older page; chat_id breaks ties between messages saved in the same second.
+        if before_timestamp is None:
+            query = """
+            SELECT chat_id, user_id, message, timestamp, sender FROM chats
+            WHERE user_id = %s
+            ORDER BY timestamp DESC, chat_id DESC
+            LIMIT %s;
+            """
+            params = (user_id, limit)
+        else:
+            query = """
+            SELECT chat_id, user_id, message, timestamp, sender FROM chats
+            WHERE user_id = %s AND (timestamp < %s OR (timestamp = %s AND chat_id < %s))
+            ORDER BY timestamp DESC, chat_id DESC
+            LIMIT %s;
+            """
+            params = (user_id, before_timestamp, before_timestamp, before_chat_id, limit)
+        return self.execute_query(query, params=params, fetch='all')
+
+    def delete_chat(self, chat_id):
+        query = "DELETE FROM chats WHERE chat_id = %s;"
+        self.execute_query(query, params=(chat_id,), commit=True)
+   
+    def insert_logged_foods(self, user_id, label, kcal, protein, carbs, fats, fiber, portion_size, selected_weight, unit_sequence, date):
+        item = {'label': label, 'calories': kcal, 'protein': protein, 'carbs': carbs, 'fats': fats, 'fiber': fiber,
+                'portion_size': portion_size, 'selected_weight': selected_weight, 'unit': unit_sequence}
+        self.log_foods(user_id, [item])
+
+    def log_foods(self, user_id, items, logged_at=None):
+        # Insert every logged food in one multi-row statement, then fold the macro deltas into the
+        # day's (user_id, date) daily_totals row with a single upsert in the same transaction.
+        # logged_at ("%Y-%m-%d %H:%M:%S") keeps the original day when the write is replayed later.
+        if not items:
+            return
+        now = datetime.strptime(logged_at, "%Y-%m-%d %H:%M:%S") if logged_at else datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        rows = []
+        totals = {'calories': 0, 'protein': 0, 'fats': 0, 'carbs': 0}
+        for item in items:
+            # Round the same way the food_items columns do, so the deltas match a full re-aggregation
+            kcal = round(float(item['calories']))
+            protein = round(float(item['protein']), 2)
+            carbs = round(float(item['carbs']), 2)
+            fats = round(float(item['fats']), 2)
+            rows.append((user_id, item['label'], kcal, protein, carbs, fats, item['fiber'], item['portion_size'],
+                         item.get('selected_weight', 1), item['unit'], timestamp))
+            totals['calories'] += kcal
+            totals['protein'] += protein
+            totals['fats'] += fats
+            totals['carbs'] += carbs
+
+        food_query = """
+        INSERT INTO food_items (user_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """
+        with self.transaction():
+            self.execute_many(food_query, rows)
+            self.execute_query(self.ADD_DAILY_TOTALS_QUERY, params=(user_id, now.date(), totals['calories'], totals['protein'],
+                                                     totals['fats'], totals['carbs']))
+
+    def rebuild_daily_totals(self, start_date, end_date, user_id=None):
+        # Repair job: recompute daily_totals from food_items for every day in [start_date, end_date].
+        # Days whose food rows were all deleted drop to zero; daily_target is left untouched.
+        user_filter = " AND user_id = %s" if user_id else ""
+        user_params = (user_id,) if user_id else ()
+        reset_query = f"""
+        UPDATE daily_totals SET total_calories = 0, total_protein = 0, total_fats = 0, total_carbs = 0
+        WHERE date >= %s AND date <= %s{user_filter};
+        """
+        rebuild_query = self.REBUILD_DAILY_TOTALS_QUERY.format(user_filter=user_filter)
+        with self.transaction():
+            self.execute_query(reset_query, params=(start_date, end_date) + user_params)
+            self.execute_query(rebuild_query, params=(start_date, end_date) + user_params)
+
+    def import_food_items(self, rows):
+        # Bulk import: rows are complete food_items tuples (user_id, label, kcal, protein, carbs, fats, fiber,
+        # portion_size, weight, unit, timestamp). mysql.connector sends an INSERT executemany as one multi-row
+        # statement. daily_totals is not touched; the importer rebuilds the affected days once at the end.
+        query = """
+        INSERT INTO food_items (user_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+        """
+        with self.transaction():
+            return self.execute_many(query, rows)
+
+    def load_food_items_file(self, path):
+        # Same as import_food_items for a CSV file of those tuples, loaded by the server in one statement
+        query = """
+        LOAD DATA LOCAL INFILE %s INTO TABLE food_items
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+        LINES TERMINATED BY '\\n'
+        (user_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp);
+        """
+        self.execute_query(query, params=(path,), commit=True)
+        if self.query_cache is not None:
+            self.query_cache.invalidate(('food_items',))
+
+    def import_weight_logs(self, rows):
+        # rows are (user_id, date, weight, bodyfat); a day imported twice keeps the last weight
+        with self.transaction():
+            return self.execute_many(self.UPSERT_WEIGHT_LOGS_QUERY, rows)
+
+    def get_weight_logs(self, user_id, start_date, end_date):
+        query = """
+        SELECT date, weight, bodyfat FROM weight_logs
+        WHERE user_id = %s AND date >= %s AND date <= %s
+        ORDER BY date;
+        """
+        return self.execute_query(query, params=(user_id, start_date, end_date), fetch='all')
+
+    def get_food_items(self, user_id, date):
+        query = """
+        SELECT user_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp
+        FROM food_items
+        WHERE user_id = %s AND local_date = %s;
+        """
+        return self.execute_query(query, params=(user_id, date), fetch='all', cache_ttl=60)
+        
+        
+    def get_daily_values(self, user_id, date):
+        query = """
+        SELECT daily_target, total_calories, total_protein, total_fats, total_carbs FROM daily_totals
+        WHERE user_id = %s AND date = %s;
+        """
+        return self.execute_query(query, params=(user_id, date), fetch='all', cache_ttl=60)
+    
+    def apply_outbox_write(self, idempotency_key, method_name, args):
+        # Apply one journaled write unless its key is already recorded; the key is stored in the same
+        # transaction as the write itself, so a replay after a crash is a no-op
+        with self.transaction():
+            if self.execute_query("SELECT 1 FROM applied_writes WHERE idempotency_key = %s;", params=(idempotency_key,), fetch='one'):
+                return False
+            getattr(self, method_name)(*args)
+            self.execute_query("INSERT INTO applied_writes (idempotency_key, applied_at) VALUES (%s, %s);",
+                               params=(idempotency_key, datetime.now().strftime("%Y-%m-%d %H:%M:%S")), commit=True)
+        return True
+
+    def apply_outbox_writes(self, writes):
+        # Same as apply_outbox_write for several (idempotency_key, method_name, args) writes in one transaction:
+        # one lookup of the recorded keys, the writes whose keys are new, and one insert of those keys.
+        # Returns the keys that were applied; a failure rolls back every write of the batch.
+        keys = [key for key, method_name, args in writes]
+        in_list = ', '.join(['%s'] * len(keys))
+        with self.transaction():
+            recorded = self.execute_query(f"SELECT idempotency_key FROM applied_writes WHERE idempotency_key IN ({in_list});",
+                                          params=tuple(keys), fetch='all') or []
+            recorded = {row[0] for row in recorded}
+            applied = []
+            for key, method_name, args in writes:
+                if key not in recorded:
+                    getattr(self, method_name)(*args)
+                    applied.append(key)
+            applied_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.execute_many("INSERT INTO applied_writes (idempotency_key, applied_at) VALUES (%s, %s);",
+                              [(key, applied_at) for key in applied], commit=True)
+        return applied
+
+    def prune_applied_writes(self, older_than):
+        # Forget idempotency keys applied before older_than (a datetime); the outbox gives up on entries
+        # long before that, so no replay can need them any more
+        query = "DELETE FROM applied_writes WHERE applied_at < %s;"
+        self.execute_query(query, params=(older_than.strftime("%Y-%m-%d %H:%M:%S"),), commit=True)
+
+    # workout database methods -----------------------------------------------------------------------------------------
+    
+    def create_workout_plan(self, user_id, plan_name):
+        query = "INSERT INTO workout_plans (user_id, plan_name) VALUES (%s, %s);"
+        return self.execute_query(query, params=(user_id, plan_name), commit=True)
+
+    def add_workout_day(self, plan_id, day_number):
+        query = "INSERT INTO workout_days (plan_id, day_number) VALUES (%s, %s);"
+        return self.execute_query(query, params=(plan_id, day_number), commit=True)
+
+    def add_exercise_to_day(self, day_id, exerciseid, sets, reps):
+        query = "INSERT INTO day_exercises (day_id, exerciseid, sets, reps) VALUES (%s, %s, %s, %s);"
+        return self.execute_query(query, params=(day_id, exerciseid, sets, reps), commit=True)
+
+    def get_or_create_exercise(self, exercise_name):
+        return self.resolve_exercise_ids([exercise_name])[exercise_name]
+
+    def warm_exercise_cache(self):
+        # Load the whole exercise catalog into the process-wide name -> ExerciseID map with one query
+        global _exercise_ids_warmed
+        rows = self.execute_query("SELECT ExerciseID, Name FROM exercises;", fetch='all') or []
+        with _exercise_ids_lock:
+            _exercise_ids.update({name: exercise_id for exercise_id, name in rows})
+            _exercise_ids_warmed = True
+
+    def resolve_exercise_ids(self, exercise_names):
+        # Return {name: ExerciseID}. Names missing from the cache are created with one multi-row
+        # upsert (the unique index on Name absorbs races) and read back with one re-select.
+        names = list(dict.fromkeys(exercise_names))
+        if not _exercise_ids_warmed:
+            self.warm_exercise_cache()
+        with _exercise_ids_lock:
+            resolved = {name: _exercise_ids[name] for name in names if name in _exercise_ids}
+        missing = [name for name in names if name not in resolved]
+        if missing:
+            values = ', '.join(['(%s)'] * len(missing))
+            self.execute_query(self.INSERT_EXERCISES_QUERY.format(values=values), params=tuple(missing), commit=True)
+            in_list = ', '.join(['%s'] * len(missing))
+            rows = self.execute_query(f"SELECT ExerciseID, Name FROM exercises WHERE Name IN ({in_list});",
+                                      params=tuple(missing), fetch='all')
+            # Name uses a case-insensitive collation, so match the stored spelling case-insensitively
+            ids_by_name = {name.lower(): exercise_id for exercise_id, name in rows}
+            created = {name: ids_by_name[name.lower()] for name in missing}
+            resolved.update(created)
+
+            def publish():
+                with _exercise_ids_lock:
+                    _exercise_ids.update(created)
+            self.after_commit(publish)
+        return resolved
+
+    def check_and_override_plan(self, user_id, plan_name):
+        self.delete_workout_plan(user_id, plan_name)
+
+    def delete_workout_plan(self, user_id, plan_name):
+        # workout_days and day_exercises reference their parents with ON DELETE CASCADE
+        query = "DELETE FROM workout_plans WHERE user_id = %s AND plan_name = %s;"
+        self.execute_query(query, params=(user_id, plan_name), commit=True)
+
+    def add_workout_days(self, plan_id, day_numbers):
+        # Insert every day of a plan in one statement and return {day_number: day_id}
+        query = "INSERT INTO workout_days (plan_id, day_number) VALUES (%s, %s);"
+        self.execute_many(query, [(plan_id, day_number) for day_number in day_numbers], commit=True)
+        days_query = "SELECT day_id, day_number FROM workout_days WHERE plan_id = %s;"
+        days = self.execute_query(days_query, params=(plan_id,), fetch='all')
+        return {day_number: day_id for day_id, day_number in days}
+
+    def add_exercises_to_days(self, rows):
+        # rows are (day_id, exerciseid, sets, reps) tuples, inserted as a single multi-row statement
+        query = "INSERT INTO day_exercises (day_id, exerciseid, sets, reps) VALUES (%s, %s, %s, %s);"
+        return self.execute_many(query, rows, commit=True)
+
+    def save_complete_workout_plan(self, user_id, plan_name, workout_plan):
+        # Generated plans key their days by string; the stored day_number is an int
+        workout_plan = {int(day_number): exercises for day_number, exercises in workout_plan.items()}
+        with self.transaction():
+            plan_id = self.get_plan_id(user_id, plan_name)
+            if plan_id is None:
+                # Create the new plan
+                plan_id = self.create_workout_plan(user_id, plan_name)
+                stored_days = {}
+            else:
+                stored_days = self.get_plan_rows(plan_id)
+
+            # Resolve every exercise id from the in-memory catalog, creating unknown ones in bulk
+            exercise_ids = self.resolve_exercise_ids(exercise['name'] for exercises in workout_plan.values() for exercise in exercises)
+
+            # Days that are no longer in the plan take their exercises with them through the cascade
+            removed_days = [day_id for day_number, (day_id, rows) in stored_days.items() if day_number not in workout_plan]
+            if removed_days:
+                in_list = ', '.join(['%s'] * len(removed_days))
+                self.execute_query(f"DELETE FROM workout_days WHERE day_id IN ({in_list});", params=tuple(removed_days), commit=True)
+            new_days = [day_number for day_number in workout_plan if day_number not in stored_days]
+            day_ids = {day_number: day_id for day_number, (day_id, rows) in stored_days.items()}
+            if new_days:
+                day_ids.update(self.add_workout_days(plan_id, new_days))
+
+            # Exercises are compared position by position, since their order is the insertion order
+            inserts, updates, deletes = [], [], []
+            for day_number, exercises in workout_plan.items():
+                stored_rows = stored_days[day_number][1] if day_number in stored_days else []
+                for position, exercise in enumerate(exercises):
+                    row = (exercise_ids[exercise['name']], int(exercise['sets']), int(exercise['reps']))
+                    if position >= len(stored_rows):
+                        inserts.append((day_ids[day_number],) + row)
+                    elif stored_rows[position][1:] != row:
+                        updates.append(row + (stored_rows[position][0],))
+                deletes.extend(stored_row[0] for stored_row in stored_rows[len(exercises):])
+
+            if deletes:
+                in_list = ', '.join(['%s'] * len(deletes))
+                self.execute_query(f"DELETE FROM day_exercises WHERE day_exercise_id IN ({in_list});", params=tuple(deletes), commit=True)
+            if updates:
+                query = "UPDATE day_exercises SET exerciseid = %s, sets = %s, reps = %s WHERE day_exercise_id = %s;"
+                self.execute_many(query, updates, commit=True)
+            self.add_exercises_to_days(inserts)
+
+    def get_plan_rows(self, plan_id):
+        # Stored layout of a plan as {day_number: (day_id, [(day_exercise_id, exerciseid, sets, reps)])}
+        query = """
+        SELECT wd.day_id, wd.day_number, de.day_exercise_id, de.exerciseid, de.sets, de.reps
+        FROM workout_days wd
+        LEFT JOIN day_exercises de ON de.day_id = wd.day_id
+        WHERE wd.plan_id = %s
+        ORDER BY wd.day_number, de.day_exercise_id;
+        """
+        days = {}
+        for day_id, day_number, day_exercise_id, exercise_id, sets, reps in self.execute_query(query, params=(plan_id,), fetch='all') or []:
+            rows = days.setdefault(day_number, (day_id, []))[1]
+            if day_exercise_id is not None:
+                rows.append((day_exercise_id, exercise_id, sets, reps))
+        return days
+
+    def retrieve_workout_plan(self, user_id, plan_name):
+        return self.load_workout_plans(user_id, plan_name=plan_name).get(plan_name, {})
+
+    def load_workout_plans(self, user_id, plan_name=None):
+        # Load one plan, or every plan of the user, with a single joined query and assemble
+        # {plan_name: {day_number: [{'name', 'sets', 'reps'}]}} in one pass over the ordered rows
+        plan_filter = " AND wp.plan_name = %s" if plan_name is not None else ""
+        params = (user_id, plan_name) if plan_name is not None else (user_id,)
+        query = f"""
+        SELECT wp.plan_name, wd.day_number, e.name, de.sets, de.reps
+        FROM workout_plans wp
+        LEFT JOIN workout_days wd ON wd.plan_id = wp.plan_id
+        LEFT JOIN day_exercises de ON de.day_id = wd.day_id
+        LEFT JOIN exercises e ON e.exerciseid = de.exerciseid
+        WHERE wp.user_id = %s{plan_filter}
+        ORDER BY wp.plan_id, wd.day_number, de.day_exercise_id;
+        """
+        plans = {}
+        for name, day_number, exercise_name, sets, reps in self.execute_query(query, params=params, fetch='all', cache_ttl=300) or []:
+            days = plans.setdefault(name, {})
+            if day_number is None:
+                continue
+            exercises = days.setdefault(day_number, [])
+            if exercise_name is not None:
+                exercises.append({'name': exercise_name, 'sets': sets, 'reps': reps})
+        return plans
+
+    def get_exercises_for_day(self, day_id):
+        ex_query = """
+        SELECT e.name, de.sets, de.reps
+        FROM day_exercises de
+        JOIN exercises e ON de.exerciseid = e.exerciseid
+        WHERE de.day_id = %s;
+        """
+        exercises = self.execute_query(ex_query, params=(day_id,), fetch='all')
+        return [{'name': name, 'sets': sets, 'reps': reps} for name, sets, reps in exercises]
+
+    def get_plan_id(self, user_id, plan_name):
+        query = "SELECT plan_id FROM workout_plans WHERE user_id = %s AND plan_name = %s;"
+        result = self.execute_query(query, params=(user_id, plan_name), fetch='one')
+        return result[0] if result else None
+         
+    # workout history methods -----------------------------------------------------------------------------------------
+
+    def save_workout_session(self, user_id, sets, performed_at=None):
+        # sets are {'name', 'set_no', 'weight', 'reps'} dicts; the whole session goes in with one multi-row
+        # insert under one session_id, which is how get_last_sessions tells sessions apart
+        if not sets:
+            return None
+        timestamp = performed_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        session_id = str(uuid.uuid4())
+        with self.transaction():
+            exercise_ids = self.resolve_exercise_ids(workout_set['name'] for workout_set in sets)
+            rows = []
+            for workout_set in sets:
+                weight = float(workout_set['weight'])
+                reps = int(workout_set['reps'])
+                # Estimated one rep max with the Epley formula, the same one LogWorkout uses for the 10RM
+                e1rm = round(weight * (1 + 0.0333 * reps), 1)
+                rows.append((session_id, user_id, exercise_ids[workout_set['name']], int(workout_set['set_no']), weight, reps, e1rm, timestamp))
+            query = """
+            INSERT INTO workout_sets (session_id, user_id, exercise_id, set_no, weight, reps, e1rm, timestamp)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+            """
+            self.execute_many(query, rows, commit=True)
+            self.add_training_stats(user_id, [(session_id, exercise_id, weight, reps, e1rm, timestamp)
+                                              for session_id, set_user_id, exercise_id, set_no, weight, reps, e1rm, timestamp in rows])
+        return session_id
+
+    # training statistics methods --------------------------------------------------------------------------------------
+
+    def add_training_stats(self, user_id, rows):
+        # Fold (session_id, exercise_id, weight, reps, e1rm, timestamp) sets into weekly_stats, exercise_stats
+        # and user_streaks. Called inside the transaction that stores the sets, so the stats never drift.
+        weeks, exercises = summarize_sets(rows)
+        self.execute_many(self.ADD_WEEKLY_STATS_QUERY,
+                          [(user_id, week, totals['sessions'], totals['sets'], totals['reps'], round(totals['volume'], 2), totals['days_mask'])
+                           for week, totals in weeks.items()], commit=True)
+        self.execute_many(self.ADD_EXERCISE_STATS_QUERY,
+                          [(user_id, exercise_id, totals['sessions'], totals['sets'], round(totals['volume'], 2), totals['best_weight'],
+                            totals['best_e1rm'], totals['best_e1rm_at'], totals['last_performed'])
+                           for exercise_id, totals in exercises.items()], commit=True)
+        streak = self.get_streak(user_id)
+        for week in sorted(weeks):
+            streak = advance_streak(streak, week)
+        if streak is not None:
+            query = "REPLACE INTO user_streaks (user_id, current_streak, longest_streak, last_week) VALUES (%s, %s, %s, %s);"
+            self.execute_query(query, params=(user_id,) + streak, commit=True)
+
+    def rebuild_training_stats(self, user_id=None):
+        # Recompute the statistics from workout_sets, one user per transaction, e.g. to back-fill history
+        # logged before the statistics existed. Returns the number of users rebuilt.
+        if user_id is not None:
+            user_ids = [user_id]
+        else:
+            user_ids = [row[0] for row in self.execute_query("SELECT DISTINCT user_id FROM workout_sets;", fetch='all') or []]
+        for user_id in user_ids:
+            with self.transaction():
+                for table in ('weekly_stats', 'exercise_stats', 'user_streaks'):
+                    self.execute_query(f"DELETE FROM {table} WHERE user_id = %s;", params=(user_id,), commit=True)
+                query = """
+                SELECT session_id, exercise_id, weight, reps, e1rm, timestamp FROM workout_sets
+                WHERE user_id = %s ORDER BY timestamp;
+                """
+                rows = self.execute_query(query, params=(user_id,), fetch='all')
+                if rows:
+                    self.add_training_stats(user_id, rows)
+        return len(user_ids)
+
+    def get_streak(self, user_id):
+        # (current, longest, last_week) as stored, or None before the first workout
+        query = "SELECT current_streak, longest_streak, last_week FROM user_streaks WHERE user_id = %s;"
+        row = self.execute_query(query, params=(user_id,), fetch='one')
+        if row is None:
+            return None
+        current, longest, last_week = row
+        return current, longest, last_week if isinstance(last_week, date) else date.fromisoformat(str(last_week)[:10])
+
+    def get_training_summary(self, user_id, today=None):
+        # This week's totals and the streak: two primary key lookups, whatever the length of the history
+        today = today or date.today()
+        query = "SELECT sessions, sets, reps, volume FROM weekly_stats WHERE user_id = %s AND week_start = %s;"
+        week = self.execute_query(query, params=(user_id, week_start(today)), fetch='one', cache_ttl=60) or (0, 0, 0, 0)
+        streak = self.get_streak(user_id)
+        return {
+            'sessions_this_week': week[0],
+            'sets_this_week': week[1],
+            'reps_this_week': week[2],
+            'volume_this_week': float(week[3]),
+            'current_streak': current_streak(streak, today),
+            'longest_streak': streak[1] if streak else 0,
+        }
+
+    def get_workout_dates(self, user_id, start_date, end_date):
+        # Days with a workout between two dates, read from the days_mask of the weeks they fall in
+        query = "SELECT week_start, days_mask FROM weekly_stats WHERE user_id = %s AND week_start >= %s AND week_start <= %s;"
+        rows = self.execute_query(query, params=(user_id, week_start(start_date), end_date), fetch='all', cache_ttl=60) or []
+        workout_dates = set()
+        for first_day, days_mask in rows:
+            if not isinstance(first_day, date):
+                first_day = date.fromisoformat(str(first_day)[:10])
+            for weekday in range(7):
+                day = first_day + timedelta(days=weekday)
+                if days_mask & (1 << weekday) and start_date <= day <= end_date:
+                    workout_dates.add(day)
+        return workout_dates
+
+    def get_exercise_stats(self, user_id, exercise_name):
+        exercise_id = self.lookup_exercise_id(exercise_name)
+        if exercise_id is None:
+            return None
+        query = """
+        SELECT sessions, sets, volume, best_weight, best_e1rm, best_e1rm_at, last_performed
+        FROM exercise_stats WHERE user_id = %s AND exercise_id = %s;
+        """
+        row = self.execute_query(query, params=(user_id, exercise_id), fetch='one')
+        if row is None:
+            return None
+        sessions, sets, volume, best_weight, best_e1rm, best_e1rm_at, last_performed = row
+        return {'sessions': sessions, 'sets': sets, 'volume': float(volume), 'best_weight': float(best_weight),
+                'best_e1rm': float(best_e1rm), 'best_e1rm_at': best_e1rm_at, 'last_performed': last_performed}
+
+    def lookup_exercise_id(self, exercise_name):
+        # ExerciseID from the in-memory catalog, or None for an exercise that was never saved
+        if not _exercise_ids_warmed:
+            self.warm_exercise_cache()
+        with _exercise_ids_lock:
+            return _exercise_ids.get(exercise_name)
+
+    def get_last_sessions(self, user_id, exercise_name, count=1):
+        # The last `count` sessions of one exercise, newest first, as
+        # [{'session_id', 'timestamp', 'sets': [{'set_no', 'weight', 'reps', 'e1rm'}]}].
+        # Sessions are told apart by session_id, not by timestamp: two sessions saved in the same second stay
+        # apart and a session whose sets carry different timestamps stays whole. The inner lookup reads the
+        # exercise's range of idx_workout_sets_user_exercise_time; set_id breaks ties between equal timestamps.
+        exercise_id = self.lookup_exercise_id(exercise_name)
+        if exercise_id is None:
+            return []
+        query = """
+        SELECT ws.session_id, recent.last_at, ws.set_no, ws.weight, ws.reps, ws.e1rm
+        FROM workout_sets ws
+        JOIN (
+            SELECT session_id, MAX(timestamp) AS last_at, MAX(set_id) AS last_set_id FROM workout_sets
+            WHERE user_id = %s AND exercise_id = %s
+            GROUP BY session_id
+            ORDER BY last_at DESC, last_set_id DESC LIMIT %s
+        ) recent ON recent.session_id = ws.session_id
+        WHERE ws.user_id = %s AND ws.exercise_id = %s
+        ORDER BY recent.last_at DESC, recent.last_set_id DESC, ws.set_no;
+        """
+        rows = self.execute_query(query, params=(user_id, exercise_id, count, user_id, exercise_id), fetch='all') or []
+        sessions = []
+        for session_id, timestamp, set_no, weight, reps, e1rm in rows:
+            if not sessions or sessions[-1]['session_id'] != session_id:
+                sessions.append({'session_id': session_id, 'timestamp': timestamp, 'sets': []})
+            sessions[-1]['sets'].append({'set_no': set_no, 'weight': float(weight), 'reps': reps, 'e1rm': float(e1rm)})
+        return sessions
+
+    def get_previous_performance(self, user_id, exercise_names):
+        # {exercise name: sets of its last session} for prefilling LogWorkout rows
+        previous = {}
+        for exercise_name in dict.fromkeys(exercise_names):
+            sessions = self.get_last_sessions(user_id, exercise_name, count=1)
+            if sessions:
+                previous[exercise_name] = sessions[0]['sets']
+        return previous
+
+    def get_plan_names(self, user_id):
+        query = "SELECT plan_name FROM workout_plans WHERE user_id = %s;"
+        result = self.execute_query(query, params=(user_id,), fetch='all', cache_ttl=300)
+        return [row[0] for row in result] if result else None
+
+    def warm_user_cache(self, user_id):
+        # Prefetch what the dashboard, food log and workout screens read first after login
+        if self.query_cache is None:
+            return
+        today = datetime.now().strftime("%Y-%m-%d")
+        self.get_user(user_id)
+        self.get_food_items(user_id, today)
+        self.get_daily_values(user_id, today)
+        self.get_plan_names(user_id)
+        self.load_workout_plans(user_id)
+
+
+class AsyncDatabaseManager:
+    """
+    Runs DatabaseManager calls on a bounded pool of worker threads.
+    Every DatabaseManager method can be called on this object and returns a concurrent.futures.Future.
+    Pass on_result/on_error to have the outcome handed to `dispatch`, which the app points at
+    Clock.schedule_once so callbacks run on the main thread and can touch widgets.
+    """
+    def __init__(self, db_manager, max_workers=None, dispatch=None):
+        self.db_manager = db_manager
+        # One worker per pooled connection, so queued calls wait here rather than on the pool
+        if max_workers is None:
+            max_workers = int(db_manager.db_config.get('pool_size', POOL_DEFAULTS['pool_size']))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        self.dispatch = dispatch or (lambda callback: callback())
+
+    def submit(self, method_name, *args, on_result=None, on_error=None, **kwargs):
+        method = getattr(self.db_manager, method_name)
+        future = self.executor.submit(method, *args, **kwargs)
+        if on_result is not None or on_error is not None:
+            future.add_done_callback(partial(self._deliver, method_name, on_result, on_error))
+        return future
+
+    def _deliver(self, method_name, on_result, on_error, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logging.error(f"Error in {method_name}: {error}")
+            if on_error is not None:
+                self.dispatch(partial(on_error, error))
+        elif on_result is not None:
+            self.dispatch(partial(on_result, future.result()))
+
+    def __getattr__(self, name):
+        if not callable(getattr(self.db_manager, name)):
+            raise AttributeError(name)
+        return partial(self.submit, name)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,200 @@
+# Streaming export of a user's history to gzip-compressed JSONL or CSV files, one file per table.
+# Rows are read from a server-side cursor in fetchmany chunks (DatabaseManager.stream_query) and every chunk
+# is written as its own gzip member, so memory stays at one chunk however long the history is. After each
+# chunk the file offset and the key of the last row are saved to a checkpoint, and an interrupted export
+# resumes from there: the file is truncated back to the checkpoint and the query restarts after that key.
+import csv
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+CHECKPOINT_FILE = 'export_checkpoint.json'
+
+# For every exported table: the query (filtered by user, optional date range and resume key), the date column
+# used for ranges, and the unique ordering key used to resume. Each key matches an index so the server streams
+# rows in index order instead of sorting the whole result first.
+EXPORT_TABLES = {
+    'food_items': {
+        'columns': ('food_item_id', 'label', 'kcal', 'protein', 'carbs', 'fats', 'fiber', 'portion_size', 'weight', 'unit',
+                    'timestamp', 'local_date'),
+        'select': "SELECT food_item_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp, local_date "
+                  "FROM food_items WHERE user_id = %s",
+        'date_column': 'local_date',
+        'key': ('local_date', 'food_item_id'),
+    },
+    'daily_totals': {
+        'columns': ('date', 'total_calories', 'total_protein', 'total_fats', 'total_carbs', 'daily_target'),
+        'select': "SELECT date, total_calories, total_protein, total_fats, total_carbs, daily_target "
+                  "FROM daily_totals WHERE user_id = %s",
+        'date_column': 'date',
+        'key': ('date',),
+    },
+    'chats': {
+        'columns': ('chat_id', 'timestamp', 'sender', 'message'),
+        'select': "SELECT chat_id, timestamp, sender, message FROM chats WHERE user_id = %s",
+        'date_column': 'timestamp',
+        'key': ('timestamp', 'chat_id'),
+    },
+    'workout_plans': {
+        'columns': ('plan_id', 'plan_name', 'day_number', 'day_exercise_id', 'exercise', 'sets', 'reps'),
+        'select': "SELECT wp.plan_id, wp.plan_name, wd.day_number, de.day_exercise_id, e.Name, de.sets, de.reps "
+                  "FROM workout_plans wp "
+                  "JOIN workout_days wd ON wd.plan_id = wp.plan_id "
+                  "JOIN day_exercises de ON de.day_id = wd.day_id "
+                  "JOIN exercises e ON e.ExerciseID = de.ExerciseID "
+                  "WHERE wp.user_id = %s",
+        'date_column': None,
+        'key': ('wp.plan_id', 'de.day_exercise_id'),
+    },
+    'workout_sets': {
+        'columns': ('set_id', 'session_id', 'exercise', 'set_no', 'weight', 'reps', 'e1rm', 'timestamp'),
+        'select': "SELECT ws.set_id, ws.session_id, e.Name, ws.set_no, ws.weight, ws.reps, ws.e1rm, ws.timestamp "
+                  "FROM workout_sets ws JOIN exercises e ON e.ExerciseID = ws.exercise_id WHERE ws.user_id = %s",
+        'date_column': 'ws.timestamp',
+        'key': ('ws.set_id',),
+    },
+}
+
+FORMATS = ('jsonl', 'csv')
+
+
+def after_key(key_columns, key_values):
+    # Keyset condition for "rows ordered after key_values", e.g. (a > %s OR (a = %s AND b > %s))
+    clauses = []
+    params = []
+    for i, column in enumerate(key_columns):
+        equal = [f"{previous} = %s" for previous in key_columns[:i]]
+        clauses.append("(" + " AND ".join(equal + [f"{column} > %s"]) + ")")
+        params.extend(key_values[:i] + [key_values[i]])
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def build_query(table, user_id, date_range=None, resume_key=None):
+    spec = EXPORT_TABLES[table]
+    query = spec['select']
+    params = [user_id]
+    if date_range is not None and spec['date_column'] is not None:
+        start, end = date_range
+        if start is not None:
+            query += f" AND {spec['date_column']} >= %s"
+            params.append(start)
+        if end is not None:
+            # Inclusive end day, also for DATETIME columns
+            query += f" AND {spec['date_column']} < %s"
+            params.append(date.fromordinal(end.toordinal() + 1))
+    if resume_key is not None:
+        condition, key_params = after_key(spec['key'], list(resume_key))
+        query += " AND " + condition
+        params.extend(key_params)
+    query += " ORDER BY " + ", ".join(spec['key']) + ";"
+    return query, tuple(params)
+
+
+def plain_value(value):
+    # Values as they should appear in JSON and in checkpoints
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def encode_rows(rows, columns, fmt, header=False):
+    if fmt == 'jsonl':
+        return "".join(json.dumps(dict(zip(columns, map(plain_value, row)))) + "\n" for row in rows).encode('utf-8')
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([plain_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode('utf-8')
+
+
+class Checkpoint:
+    """
+    Progress of one export, kept next to the exported files. Saved with a rename so a crash mid-write
+    leaves the previous checkpoint intact. A checkpoint for another user or format is ignored, and a table
+    checkpointed for another date range is exported again from the start.
+    """
+    def __init__(self, path, user_id, fmt):
+        self.path = path
+        self.state = {'user_id': user_id, 'format': fmt, 'tables': {}}
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as checkpoint_file:
+                state = json.load(checkpoint_file)
+            if state.get('user_id') == self.state['user_id'] and state.get('format') == self.state['format']:
+                self.state = state
+        return self
+
+    def table(self, table, date_range=None):
+        # The table's file and resume key only hold rows of the date range they were exported for
+        date_range = [plain_value(day) for day in date_range] if date_range is not None else None
+        state = self.state['tables'].get(table)
+        if state is None or state.get('date_range') != date_range:
+            state = self.state['tables'][table] = {'date_range': date_range, 'key': None, 'offset': 0, 'rows': 0,
+                                                   'done': False}
+        return state
+
+    def save(self):
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as checkpoint_file:
+            json.dump(self.state, checkpoint_file)
+        os.replace(temporary_path, self.path)
+
+
+def export_table(db_manager, table, user_id, out_dir, fmt, checkpoint, date_range=None, chunk_size=1000, progress=None):
+    spec = EXPORT_TABLES[table]
+    state = checkpoint.table(table, date_range)
+    if state['done']:
+        return state['rows']
+    path = os.path.join(out_dir, f"{table}.{fmt}.gz")
+    key_positions = [spec['columns'].index(column.split('.')[-1]) if column.split('.')[-1] in spec['columns'] else None
+                     for column in spec['key']]
+    query, params = build_query(table, user_id, date_range, state['key'])
+    mode = 'r+b' if state['offset'] and os.path.exists(path) else 'wb'
+    with open(path, mode) as out_file:
+        # Drop anything written after the last checkpoint, it is exported again below
+        out_file.seek(state['offset'])
+        out_file.truncate()
+        for rows in db_manager.stream_query(query, params, chunk_size=chunk_size):
+            out_file.write(gzip.compress(encode_rows(rows, spec['columns'], fmt, header=(fmt == 'csv' and state['offset'] == 0))))
+            out_file.flush()
+            os.fsync(out_file.fileno())
+            last_row = rows[-1]
+            state['key'] = [plain_value(last_row[position]) for position in key_positions]
+            state['offset'] = out_file.tell()
+            state['rows'] += len(rows)
+            checkpoint.save()
+            if progress is not None:
+                progress(table, state['rows'])
+        if state['offset'] == 0:
+            # Nothing to export: write an empty member (a header-only one for CSV) so the file is still valid gzip
+            out_file.write(gzip.compress(encode_rows([], spec['columns'], fmt, header=(fmt == 'csv'))))
+    state['done'] = True
+    checkpoint.save()
+    return state['rows']
+
+
+def export_user_history(db_manager, user_id, out_dir, fmt='jsonl', tables=None, date_ranges=None, chunk_size=1000,
+                        progress=None, restart=False):
+    # Export every table in `tables` (all of EXPORT_TABLES by default) and return {table: rows exported}.
+    # date_ranges maps a table name to a (start, end) pair of dates, either of which may be None.
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt}, expected one of {', '.join(FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT_FILE), user_id, fmt)
+    if not restart:
+        checkpoint.load()
+    date_ranges = date_ranges or {}
+    exported = {}
+    for table in tables or EXPORT_TABLES:
+        exported[table] = export_table(db_manager, table, user_id, out_dir, fmt, checkpoint, date_ranges.get(table),
+                                       chunk_size=chunk_size, progress=progress)
+    return exported
@@ -1,6 +1,5 @@
 # Standard library imports
 import copy
-import json
 import logging
 import math
 import os
@@ -13,10 +12,7 @@ from functools import partial
 
 # Third-party imports
 import bcrypt
-import mysql.connector
-from mysql.connector import pooling
 import numpy as np
-import requests
 from scipy.interpolate import UnivariateSpline
 from dotenv import load_dotenv
 
@@ -66,8 +62,15 @@ from kivymd.uix.screen import MDScreen
 
 # Local imports
 import characters_width_dict
+from database import OUTBOX_DEFAULTS, AsyncDatabaseManager, create_database_manager, load_db_config, start_metrics_dump
 from exercises import exercises
 from exercise_guide import exercise_technique
+from food_catalog import get_food_catalog
+from nutrition_client import NutritionAPIError
+from outbox import Outbox
+from search_cache import get_food_search_cache
+from search_worker import SearchWorker
+from user_profile import User
 
 # Load environment variables
 load_dotenv()
@@ -84,7 +87,6 @@ class UserManager:
     def create_user(cls):
         if cls._instance is None:
             user_id = str(uuid.uuid4())
-            db_manager = DatabaseManager(db_config)
             db_manager.insert_user_id(user_id)
             cls._instance = User(user_id=user_id)
         return cls._instance
@@ -92,363 +94,24 @@ class UserManager:
     @classmethod
     def get_user(cls, user_id):
         if cls._instance is None or cls._instance.user_id != user_id:
-            db_manager = DatabaseManager(db_config)
             user_data = db_manager.get_user(user_id=user_id)
             if user_data:
                 cls._instance.load_from_db(user_data)
             else:
                 raise ValueError(f"No user found with id {user_id}")
         return cls._instance
-class User:
-    def __init__(self, user_id, email=None, gender=None, age=None, height=None, weight=None, experience_level=None, bodyfat=None, activity_level=None, goal=None, calories=None, equipment=None, training_style=None, training_frequency=None, prioritized_muscle_groups=None):
-        self.user_id = user_id
-        self.preferences = {}
-        self.email = email
-        self.gender = gender
-        self.age = age
-        self.height = height
-        self.weight = weight
-        self.experience_level = experience_level
-        self.bodyfat = bodyfat
-        self.activity_level = activity_level
-        self.goal = goal
-        self.calories = calories
-        self.equipment = equipment
-        self.training_style = training_style
-        self.training_frequency = training_frequency
-        self.prioritized_muscle_groups = prioritized_muscle_groups
-
-    def load_from_db(self, user_data):
-        if user_data is not None:
-            self.email = user_data[2]
-            self.gender = user_data[4]
-            self.age = user_data[5]
-            self.height = float(user_data[6])
-            self.weight = float(user_data[7])
-            self.experience_level = user_data[8]
-            self.bodyfat = float(user_data[9])
-            self.activity_level = user_data[10]
-            self.goal = user_data[11]
-            self.calories = user_data[12]
-            self.equipment = user_data[13]
-            self.training_style = user_data[14]
-            self.training_frequency = user_data[15]
-            self.prioritized_muscle_groups = user_data[17]
-        else:
-            print("No data found")
-
-    def update_email(self, email):
-        self.email = email
-        self.save()
-
-    def update_gender(self, gender):
-        self.gender = gender
-
-    def update_age(self, age):
-        self.age = age
-
-    def update_height(self, height):
-        self.height = height
-
-    def update_weight(self, weight):
-        self.weight = weight
-
-    def update_experience_level(self, experience_level):
-        self.experience_level = experience_level
-
-    def update_bodyfat(self, bodyfat):
-        self.bodyfat = bodyfat
-
-    def update_activity_level(self, activity_level):
-        self.activity_level = activity_level
-
-    def update_goal(self, goal):
-        self.goal = goal
-
-    def update_calories(self, calories):
-        self.calories = calories
-
-    def update_equipment(self, equipment):
-        self.equipment = equipment
-
-    def update_training_style(self, training_style):
-        self.training_style = training_style
-
-    def update_training_frequency(self, training_frequency):
-        self.training_frequency = training_frequency
-
-    def update_prioritized_muscle_groups(self, prioritized_muscle_groups):
-        self.prioritized_muscle_groups = prioritized_muscle_groups
-        self.save()
-
-    def save(self):
-        try:
-            db_manager = DatabaseManager(db_config)
-            db_manager.update_user_profile(self)
-        except Exception as e:
-            logging.error("Error saving user: {}".format(e))
-            raise
-class DatabaseManager:
-    def __init__(self, db_config):
-        self.db_config = db_config
-        self.connection_pool = pooling.MySQLConnectionPool(pool_name="mypool",
-                                                           pool_size=2,
-                                                           **self.db_config)
-
-    def start_transaction(self):
-        self.transaction_connection = self.connection_pool.get_connection()
-        self.transaction_connection.start_transaction()
-
-    def commit_transaction(self):
-        if self.transaction_connection:
-            self.transaction_connection.commit()
-            self.transaction_connection.close()
-            self.transaction_connection = None
-
-    def rollback_transaction(self):
-        if self.transaction_connection:
-            self.transaction_connection.rollback()
-            self.transaction_connection.close()
-            self.transaction_connection = None
-
-    def execute_query(self, query, params=(), commit=False, fetch=None):
-        connection = self.connection_pool.get_connection()
-        result = None
-        cursor_created = False
-        try:
-            cursor = connection.cursor()
-            cursor_created = True
-            cursor.execute(query, params)
-            if commit:
-                connection.commit()
-            if fetch == 'one':
-                result = cursor.fetchone()
-            elif fetch == 'all':
-                result = cursor.fetchall()
-            if query.lower().startswith('insert'):
-                result = cursor.lastrowid
-        except mysql.connector.Error as e:
-            logging.error(f'Database error: {e}')
-            if connection.in_transaction:
-                connection.rollback()
-            raise
-        finally:
-            if cursor_created:
-                self._drain_cursor(cursor)
-                cursor.close()
-            connection.close()
-        return result
-
-    @staticmethod
-    def _drain_cursor(cursor):
-        try:
-            while cursor.nextset():
-                pass
-        except mysql.connector.Error as e:
-            logging.error(f'Error draining cursor: {e}')
-            
-    # nutrition database methods -----------------------------------------------------------------------------------------
-    def update_user_profile(self, user):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        query = """UPDATE userdata SET gender = %s, age = %s, height = %s, weight = %s,
-        experience_level = %s, bodyfat = %s, activity_level = %s, goal = %s, calories = %s, equipment = %s,
-        training_style = %s, training_frequency = %s, prioritized_muscle_groups = %s, timestamp= %s WHERE id = %s;"""
-        params = (user.gender, user.age, user.height, user.weight, user.experience_level,
-                    user.bodyfat, user.activity_level, user.goal, user.calories, user.equipment, user.training_style,
-                    user.training_frequency, user.prioritized_muscle_groups, timestamp, user.user_id)
-        self.execute_query(query, params=params, commit=True)
-
-    def insert_user(self, username, email, password, user_id):
-        if isinstance(password, str):
-            password = password.encode('utf-8')
-        hashed_password = bcrypt.hashpw(password, bcrypt.gensalt())
-        query = "UPDATE userdata SET username = %s, email = %s, password = %s WHERE id = %s;"
-        self.execute_query(query, params=(username, email, hashed_password, user_id), commit=True)
-
-    def insert_user_id(self, user_id):
-        query = "INSERT INTO userdata (id) VALUES (%s)"
-        self.execute_query(query, params=(user_id,), commit=True)
-        
-    def get_user(self, user_id):
-        query = "SELECT * FROM userdata WHERE id = %s;"
-        return self.execute_query(query, params=(user_id,), fetch='one')
-
-    def get_user_by_username(self, username):
-        query = "SELECT id, username, password FROM userdata WHERE username = %s;"
-        return self.execute_query(query, params=(username,), fetch='one')
-
-    def update_exercise_plan(self, user_id, plan_data):
-        query = "SELECT plan_id FROM exercise_plans WHERE user_id = %s;"
-        existing_plan = self.execute_query(query, params=(user_id,), fetch='one')
-        
-        if existing_plan:
-            update_parts = [f"{day} = %s" for day in plan_data.keys()]
-            update_query = f"UPDATE exercise_plans SET {', '.join(update_parts)} WHERE user_id = %s;"
-            params = tuple(plan_data.values()) + (user_id,)
-        else:
-            columns = ', '.join(plan_data.keys())
-            placeholders = ', '.join(['%s'] * len(plan_data))
-            insert_query = f"INSERT INTO exercise_plans (user_id, {columns}) VALUES (%s, {placeholders});"
-            params = (user_id,) + tuple(plan_data.values())
-
-        return self.execute_query(update_query if existing_plan else insert_query, params=params, commit=True)
-    
-    def insert_chat(self, user_id, message, sender):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        query = "INSERT INTO chats (user_id, message, timestamp, sender) VALUES (%s, %s, %s, %s);"
-        self.execute_query(query, params=(user_id, message, timestamp, sender), commit=True)
-
-
-    def get_chats_by_user_id(self, user_id):
-        query = "SELECT * FROM chats WHERE user_id = %s ORDER BY timestamp DESC;"
-        return self.execute_query(query, params=(user_id,), fetch='all')
-
-    def delete_chat(self, chat_id):
-        query = "DELETE FROM chats WHERE chat_id = %s;"
-        self.execute_query(query, params=(chat_id,), commit=True)
-   
-    def insert_logged_foods(self, user_id, label, kcal, protein, carbs, fats, fiber, portion_size, selected_weight, unit_sequence, date):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        query1 = """
-        INSERT INTO food_items (user_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """
-        self.execute_query(query1, params=(user_id, label, kcal, protein, carbs, fats, fiber, portion_size, selected_weight, unit_sequence, timestamp), commit=True)
-
-        query2 = """
-        REPLACE INTO daily_totals (user_id, total_calories, total_protein, total_fats, total_carbs, date)
-        SELECT user_id, SUM(kcal), SUM(protein), SUM(fats), SUM(carbs), DATE(timestamp)
-        FROM food_items
-        WHERE user_id = %s AND DATE(timestamp) = %s
-        GROUP BY user_id, DATE(timestamp);
-        """
-        self.execute_query(query2, params=(user_id, date), commit=True)
-        
-        
-    def get_food_items(self, user_id, date):
-        query = """
-        SELECT user_id, label, kcal, protein, carbs, fats, fiber, portion_size, weight, unit, timestamp
-        FROM food_items
-        WHERE user_id = %s AND DATE(timestamp) = %s;
-        """
-        return self.execute_query(query, params=(user_id, date), fetch='all')
-        
-        
-    def get_daily_values(self, user_id, date):
-        query = """
-        SELECT daily_target, total_calories, total_protein, total_fats, total_carbs FROM daily_totals
-        WHERE user_id = %s AND DATE(date) = %s;
-        """
-        print(query)
-        print(user_id)
-        print(date)
-        return self.execute_query(query, params=(user_id, date), fetch='all')
-    
-    # workout database methods -----------------------------------------------------------------------------------------
-    
-    def create_workout_plan(self, user_id, plan_name):
-        query = "INSERT INTO workout_plans (user_id, plan_name) VALUES (%s, %s);"
-        return self.execute_query(query, params=(user_id, plan_name), commit=True)
-
-    def add_workout_day(self, plan_id, day_number):
-        query = "INSERT INTO workout_days (plan_id, day_number) VALUES (%s, %s);"
-        return self.execute_query(query, params=(plan_id, day_number), commit=True)
-
-    def add_exercise_to_day(self, day_id, exerciseid, sets, reps):
-        query = "INSERT INTO day_exercises (day_id, exerciseid, sets, reps) VALUES (%s, %s, %s, %s);"
-        return self.execute_query(query, params=(day_id, exerciseid, sets, reps), commit=True)
-
-    def get_or_create_exercise(self, exercise_name):
-        query = "SELECT exerciseid FROM exercises WHERE name = %s;"
-        result = self.execute_query(query, params=(exercise_name,), fetch='one')
-        
-        if result:
-            return result[0]
-        else:
-            insert_query = "INSERT INTO exercises (name) VALUES (%s);"
-            return self.execute_query(insert_query, params=(exercise_name,), commit=True)
-        
-    def check_and_override_plan(self, user_id, plan_name):
-        # Check if the plan already exists
-        plan_id_query = "SELECT plan_id FROM workout_plans WHERE user_id = %s AND plan_name = %s;"
-        plan_id = self.execute_query(plan_id_query, params=(user_id, plan_name), fetch='one')
-
-        if plan_id:
-            # If the plan exists, delete it and its associated days and exercises
-            delete_exercises_query = """
-            DELETE de FROM day_exercises de
-            JOIN workout_days wd ON de.day_id = wd.day_id
-            WHERE wd.plan_id = %s;
-            """
-            self.execute_query(delete_exercises_query, params=(plan_id[0],), commit=True)
-
-            delete_days_query = "DELETE FROM workout_days WHERE plan_id = %s;"
-            self.execute_query(delete_days_query, params=(plan_id[0],), commit=True)
-
-            delete_plan_query = "DELETE FROM workout_plans WHERE plan_id = %s;"
-            self.execute_query(delete_plan_query, params=(plan_id[0],), commit=True)
-            
-    def save_complete_workout_plan(self, user_id, plan_name, workout_plan):
-        self.start_transaction()
-        try:
-            # Check if the plan already exists and override it if necessary
-            self.check_and_override_plan(user_id, plan_name)
-
-            # Create the new plan
-            plan_id = self.create_workout_plan(user_id, plan_name)
-
-            for day_number, exercises in workout_plan.items():
-                day_id = self.add_workout_day(plan_id, day_number)
-
-                for exercise in exercises:
-                    exerciseid = self.get_or_create_exercise(exercise['name'])
-                    self.add_exercise_to_day(day_id, exerciseid, exercise['sets'], exercise['reps'])
-
-            self.commit_transaction()
-        except Exception as e:
-            self.rollback_transaction()
-            raise e
-
-    def retrieve_workout_plan(self, user_id, plan_name):
-        workout_plan = {}
-        plan_id = self.get_plan_id(user_id, plan_name)
-
-        if plan_id:
-            days_query = "SELECT day_id, day_number FROM workout_days WHERE plan_id = %s ORDER BY day_number;"
-            days = self.execute_query(days_query, params=(plan_id,), fetch='all')
-
-            for day_id, day_number in days:
-                workout_plan[day_number] = self.get_exercises_for_day(day_id)
-
-        return workout_plan
-
-    def get_exercises_for_day(self, day_id):
-        ex_query = """
-        SELECT e.name, de.sets, de.reps
-        FROM day_exercises de
-        JOIN exercises e ON de.exerciseid = e.exerciseid
-        WHERE de.day_id = %s;
-        """
-        exercises = self.execute_query(ex_query, params=(day_id,), fetch='all')
-        return [{'name': name, 'sets': sets, 'reps': reps} for name, sets, reps in exercises]
-
-    def get_plan_id(self, user_id, plan_name):
-        query = "SELECT plan_id FROM workout_plans WHERE user_id = %s AND plan_name = %s;"
-        result = self.execute_query(query, params=(user_id, plan_name), fetch='one')
-        return result[0] if result else None
-         
-    def get_plan_names(self, user_id):
-        query = "SELECT plan_name FROM workout_plans WHERE user_id = %s;"
-        result = self.execute_query(query, params=(user_id,), fetch='all')
-        return [row[0] for row in result] if result else None         
-with open('db_config.json', 'r') as json_file:
-    db_config = json.load(json_file)
-host = db_config['host']
-user = db_config['user']
-password = db_config['password']
-database = db_config['database']
-db_manager = DatabaseManager(db_config)
+db_config = load_db_config()
+db_manager = create_database_manager(db_config)
+# Screens go through async_db so the frame loop never waits on a database round trip
+async_db = AsyncDatabaseManager(db_manager, dispatch=lambda callback: Clock.schedule_once(lambda dt: callback()))
+# Food logs, chats and plan saves land in a local journal first and reach the database in the background
+outbox = Outbox(db_manager, path=db_config.get('outbox_path', OUTBOX_DEFAULTS['outbox_path']),
+                batch_size=int(db_config.get('outbox_batch_size', OUTBOX_DEFAULTS['outbox_batch_size'])),
+                dispatch=lambda callback: Clock.schedule_once(lambda dt: callback()))
+# Remote food searches run off the main thread; only the latest search's results are applied
+search_worker = SearchWorker(dispatch=lambda callback: Clock.schedule_once(lambda dt: callback()))
+# Profile changes are saved on the database workers too
+User.configure(db_manager, async_db, Clock.create_trigger)
 class WindowManager(ScreenManager):
     def __init__(self, **kwargs):
         super(WindowManager, self).__init__(**kwargs)
@@ -477,7 +140,6 @@ class SignupPage(Screen):
             return
 
         # Check if the username already exists in the database
-        db_manager = DatabaseManager(db_config)
         if db_manager.get_user_by_username(username):
             self.ids.signup_error.text = "Username already exists."
             self.signup_success = False
@@ -499,7 +161,6 @@ class SignupPage(Screen):
         # Attempt to create the user in the database
         try:
             self.successful_signup = True
-            db_manager = DatabaseManager(db_config)
             user_id = self.manager.get_screen('initialpage').user_id
             user = UserManager.get_user(user_id)
             user.update_email(email)
@@ -555,7 +216,6 @@ class LoginPage(Screen):
 
         # Attempt to login the user
         try:
-            db_manager = DatabaseManager(db_config)
             user_data = db_manager.get_user_by_username(username)
             if user_data:
                 user_id, username, hashed_password = user_data
@@ -563,6 +223,8 @@ class LoginPage(Screen):
                 if bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8')):
                     # Get the user's preferences from the database
                     UserManager.get_user(user_id)
+                    # Prefetch today's food log, the workout plans and the profile for the next screens
+                    async_db.warm_user_cache(user_id)
                     # Navigate to the dashboard screen
                     self.manager.current = 'dashboard'  
                     self.ids.error.text = ''    
@@ -1217,19 +879,48 @@ class Dashboard(Screen):
     #this class provides methods to update the UI based on the user's progress and input, and to navigate to other screens.
     def __init__(self, **kwargs):
         super(Dashboard, self).__init__(**kwargs)
-        self.exercise_completed = 3
-        self.total_exercises = 6
+        self.exercise_completed = 0  # Workouts logged this week
+        self.total_exercises = 6  # Workouts planned per week
+        self.current_streak = 0  # Consecutive weeks with a workout
         
         
     def on_kv_post(self, base_widget):
         super().on_kv_post(base_widget)
         self.get_calories_from_database
         self.on_workout_to_log()
+
+    def on_enter(self, *args):
+        self.get_training_stats()
+
+    def get_training_stats(self):
+        # This week's sessions and the streak come from the materialized statistics in two key lookups
+        try:
+            user_id = self.manager.get_screen('initialpage').user_id
+        except AttributeError:
+            user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
+        async_db.get_training_summary(user_id, on_result=self.show_training_stats)
+        self.ids.calendar.load_workout_dates()
+
+    def show_training_stats(self, summary):
+        self.exercise_completed = summary['sessions_this_week']
+        user = UserManager._instance
+        # training_frequency is stored like "3 days a week"
+        if user is not None and user.training_frequency:
+            self.total_exercises = int(user.training_frequency[0])
+        self.current_streak = summary['current_streak']
+        # Sessions logged against the weekly target, with the run of weeks that had a workout
+        completed = f"{self.exercise_completed}/{self.total_exercises} Completed"
+        if self.current_streak:
+            completed += f" • {self.current_streak} week streak"
+        self.ids.completed.text = completed
+        self.ids.workout_progress_bar.value = min(100, round(self.exercise_completed / max(1, self.total_exercises) * 100))
         
     def get_calories_from_database(self, dt):
-        # get calories from database
-        daily_totals= MDApp.get_running_app().root.get_screen('food_search').get_daily_calories()
-        print(f"Daily totals: {daily_totals}")
+        # get calories from database, the totals are shown once the food search screen has loaded them
+        self.ids.calories_remaining.text = "..."
+        MDApp.get_running_app().root.get_screen('food_search').get_daily_calories(callback=self.show_calories)
+
+    def show_calories(self, daily_totals):
         total_calories= daily_totals[0]
         total_protein = daily_totals[1]
         total_carbs = daily_totals[2]
@@ -1279,10 +970,7 @@ class Dashboard(Screen):
         self.ids.big_text.text = "Start\nWorkout"
         #self.ids.big_text.font_size= 30
         #self.ids.big_text.padding = "25dp", 24, 0, 0
-        self.ids.completed.text = f"" 
         #self.ids.workout_image.pos_hint = {"center_x": 2.5, "center_y": 0.5}
-        #self.ids.completed.text = f"{self.exercise_completed}/{self.total_exercises} Completed" 
-        #self.ids.workout_progress_bar.value = (self.exercise_completed/self.total_exercises)*100
         self.ids.workout_progress_bar.pos_hint = {"center_x": 2.5, "center_y": 0.5}
     
     def generate_plan(self, trainingfrequency= None,experiencelevel= None,prioritizemusclegroups= None):
@@ -1431,12 +1119,18 @@ class ExerciseList(Screen):
 class FoodSearch(Screen):
     # Class representing the screen for displaying a list of food items
     search_delay = 0.3
+    max_result_pages = 4  # Edamam result pages kept in memory while scrolling; the rest are fetched again when needed
+    result_row_height = dp(50)  # Matches default_size of the results RecycleBoxLayout
 
     def __init__(self, **kwargs):
         # Initialize the screen and create a trigger for performing search with a delay
         super().__init__(**kwargs)
         self.current_unpacked_data = {}  # Stores the current unpacked data from the food database
         self.logged_foodlist=[]  # List of food items that have been logged by the user
+        self.local_rows = []  # Search results from the bundled food catalog for the current query
+        self.result_pages = {}  # Page number -> rows of the Edamam pages currently loaded, at most max_result_pages
+        self.page_links = [None]  # Continuation link of each page seen so far; page 0 is fetched by the query itself
+        self.loading_page = False
         self.search_trigger = Clock.create_trigger(self.perform_search, self.search_delay)  # Trigger for performing search with a delay
         self.serving = 1  # Default serving size
         self.editing_index = None  # Index of the food item being edited, if any
@@ -1460,14 +1154,18 @@ class FoodSearch(Screen):
         self.rebuild_food_list()  # Rebuild the food list
         self.get_daily_calories()  # Get the daily calories consumed by the user
         
-    def get_daily_calories(self):
-        # Method to get the daily calories consumed by the user
+    def get_daily_calories(self, callback=None):
+        # Method to get the daily calories consumed by the user, loaded on a database worker thread
         try:
             user_id = self.manager.get_screen('initialpage').user_id
         except AttributeError:
             user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
-        result = db_manager.get_daily_values(user_id, datetime.now().strftime("%Y-%m-%d"))
-        print(result)
+        self.ids.calories_consumed.text = "..."  # Placeholder until the totals arrive
+        async_db.get_daily_values(user_id, datetime.now().strftime("%Y-%m-%d"),
+                                  on_result=partial(self.on_daily_values_loaded, callback=callback))
+
+    def on_daily_values_loaded(self, result, callback=None):
+        # Called on the main thread with the rows from get_daily_values
         try:
             daily_target = result[0][0]
             if daily_target is None:
@@ -1496,7 +1194,10 @@ class FoodSearch(Screen):
         self.ids.calories_consumed.text = f"{self.total_calories}/{self.daily_calories}"
         #TODO add gui changes to calories when you enter the app
 
-        return self.daily_calories, self.daily_protein, self.daily_carbs, self.daily_fats, self.total_calories, self.total_protein, self.total_carbs, self.total_fats
+        daily_totals = self.daily_calories, self.daily_protein, self.daily_carbs, self.daily_fats, self.total_calories, self.total_protein, self.total_carbs, self.total_fats
+        if callback is not None:
+            callback(daily_totals)
+        return daily_totals
         
     def calculate_nutrients(self, food_data,):
         # This function calculates the nutrients for a given food item based on its portion size.
@@ -1535,22 +1236,9 @@ class FoodSearch(Screen):
             user_id = self.manager.get_screen('initialpage').user_id
         except AttributeError:
             user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
-        date = datetime.now().strftime("%Y-%m-%d")  # Current date
 
-        for food in self.logged_foodlist:
-            # Prepare data for database insertion
-            label = food['label']
-            kcal = food['calories']
-            protein = food['protein']
-            carbs = food['carbs']
-            fats = food['fats']
-            fiber = food['fiber']
-            portion_size = food['portion_size']
-            selected_weight = food.get('selected_weight', 1)
-            unit = food['unit']
-
-
-            db_manager.insert_logged_foods(user_id, label, kcal, protein, carbs, fats, fiber, portion_size, selected_weight, unit, date)
+        # Journal the whole list; the outbox inserts it and updates the day's totals in a single transaction
+        outbox.enqueue('log_foods', user_id, list(self.logged_foodlist), datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         self.logged_foodlist.clear()
 
     def rebuild_food_list(self):
@@ -1560,8 +1248,10 @@ class FoodSearch(Screen):
             user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
         date = datetime.now().strftime("%Y-%m-%d")  # Current date
 
-        # Get the food data from the database
-        food_items = db_manager.get_food_items(user_id, date)
+        # Get the food data from the database on a worker thread, the list fills in when it arrives
+        async_db.get_food_items(user_id, date, on_result=self.on_food_items_loaded)
+
+    def on_food_items_loaded(self, food_items):
         for index, item in enumerate(food_items):
             # Unpack the tuple
             user_id, label, kcal, protein, carbs, fats, fiber, portion_size, selected_weight, unit, timestamp = item
@@ -1657,16 +1347,13 @@ class FoodSearch(Screen):
             getattr(self.ids, f'{name}_icon').opacity = opacity
             getattr(self.ids, f'{name}_text').opacity = opacity
             
-    def get_food_data(self, query):
-        app_id = os.getenv("EDAMAM_APP_ID")
-        app_key = os.getenv("EDAMAM_APP_KEY")
-        url = f'https://api.edamam.com/api/food-database/v2/parser?app_id={app_id}&app_key={app_key}&ingr={query}&nutrition-type=logging'
-
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return f"Error: Unable to fetch data, status code {response.status_code}"
+    def get_food_data(self, query, page_link=None):
+        # Cached, slimmed Edamam hints for the query, or the page behind a continuation link, with the link to the
+        # page after it in 'next'. Raises NutritionAPIError when nothing is cached and Edamam is unreachable,
+        # failing, cut off by the circuit breaker or over the per-minute search cap
+        if page_link is None:
+            return get_food_search_cache().lookup(query)
+        return get_food_search_cache().next_page(page_link)
 
     def unpack_food_data(self, original_data):
         nutrients = original_data['food']['nutrients']
@@ -1696,37 +1383,116 @@ class FoodSearch(Screen):
     def unit_to_sequence_func(self, unit):
         return self.unit_to_sequence.get(unit, (True, False, False, False, False, False))
 
-    def perform_search(self, *args):
-        try:
-            query = self.ids.search_field.text
-            data = self.get_food_data(query)
-            filtered_foods = []
-            if isinstance(data.get('hints'), list):
-                for hint in data['hints']:
-                    if isinstance(hint.get('food'), dict) and query.lower() in hint['food'].get('label', '').lower():
-                        unpacked_data = self.unpack_food_data(hint)
-                        food_text = f"[size=18][font=Poppins-SemiBold.ttf][color=#FFFFFF]{unpacked_data['label']}[/color][/font][/size]"
-                        
-                        weight = unpacked_data['selected_weight']
-                        
-                        # Calculate the portion factor
-                        portion_factor = weight / 100 if weight != 'N/A' else 1
-                        
-                        # Calculate the kcal and other macros for the serving size
-                        kcal = round(unpacked_data['calories'] * portion_factor)
-                        protein = round(unpacked_data['protein'] * portion_factor)
-                        carbs = round(unpacked_data['carbs'] * portion_factor)
-                        fats = round(unpacked_data['fats'] * portion_factor)
-                        
-                        secondary_text = f"[size=13][font=Poppins-Regular.ttf][color=#FFFFFF]{kcal}kcal {protein}P {carbs}C {fats}F • {weight}g[/color][/font][/size]"
-                        filtered_foods.append({'text': food_text, 'secondary_text': secondary_text, 'original_data': unpacked_data})
+    def food_rows(self, hints, query=None):
+        # RecycleView rows for search hints; with a query, hints whose label doesn't contain it are left out
+        rows = []
+        for hint in hints:
+            if not isinstance(hint.get('food'), dict):
+                continue
+            if query is not None and query.lower() not in hint['food'].get('label', '').lower():
+                continue
+            unpacked_data = self.unpack_food_data(hint)
+            food_text = f"[size=18][font=Poppins-SemiBold.ttf][color=#FFFFFF]{unpacked_data['label']}[/color][/font][/size]"
 
-            self.ids.rv.data = filtered_foods
-        except Exception as e:
-            print(f"An error occurred: {e}")
+            weight = unpacked_data['selected_weight']
+
+            # Calculate the portion factor
+            portion_factor = weight / 100 if weight != 'N/A' else 1
+
+            # Calculate the kcal and other macros for the serving size
+            kcal = round(unpacked_data['calories'] * portion_factor)
+            protein = round(unpacked_data['protein'] * portion_factor)
+            carbs = round(unpacked_data['carbs'] * portion_factor)
+            fats = round(unpacked_data['fats'] * portion_factor)
+
+            secondary_text = f"[size=13][font=Poppins-Regular.ttf][color=#FFFFFF]{kcal}kcal {protein}P {carbs}C {fats}F • {weight}g[/color][/font][/size]"
+            rows.append({'text': food_text, 'secondary_text': secondary_text, 'original_data': unpacked_data})
+        return rows
+
+    def show_local_results(self, query):
+        # Matches from the bundled catalog, shown on every keystroke without waiting for the debounced remote search
+        self.local_rows = self.food_rows(get_food_catalog().search(query)) if query.strip() else []
+        self.ids.rv.data = self.local_rows
+
+    def perform_search(self, *args):
+        # Start the remote search on the search worker; it supersedes any search still in flight
+        self.result_pages = {}
+        self.page_links = [None]
+        self.load_page(0)
+
+    def load_page(self, number):
+        # Fetch one result page of the current text on the search worker
+        self.loading_page = True
+        search_worker.call(partial(self.search_page, self.ids.search_field.text, self.page_links[number]),
+                           on_result=partial(self.on_search_page, number), on_error=self.on_search_error)
+
+    def search_page(self, query, page_link=None):
+        # Runs on the search worker: fetches one page, a single Edamam request, and builds its rows off the main thread
+        data = self.get_food_data(query, page_link)
+        return self.food_rows(data.get('hints') or [], query=query), data.get('next')
+
+    def on_search_page(self, number, page):
+        # Called on the main thread with a page of the latest search
+        rows, next_link = page
+        self.loading_page = False
+        if next_link and number == len(self.page_links) - 1:
+            self.page_links.append(next_link)
+        self.result_pages[number] = rows
+        added_above = self.visible_row_count(rows) if number < max(self.result_pages) else 0
+        if len(self.result_pages) > self.max_result_pages:
+            # Drop the page farthest from the one just loaded
+            dropped = min(self.result_pages) if number == max(self.result_pages) else max(self.result_pages)
+            if dropped < number:
+                added_above -= self.visible_row_count(self.result_pages[dropped])
+            del self.result_pages[dropped]
+        self.show_remote_results(added_above)
+        if len(self.result_pages) < self.max_result_pages and self.ids.rv.height >= len(self.ids.rv.data) * self.result_row_height:
+            # Everything loaded fits on screen, so no scroll will ask for more
+            self.on_results_scroll(0)
+
+    def visible_row_count(self, rows):
+        local_labels = {row['original_data']['label'].lower() for row in self.local_rows}
+        return sum(1 for row in rows if row['original_data']['label'].lower() not in local_labels)
+
+    def show_remote_results(self, added_above=0):
+        # Local hits stay on top; remote results add the foods the catalog doesn't have
+        rv = self.ids.rv
+        local_labels = {row['original_data']['label'].lower() for row in self.local_rows}
+        scrollable = len(rv.data) * self.result_row_height - rv.height
+        offset = (1 - rv.scroll_y) * scrollable if scrollable > 0 else 0
+        rv.data = self.local_rows + [row for number in sorted(self.result_pages) for row in self.result_pages[number]
+                                     if row['original_data']['label'].lower() not in local_labels]
+        scrollable = len(rv.data) * self.result_row_height - rv.height
+        if added_above and scrollable > 0:
+            # Keep the rows that were on screen in place when a page is added or dropped above them
+            rv.scroll_y = min(1, max(0, 1 - (offset + added_above * self.result_row_height) / scrollable))
+
+    def on_results_scroll(self, scroll_y):
+        # Near the end of what is loaded: fetch the next page; near the top of a window that has dropped its
+        # first pages: fetch the one before it again
+        if self.loading_page or not self.result_pages:
+            return
+        if scroll_y <= 0.1 and max(self.result_pages) + 1 < len(self.page_links):
+            self.load_page(max(self.result_pages) + 1)
+        elif scroll_y >= 0.9 and min(self.result_pages) > 0:
+            self.load_page(min(self.result_pages) - 1)
+
+    def on_search_error(self, error):
+        self.loading_page = False
+        if isinstance(error, NutritionAPIError):
+            # Keep the local results on screen rather than clearing them
+            Logger.warning(f"FoodSearch: {error}")
+            if not self.local_rows:
+                toast("Food search is unavailable right now")
+        else:
+            logging.error(f"Food search failed: {error}", exc_info=error)
 
     def search_query(self, query):
-        # Reset the countdown for the search trigger and adjust the opacity of the search label based on whether the search field is empty
+        # Show catalog matches right away and drop the results of the previous text, then reset the countdown for the remote search trigger and adjust the opacity of the search label based on whether the search field is empty
+        search_worker.cancel()
+        self.loading_page = False
+        self.result_pages = {}
+        self.show_local_results(self.ids.search_field.text)
         if self.ids.search_field.text:
             self.search_trigger.cancel()
             self.ids.search_label.opacity=0
@@ -1876,6 +1642,7 @@ class SelectWorkout(Screen):
         self.opened= False  # Flag to check if a workout plan details are opened
         self.plan= {}  # Dictionary to store the details of a workout plan
         self.generated_plan = None  # Variable to store the generated plan
+        self.saved_plans = {}  # Every saved plan of the user, keyed by plan name
     def on_kv_post(self, base_widget):
         # This method is called after all the KV rules for this widget have been processed.
         # The base_widget parameter is the root widget of the KV rules tree, i.e. the widget that was created with the Builder.load*() call.
@@ -1884,17 +1651,42 @@ class SelectWorkout(Screen):
         return super().on_kv_post(base_widget)  # Call the parent's on_kv_post method
     
     def get_plans_from_database(self):
-        # This function retrieves workout plans from the database for a specific user.
+        # This function loads the workout plans of a specific user on a database worker thread.
         try:
             user_id = self.manager.get_screen('initialpage').user_id
         except AttributeError:
             user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
-        plans = db_manager.get_plan_names(user_id)  # Fetch the plan names from the database
-        return plans  # Return the fetched plans
+        # Load every plan with one query so opening or editing a plan later needs no database round trip
+        async_db.load_workout_plans(user_id, on_result=partial(self.on_plans_loaded, user_id))
+
+    def on_plans_loaded(self, user_id, plans):
+        # Called on the main thread once the user's plans have been loaded. Plans still waiting in the outbox
+        # are newer than the stored ones, so they are laid over the result
+        for plan_name, workout_plan in outbox.pending_writes('save_complete_workout_plan', user_id):
+            plans[plan_name] = {int(day_number): exercises for day_number, exercises in workout_plan.items()}
+        self.saved_plans = plans
+        self.show_workout_plans(list(plans) or None)
+
+    def get_saved_plan(self, user_id, workout_name, on_plan):
+        # Hand a copy of a saved plan to on_plan; a plan that isn't among the loaded ones is fetched on a database worker
+        plan = self.saved_plans.get(workout_name)
+        if plan is not None:
+            on_plan(copy.deepcopy(plan))
+            return
+        async_db.retrieve_workout_plan(user_id, workout_name, on_result=partial(self.on_saved_plan_loaded, workout_name, on_plan))
+
+    def on_saved_plan_loaded(self, workout_name, on_plan, plan):
+        if plan:
+            self.saved_plans[workout_name] = plan
+        on_plan(copy.deepcopy(plan))
 
     def populate_workout(self):
         # This function populates the workout plans in the RecycleView.
-        user_plans = self.get_plans_from_database()  # Get the user's workout plans from the database
+        # The built-in entries are shown straight away and the user's plans are added once they are loaded
+        self.show_workout_plans(None)
+        self.get_plans_from_database()
+
+    def show_workout_plans(self, user_plans):
         plans = []  # Initialize an empty list to store the plans
         # Predefined workout names and icons
         workout_name = ['Single Workout']
@@ -1922,8 +1714,10 @@ class SelectWorkout(Screen):
             user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
         # Extract the workout name from the text
         workout_name = re.search(r'\[color=#FFFFFF](.*?)\[/color]', text).group(1)
-        # Fetch the workout plan from the database
-        plan = db_manager.retrieve_workout_plan(user_id, workout_name)
+        # Open the plan once it is at hand
+        self.get_saved_plan(user_id, workout_name, self.open_plan_editor)
+
+    def open_plan_editor(self, plan):
         if plan:
             # If the plan exists, update the empty_plan screen with the plan and switch to it
             empty_plan_screen = self.manager.get_screen('empty_plan')
@@ -1960,7 +1754,13 @@ class SelectWorkout(Screen):
                 return
         # If the name is different from the previously selected workout, fetch the workout plan from the database and update the self.plan attribute
         elif workout_name!= self.workout_name :
-            self.plan= db_manager.retrieve_workout_plan(user_id, workout_name)
+            self.get_saved_plan(user_id, workout_name, partial(self.show_plan_panel, workout_name))
+            return
+        self.show_plan_panel(workout_name, self.plan)
+
+    def show_plan_panel(self, workout_name, plan):
+        # Show the days of a plan in the choose plan panel
+        self.plan = plan
         # Update the self.workout_name attribute
         self.workout_name= workout_name
         # Get the number of days in the plan
@@ -2026,6 +1826,7 @@ class EmptyPlan(Screen):
         self.workout_plans = []
         self.add_exercise_button_new= "add_exercises_post_1"
         self.opened= False
+        self.saving_plans = {}  # Outbox idempotency key -> name of a plan waiting to be written
         
     def update_plan(self, plan):
         self.workout_plans_by_day = plan
@@ -2224,8 +2025,26 @@ class EmptyPlan(Screen):
         except AttributeError:
             user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
         plan_name= self.ids.plan_name.text
-        workout_plan=self.workout_plans_by_day
-        db_manager.save_complete_workout_plan(user_id, plan_name, workout_plan)
+        # Journal a snapshot so later edits on this screen can't change what gets saved
+        workout_plan=copy.deepcopy(self.workout_plans_by_day)
+        key = outbox.enqueue('save_complete_workout_plan', user_id, plan_name, workout_plan)
+        self.saving_plans[key] = plan_name
+        # Listed on the select workout screen straight away; confirmed once the outbox has written it
+        self.manager.get_screen('select_workout').saved_plans[plan_name] = workout_plan
+        toast("Saving plan...")
+
+    def on_plan_saved(self, key):
+        # Called by the app once the outbox has written a plan to the database
+        plan_name = self.saving_plans.pop(key, None)
+        if plan_name is not None:
+            toast(f"Plan {plan_name} saved.")
+
+    def on_plan_save_failed(self, key, error):
+        # The database rejected the plan and the outbox won't retry it, including plans queued by an earlier run
+        plan_name = self.saving_plans.pop(key, None)
+        toast(f"Plan {plan_name} couldn't be saved." if plan_name is not None else "A workout plan couldn't be saved.")
+        # Show the plans as they are actually stored
+        self.manager.get_screen('select_workout').get_plans_from_database()
 class LogWorkout(Screen):
     def __init__(self, **kwargs):
         super(LogWorkout, self).__init__(**kwargs)
@@ -2240,6 +2059,7 @@ class LogWorkout(Screen):
         self.plan= []  # Stores the workout plan
         self.workout_rows_instances = {}  # Stores the instances of WorkoutRow for each exercise in the plan
         self.workout_data = {}  # Stores the weight, reps, and tenrm for each set of each exercise
+        self.previous_performance = {}  # Stores the sets of the last session of each exercise, by name
 
     def initialize_workout(self):
         # Initialize the workout_rows_instances dictionary with an empty list for each exercise in the plan
@@ -2260,8 +2080,46 @@ class LogWorkout(Screen):
         self.current_page= self.ids.logworkout_sm.current[-1]
         # Set the text of the exercise_name_1 label to the name of the first exercise in the plan
         self.ids.exercise_name_1.text = self.plan[0]['name']
+        self.show_exercise_stats(self.plan[0]['name'])
         self.update_sets()
-        
+        self.load_previous_performance([exercise['name'] for exercise in self.plan])
+
+    def get_user_id(self):
+        try:
+            return self.manager.get_screen('initialpage').user_id
+        except AttributeError:
+            return '262efaa4-1a2d-484e-8de8-32966c8a6a82'
+
+    def load_previous_performance(self, exercise_names):
+        # Fetch the last session of every exercise on a worker thread to prefill the rows
+        async_db.get_previous_performance(self.get_user_id(), exercise_names, on_result=self.on_previous_performance_loaded)
+
+    def on_previous_performance_loaded(self, previous):
+        self.previous_performance.update(previous)
+        # The rows of the exercise on screen were generated before the history arrived
+        if self.current_item_id < len(self.plan):
+            self.prefill_rows(self.workout_rows, self.plan[self.current_item_id]['name'])
+
+    def show_exercise_stats(self, exercise_name):
+        # Best estimated 1RM and session count of the exercise on screen, from the materialized statistics
+        label = self.ids[f"exercise_stats_{self.current_page}"]
+        label.text = ""
+        async_db.get_exercise_stats(self.get_user_id(), exercise_name,
+                                    on_result=partial(self.on_exercise_stats_loaded, label, exercise_name))
+
+    def on_exercise_stats_loaded(self, label, exercise_name, stats):
+        # Skipped when the user has moved on to another exercise in the meantime
+        if stats and self.current_item_id < len(self.plan) and self.plan[self.current_item_id]['name'] == exercise_name:
+            label.text = f"Best {stats['best_e1rm']:g} kg e1RM • {stats['sessions']} sessions"
+
+    def prefill_rows(self, rows, exercise_name):
+        # Show what was lifted last time in every row the user hasn't filled in yet
+        previous_sets = self.previous_performance.get(exercise_name, [])
+        for row, previous_set in zip(rows, previous_sets):
+            if row.type != "done" and row.kg == "-":
+                row.kg = str(previous_set['weight'])
+                row.reps = str(previous_set['reps'])
+
     def add_plus_icon(self):
         # Add a plus icon to the layout to allow the user to add new exercises to the plan
         item = WorkoutImage(source_image="plus_bg.png", item_id=len(self.plan), opacity=1)
@@ -2328,6 +2186,7 @@ class LogWorkout(Screen):
             self.workout_rows.append(workout_row)  # Add the row to the list of workout rows
             y -= 0.05  # Decrease the y position for the next row
         self.workout_rows[0].reps= str(self.plan[self.current_item_id]['reps'])  # Set the reps for the first row
+        self.prefill_rows(self.workout_rows, self.plan[self.current_item_id]['name'])  # Fill in last session's sets
         
     def add_exercise(self, exercise_names):
         # Remove the plus icon from the box layout
@@ -2349,6 +2208,7 @@ class LogWorkout(Screen):
             self.current_row[len(self.plan)-1] = 0
             # Initialize the workout rows instances for the new exercise to an empty list
             self.workout_rows_instances[len(self.plan)-1] = []
+        self.load_previous_performance(exercise_names)
             
         # Add a new entry for the exercise in current_row and workout_rows_instances
         new_index = len(self.plan) - 1
@@ -2416,6 +2276,7 @@ class LogWorkout(Screen):
         # Update the exercise name label
         exercise_name_id = f"exercise_name_{self.current_page}"
         self.ids[exercise_name_id].text = self.plan[self.current_item_id]['name']
+        self.show_exercise_stats(self.plan[self.current_item_id]['name'])
         #update position of the three dots icon
         dots_rec_id = f"dots_rec_{self.current_page}"
         dots_id= f"dots_{self.current_page}"
@@ -2591,15 +2452,14 @@ class LogWorkout(Screen):
         for i, exercise in enumerate(self.plan):
             if i in self.workout_data:
                 named_workout_data[exercise['name']] = self.workout_data[i]
+        # Store every completed set of the session in the workout history
+        sets = [{'name': name, 'set_no': set_no, 'weight': data['weight'], 'reps': data['reps']}
+                for name, exercise_sets in named_workout_data.items()
+                for set_no, data in sorted(exercise_sets.items())
+                if data['weight'] != "-" and data['reps'] != "-"]
+        if sets:
+            outbox.enqueue('save_workout_session', self.get_user_id(), sets, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
         
-    def on_back(self):
-        exercises_completed = 0
-        #store the exercise as 1 if all the sets are done and 0 if not
-        for i in range(len(self.plan)):
-            if i in self.workout_data and len(self.workout_data[i]) == self.plan[i]['sets']:
-                exercises_completed += 1
-        MDApp.get_running_app().root.get_screen('dashboard').exercise_completed= exercises_completed
-
     def on_single_workout(self):
         #method that is called when the user wants to directly start a workout without selecting a plan
         self.plan=[] #clear the plan
@@ -3320,13 +3180,26 @@ class PrioritizeMuscleGroups(Screen): #this will be displayed after the InputTra
             self.manager.current= "generate_plan"
         else:
             self.manager.current= "prioritizemusclegroups"    
+# Number of chat messages fetched per page
+CHAT_PAGE_SIZE = 30
+
+
 class ChatBotScreen(Screen):
     def __init__ (self, **kwargs):
         super(ChatBotScreen, self).__init__(**kwargs)
     def on_kv_post(self, base_widget):
         super().on_kv_post(base_widget)
+        # Chat history is shown one page at a time, newest first; older pages load on scroll-up
+        self.loaded_chat_widgets = []
+        self.oldest_chat = None
+        self.has_older_chats = True
+        self.loading_chats = False
         self.initial_prompt()
 
+    def on_enter(self, *args):
+        if not self.loaded_chat_widgets:
+            self.load_older_chats()
+
     def initial_prompt(self):
         # Initialize the chatbot with the OpenAI API key and other parameters
         # Initialize the chat history and the initial prompt
@@ -3395,21 +3268,63 @@ class ChatBotScreen(Screen):
             self.chat_history.append(('e87601ef-eda4-4e3e-bca5-b6bb32bc483f', self.value, 'Human'))
 
     def rebuild_chat_history(self):
+        # Clear the loaded messages and start again from the newest page
+        for widget in self.loaded_chat_widgets:
+            self.ids.chat_list.remove_widget(widget)
+        self.loaded_chat_widgets = []
+        self.oldest_chat = None
+        self.has_older_chats = True
+        self.load_older_chats()
+
+    def load_older_chats(self):
+        # Fetch the page of messages just before the oldest one on screen
+        if self.loading_chats or not self.has_older_chats:
+            return
+        self.loading_chats = True
         # Get the user ID
         user_id = 'e87601ef-eda4-4e3e-bca5-b6bb32bc483f'  # Or dynamically set this
-        # Get the chat messages from the database
-        chat_messages = db_manager.get_chats_by_user_id(user_id)
-        # Iterate over the chat messages
-        for message_tuple in chat_messages:  # Iterate in the original order
+        before_timestamp, before_chat_id = self.oldest_chat or (None, None)
+        async_db.get_chats_page(user_id, before_timestamp, before_chat_id, limit=CHAT_PAGE_SIZE,
+                                on_result=self.on_chats_loaded, on_error=self.on_chats_failed)
+
+    def on_chats_loaded(self, chat_messages):
+        self.loading_chats = False
+        self.has_older_chats = len(chat_messages) == CHAT_PAGE_SIZE
+        if not chat_messages:
+            return
+        chat_list = self.ids.chat_list
+        scroll = self.ids.chat_scroll
+        previous_height = chat_list.height
+        # The page comes newest first; each older message goes above everything already shown
+        for message_tuple in chat_messages:
             # Unpack the tuple
             chat_id, user_id, text, timestamp, sender = message_tuple
             # Depending on the sender, use different UI elements
             if sender == 'AI':
                 # Display the message as an AI response
-                self.ids.chat_list.add_widget(Response(text=text, size_hint_x=.75))
+                widget = Response(text=text, size_hint_x=.75)
             else:
                 # Display the message as a user command
-                self.ids.chat_list.add_widget(Command(text=text, size_hint_x=.75))
+                widget = Command(text=text, size_hint_x=.75)
+            chat_list.add_widget(widget, index=len(chat_list.children))
+            self.loaded_chat_widgets.append(widget)
+        chat_id, user_id, text, timestamp, sender = chat_messages[-1]
+        self.oldest_chat = (timestamp, chat_id)
+        # Keep the messages that were on screen in place instead of jumping to the new top
+        Clock.schedule_once(lambda dt: self.keep_scroll_position(scroll, chat_list, previous_height))
+
+    def on_chats_failed(self, error):
+        self.loading_chats = False
+
+    def keep_scroll_position(self, scroll, chat_list, previous_height):
+        scrollable = chat_list.height - scroll.height
+        if scrollable > 0:
+            scroll.scroll_y = min(1, 1 - (chat_list.height - previous_height) / scrollable)
+
+    def on_chat_scroll(self, scroll_y):
+        # Scrolled to the top of what is loaded: fetch the next older page
+        if scroll_y >= 1 and self.loaded_chat_widgets:
+            self.load_older_chats()
 
     def update_chat_ui(self, response_content):
         # Add the response to the chat UI
@@ -3424,7 +3339,7 @@ class ChatBotScreen(Screen):
             user_id, text, sender = message
 
             # Save the message to the database
-            db_manager.insert_chat(user_id=user_id, message=text, sender=sender)
+            outbox.enqueue('insert_chat', user_id, text, sender, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
         # Clear the history after saving
         self.chat_history.clear()  
@@ -3659,15 +3574,17 @@ class CalendarWidget(BoxLayout):
         self.orientation = 'vertical'
         self.top_bar = GridLayout(cols=11, size_hint_y=None, height=50)
         self.add_widget(self.top_bar)
-        self.create_top_bar()
+        self.create_top_bar(set())
+        # The workout days are read once the app has a user
+        Clock.schedule_once(lambda dt: self.load_workout_dates())
         self.calendar_view = ScrollView(size_hint=(1, None), size=(Window.width, Window.height - 50))
         self.add_widget(self.calendar_view)
 
-    def create_top_bar(self):
+    def create_top_bar(self, workout_dates):
         # Get the last 10 dates
+        self.top_bar.clear_widgets()
         today = datetime.now()
         last_11_days = [today - timedelta(days=i) for i in range(11)]
-        workout_dates = self.get_workout_dates()  # Retrieve workout dates from storage
         last_11_days.reverse()
 
         # Create the top bar
@@ -3695,15 +3612,14 @@ class CalendarWidget(BoxLayout):
             ellipse = instance.ellipse
             ellipse.pos = (instance.x + instance.width / 2 - ellipse.size[0] / 2, instance.y)
 
-    def get_workout_dates(self):
-        # Hard-coded workout dates for demonstration purposes
-        # In a real app, you would retrieve these from persistent storage
-        return {
-            datetime.now() - timedelta(days=1),  # Yesterday
-            datetime.now() - timedelta(days=3),  # Three days ago
-            datetime.now() - timedelta(days=5),  # Five days ago
-            datetime.now() - timedelta(days=7)   # A week ago
-        }
+    def load_workout_dates(self):
+        # Retrieve workout dates from the weekly statistics, at most three rows for the last 11 days
+        try:
+            user_id = MDApp.get_running_app().root.get_screen('initialpage').user_id
+        except AttributeError:
+            user_id= '262efaa4-1a2d-484e-8de8-32966c8a6a82'
+        today = datetime.now().date()
+        async_db.get_workout_dates(user_id, today - timedelta(days=10), today, on_result=self.create_top_bar)
 
     # Add more methods to handle calendar view and interactions
 class BodyweightGraph(BoxLayout):
@@ -4114,8 +4030,45 @@ class FitnessApp(MDApp):
 
    def on_start(self, *args):
        Window.size = (360 , 640)
+       # Load the exercise name -> id map once so saving plans needs no per-exercise lookups
+       async_db.warm_exercise_cache()
+       # Periodically write query latency snapshots if metrics_dump_path is set in db_config.json
+       start_metrics_dump(db_config)
+       # Replay writes left in the journal by the last run, then keep flushing new ones
+       outbox.add_listener(self.on_write_applied)
+       outbox.add_failure_listener(self.on_write_failed)
+       outbox.start()
        # Load your resources here
        # Once resources are loaded, switch to the main screen
        self.root.current = 'initialpage' # Switch to the main screen
+
+   def on_write_applied(self, method, user_id, key):
+       # A queued write has reached the database: a logged workout has updated the training statistics,
+       # a saved plan can be confirmed
+       if method == 'save_workout_session':
+           self.root.get_screen('dashboard').get_training_stats()
+       elif method == 'save_complete_workout_plan':
+           self.root.get_screen('empty_plan').on_plan_saved(key)
+
+   def on_write_failed(self, method, user_id, key, error):
+       # A queued write was rejected by the database and dropped from the outbox
+       if method == 'save_complete_workout_plan':
+           self.root.get_screen('empty_plan').on_plan_save_failed(key, error)
+       else:
+           toast("Some changes couldn't be saved.")
+
+   def on_stop(self, *args):
+       try:
+           # Write any profile changes still waiting for a coalesced save
+           if UserManager._instance is not None:
+               UserManager._instance.save_now()
+       finally:
+           # Stopped even when the save fails. Let queued database writes finish before the process exits;
+           # anything still in the outbox is kept for next start
+           try:
+               outbox.stop()
+           finally:
+               search_worker.shutdown()
+               async_db.shutdown(wait=True)
 if __name__ == "__main__":
     FitnessApp().run()
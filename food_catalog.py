@@ -0,0 +1,121 @@
+# Bundled catalog of common foods for instant, offline search results.
+# food_catalog.tsv lists per-100 g macros and the gram weight of common measures. The file is read and indexed
+# on the first search: a sorted word list answers prefix queries with a binary search, and a trigram index
+# catches misspellings. Results come back in the same shape as slimmed Edamam hints (see search_cache.py),
+# so FoodSearch renders local and remote results the same way.
+import bisect
+import os
+import threading
+
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'food_catalog.tsv')
+MIN_TRIGRAM_SCORE = 0.45
+
+
+def words(text):
+    return [word for word in ''.join(c if c.isalnum() else ' ' for c in text.lower()).split() if word]
+
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FoodCatalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._foods = None
+        self._words = None  # sorted (word, food index)
+        self._trigrams = None  # trigram -> {food index}
+
+    def _load(self):
+        foods = []
+        with open(self.path, 'r', encoding='utf-8') as catalog_file:
+            for line in catalog_file:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                name, kcal, protein, carbs, fat, fiber, measures = line.rstrip('\n').split('\t')
+                foods.append({
+                    'food': {'label': name,
+                             'nutrients': {'ENERC_KCAL': float(kcal), 'PROCNT': float(protein), 'CHOCDF': float(carbs),
+                                           'FAT': float(fat), 'FIBTG': float(fiber)}},
+                    'measures': [{'label': label, 'weight': float(weight)}
+                                 for label, weight in (measure.split('=') for measure in measures.split('|'))],
+                    'source': 'local',
+                })
+        word_index = []
+        trigram_index = {}
+        for index, food in enumerate(foods):
+            for word in words(food['food']['label']):
+                word_index.append((word, index))
+                for trigram in trigrams(word):
+                    trigram_index.setdefault(trigram, set()).add(index)
+        word_index.sort()
+        self._words, self._trigrams, self._foods = word_index, trigram_index, foods
+
+    def _ensure_loaded(self):
+        if self._foods is None:
+            with self._lock:
+                if self._foods is None:
+                    self._load()
+
+    def _prefix_matches(self, prefix):
+        # Indexes of the foods with a word starting with prefix
+        start = bisect.bisect_left(self._words, (prefix,))
+        matches = set()
+        for word, index in self._words[start:]:
+            if not word.startswith(prefix):
+                break
+            matches.add(index)
+        return matches
+
+    def search(self, query, limit=20):
+        # Ranked hints for partial input: every typed word must prefix a word of the name, exact and leading
+        # matches first; when that finds nothing the closest names by shared trigrams are returned instead
+        self._ensure_loaded()
+        query_words = words(query)
+        if not query_words:
+            return []
+        scored = {}
+        candidates = None
+        for word in query_words:
+            matches = self._prefix_matches(word)
+            candidates = matches if candidates is None else candidates & matches
+        for index in candidates or ():
+            label = self._foods[index]['food']['label'].lower()
+            name_words = words(label)
+            score = 2.0
+            if label.startswith(' '.join(query_words)):
+                score += 2.0
+            if name_words[:len(query_words)] == query_words:
+                score += 1.0
+            scored[index] = score - len(name_words) * 0.01
+        if not scored:
+            query_trigrams = set().union(*(trigrams(word) for word in query_words))
+            counts = {}
+            for trigram in query_trigrams:
+                for index in self._trigrams.get(trigram, ()):
+                    counts[index] = counts.get(index, 0) + 1
+            for index, shared in counts.items():
+                score = shared / len(query_trigrams)
+                if score >= MIN_TRIGRAM_SCORE:
+                    scored[index] = score
+        ranked = sorted(scored, key=lambda index: (-scored[index], self._foods[index]['food']['label']))
+        return [self._foods[index] for index in ranked[:limit]]
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._foods)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_food_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = FoodCatalog()
+    return _catalog
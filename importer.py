@@ -0,0 +1,215 @@
+# Bulk import of food and body weight history from other trackers' CSV exports (MyFitnessPal and similar).
+# The file is read as a stream and handled a batch at a time: each batch is validated and normalized into
+# food_items / weight_logs rows and written with one multi-row insert (or LOAD DATA LOCAL INFILE), without
+# touching daily_totals. Once every batch is in, daily_totals is recomputed for the imported days with a single
+# set-based statement, instead of one upsert per row.
+import csv
+import logging
+import math
+import os
+import tempfile
+from datetime import date, datetime
+from itertools import islice
+
+from database import IMPORT_DEFAULTS
+
+KINDS = ('foods', 'weights')
+
+# Accepted header names for each field, compared lowercased and stripped
+FOOD_COLUMNS = {
+    'date': ('date', 'day', 'logged at', 'timestamp'),
+    'time': ('time',),
+    'label': ('food', 'food name', 'name', 'label', 'description', 'meal'),
+    'calories': ('calories', 'kcal', 'energy (kcal)', 'energy'),
+    'protein': ('protein (g)', 'protein'),
+    'carbs': ('carbohydrates (g)', 'carbohydrates', 'carbs (g)', 'carbs'),
+    'fats': ('fat (g)', 'fat', 'fats (g)', 'fats', 'total fat (g)'),
+    'fiber': ('fiber', 'fiber (g)', 'fibre', 'fibre (g)'),
+    'weight': ('weight (g)', 'amount (g)', 'grams', 'quantity (g)'),
+}
+WEIGHT_COLUMNS = {
+    'date': ('date', 'day', 'timestamp'),
+    'weight': ('weight', 'weight (kg)', 'body weight', 'kg'),
+    'weight_lbs': ('weight (lbs)', 'weight (lb)', 'lbs', 'lb'),
+    'bodyfat': ('body fat', 'body fat (%)', 'bodyfat', 'body fat %', 'fat %'),
+}
+REQUIRED = {'foods': ('date', 'calories'), 'weights': ('date',)}
+
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%m/%d/%Y", "%m/%d/%Y %H:%M", "%d.%m.%Y")
+LBS_TO_KG = 0.45359237
+MAX_REPORTED_ERRORS = 50
+
+# Largest value each column holds (kcal INT, nutrients DECIMAL(5,2), food weight DECIMAL(6,2), bodyfat
+# DECIMAL(4,2)). MySQL rejects the whole multi-row insert when one value is out of range, so such rows are
+# skipped here instead.
+MAX_KCAL = 2 ** 31 - 1
+MAX_NUTRIENT = 999.99
+MAX_FOOD_WEIGHT = 9999.99
+MAX_BODYFAT = 99.99
+
+
+def parse_timestamp(value, time_value=None):
+    value = value.strip()
+    if time_value and time_value.strip():
+        value = f"{value} {time_value.strip()}"
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognized date {value!r}")
+
+
+def parse_number(value, default=None):
+    # Exports write thousands separators and leave empty cells for missing values
+    if value is None or not value.strip():
+        if default is None:
+            raise ValueError("missing value")
+        return default
+    number = float(value.strip().replace(',', ''))
+    if not math.isfinite(number):
+        raise ValueError(f"invalid number {value.strip()!r}")
+    return number
+
+
+def in_range(value, limit, name):
+    # value rounded the way its column stores it; ValueError when it is negative or doesn't fit the column
+    value = round(value, 2)
+    if not 0 <= value <= limit:
+        raise ValueError(f"{name} {value:g} out of range 0-{limit:g}")
+    return value
+
+
+def map_columns(fieldnames, aliases, kind):
+    # {field: header as written in the file}
+    headers = {name.strip().lower(): name for name in fieldnames or ()}
+    columns = {}
+    for field, names in aliases.items():
+        for name in names:
+            if name in headers:
+                columns[field] = headers[name]
+                break
+    missing = [field for field in REQUIRED[kind] if field not in columns]
+    if kind == 'weights' and 'weight' not in columns and 'weight_lbs' not in columns:
+        missing.append('weight')
+    if missing:
+        raise ValueError(f"{kind} CSV has no column for {', '.join(missing)}; found {', '.join(headers) or 'no header'}")
+    return columns
+
+
+def cell(record, columns, field):
+    # The row's value for field; '' when the file has no column for it or the row is cut short. Unmapped fields
+    # must not be looked up: DictReader files surplus values of a long row under the key None.
+    header = columns.get(field)
+    if header is None:
+        return ''
+    return record.get(header) or ''
+
+
+def food_row(user_id, record, columns):
+    timestamp = parse_timestamp(cell(record, columns, 'date'), cell(record, columns, 'time'))
+    if 'time' not in columns and timestamp.hour == timestamp.minute == 0:
+        # Exports without a time of day are placed at noon so no timezone shift moves them to another day
+        timestamp = timestamp.replace(hour=12)
+    kcal = in_range(round(parse_number(cell(record, columns, 'calories'))), MAX_KCAL, 'calories')
+    label = cell(record, columns, 'label').strip()[:255] or 'Imported food'
+    weight = in_range(parse_number(cell(record, columns, 'weight'), default=0.0), MAX_FOOD_WEIGHT, 'weight')
+    # Round the same way the food_items columns do, so a rebuild of daily_totals matches the stored rows
+    nutrients = [in_range(parse_number(cell(record, columns, field), default=0.0), MAX_NUTRIENT, field)
+                 for field in ('protein', 'carbs', 'fats', 'fiber')]
+    return (user_id, label, kcal, *nutrients,
+            1, weight if weight else 1, 'g' if weight else 'serving',
+            timestamp.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def weight_row(user_id, record, columns):
+    day = parse_timestamp(cell(record, columns, 'date')).date()
+    if cell(record, columns, 'weight').strip():
+        weight = parse_number(cell(record, columns, 'weight'))
+    else:
+        weight = parse_number(cell(record, columns, 'weight_lbs')) * LBS_TO_KG
+    if not 20 <= weight <= 400:
+        raise ValueError(f"implausible weight {weight:.1f} kg")
+    bodyfat = cell(record, columns, 'bodyfat').rstrip('% ')
+    bodyfat = in_range(parse_number(bodyfat), MAX_BODYFAT, 'body fat') if bodyfat else None
+    return user_id, day, round(weight, 2), bodyfat
+
+
+def read_batches(csv_file, batch_size):
+    reader = csv.DictReader(csv_file)
+    yield reader.fieldnames
+    line = 1
+    while True:
+        batch = list(islice(reader, batch_size))
+        if not batch:
+            return
+        yield [(line + i + 1, record) for i, record in enumerate(batch)]
+        line += len(batch)
+
+
+def write_load_file(rows):
+    # Temporary CSV in the layout load_food_items_file expects
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w', newline='', encoding='utf-8') as load_file:
+        csv.writer(load_file, lineterminator='\n').writerows(rows)
+    return path
+
+
+def import_csv(db_manager, user_id, path, kind='foods', batch_size=None, load_data=None, progress=None):
+    """
+    Import a CSV export of foods or body weights for user_id and return a summary dict:
+    rows imported, rows skipped, the first errors as (line, message) and the imported date range.
+    Invalid rows are skipped and reported; they never abort the import. A header without the required
+    columns raises ValueError before anything is written.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind {kind}, expected one of {', '.join(KINDS)}")
+    config = db_manager.db_config
+    batch_size = int(batch_size or config.get('import_batch_size', IMPORT_DEFAULTS['import_batch_size']))
+    if load_data is None:
+        load_data = config.get('import_load_data', IMPORT_DEFAULTS['import_load_data'])
+    load_data = bool(load_data) and kind == 'foods' and db_manager.supports_load_data
+    aliases, build_row = (FOOD_COLUMNS, food_row) if kind == 'foods' else (WEIGHT_COLUMNS, weight_row)
+
+    summary = {'rows': 0, 'skipped': 0, 'errors': [], 'first_day': None, 'last_day': None}
+    with open(path, 'r', newline='', encoding='utf-8-sig') as csv_file:
+        batches = read_batches(csv_file, batch_size)
+        columns = map_columns(next(batches), aliases, kind)
+        for batch in batches:
+            rows = []
+            for line, record in batch:
+                try:
+                    rows.append(build_row(user_id, record, columns))
+                except ValueError as e:
+                    summary['skipped'] += 1
+                    if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                        summary['errors'].append((line, str(e)))
+            if not rows:
+                continue
+            if kind == 'foods':
+                days = [row[-1][:10] for row in rows]
+                if load_data:
+                    load_path = write_load_file(rows)
+                    try:
+                        db_manager.load_food_items_file(load_path)
+                    finally:
+                        os.remove(load_path)
+                else:
+                    db_manager.import_food_items(rows)
+            else:
+                days = [row[1].isoformat() for row in rows]
+                db_manager.import_weight_logs(rows)
+            summary['rows'] += len(rows)
+            first_day, last_day = min(days), max(days)
+            summary['first_day'] = min(summary['first_day'] or first_day, first_day)
+            summary['last_day'] = max(summary['last_day'] or last_day, last_day)
+            if progress is not None:
+                progress(summary['rows'], summary['skipped'])
+
+    if kind == 'foods' and summary['rows']:
+        # One set-based recompute over the imported span instead of a daily_totals upsert per row
+        db_manager.rebuild_daily_totals(date.fromisoformat(summary['first_day']), date.fromisoformat(summary['last_day']),
+                                        user_id=user_id)
+    if summary['skipped']:
+        logging.warning(f"Import of {path} skipped {summary['skipped']} invalid row(s)")
+    return summary
@@ -0,0 +1,291 @@
+# Synthetic data and a concurrent load test for the data layer.
+# seed() fills the configured database (MySQL or the SQLite stand-in) with made-up users, food logs, plans,
+# workouts and chats at a chosen scale, using the same bulk paths as the importer. run() then replays the
+# screen flows of the app (login -> dashboard -> log food -> open plan, plus chat scrolling) from many threads,
+# optionally spread over several processes, and reports throughput, tail latency and pool wait per
+# DatabaseManager method from query_metrics.
+import json
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+import bcrypt
+
+from database import create_database_manager
+from query_metrics import LatencyHistogram, query_metrics
+
+# Seeded users are recognized by this username prefix, so load tests never pick real accounts
+USERNAME_PREFIX = 'loadtest_'
+PASSWORD = b'loadtest'
+
+FOODS = [
+    # label, kcal, protein, carbs, fats, fiber per portion
+    ('Oatmeal', 150, 5, 27, 3, 4), ('Scrambled eggs', 200, 14, 2, 15, 0), ('Chicken breast', 165, 31, 0, 4, 0),
+    ('Brown rice', 215, 5, 45, 2, 4), ('Greek yogurt', 100, 17, 6, 1, 0), ('Banana', 105, 1, 27, 0, 3),
+    ('Salmon fillet', 280, 39, 0, 13, 0), ('Broccoli', 55, 4, 11, 1, 5), ('Peanut butter toast', 290, 11, 30, 15, 4),
+    ('Protein shake', 160, 30, 5, 2, 1), ('Pasta bolognese', 520, 28, 62, 17, 5), ('Apple', 95, 0, 25, 0, 4),
+]
+EXERCISES = ['Bench Press', 'Squat', 'Deadlift', 'Overhead Press', 'Barbell Row', 'Pull Up', 'Lunge', 'Dips',
+             'Leg Press', 'Bicep Curl', 'Tricep Extension', 'Lat Pulldown']
+CHAT_LINES = ["How much protein should I eat?", "Is it fine to train legs twice a week?", "What should I eat before a workout?",
+              "Aim for around 1.6 to 2.2 g of protein per kg of body weight.", "Yes, as long as you recover well between sessions."]
+
+SEED_DEFAULTS = {
+    'users': 100,
+    'days': 90,
+    'foods_per_day': 4,
+    'chats_per_user': 40,
+    'plans_per_user': 2,
+    'sessions_per_user': 12,
+    'batch_size': 5000,
+}
+
+
+def seed(db_manager, users=SEED_DEFAULTS['users'], days=SEED_DEFAULTS['days'], foods_per_day=SEED_DEFAULTS['foods_per_day'],
+         chats_per_user=SEED_DEFAULTS['chats_per_user'], plans_per_user=SEED_DEFAULTS['plans_per_user'],
+         sessions_per_user=SEED_DEFAULTS['sessions_per_user'], batch_size=SEED_DEFAULTS['batch_size'], random_seed=0,
+         progress=None):
+    # Add `users` synthetic users with `days` days of history each and return their ids
+    rng = random.Random(random_seed)
+    hashed_password = bcrypt.hashpw(PASSWORD, bcrypt.gensalt(rounds=4)).decode('utf-8')
+    first_day = date.today() - timedelta(days=days - 1)
+    user_query = """
+    INSERT INTO userdata (id, username, email, password, gender, age, height, weight, goal, calories, timestamp)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    """
+    chat_query = "INSERT INTO chats (user_id, message, timestamp, sender) VALUES (%s, %s, %s, %s);"
+    user_ids = []
+    food_rows = []
+    chat_rows = []
+
+    def flush(force=False):
+        if food_rows and (force or len(food_rows) >= batch_size):
+            db_manager.import_food_items(food_rows)
+            food_rows.clear()
+        if chat_rows and (force or len(chat_rows) >= batch_size):
+            db_manager.execute_many(chat_query, chat_rows, commit=True)
+            chat_rows.clear()
+
+    for number in range(users):
+        user_id = str(uuid.uuid4())
+        user_ids.append(user_id)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        db_manager.execute_many(user_query, [(user_id, f"{USERNAME_PREFIX}{user_id[:8]}_{number}", f"{user_id[:8]}@example.com",
+                                              hashed_password, rng.choice(['Male', 'Female']), rng.randint(18, 65),
+                                              rng.randint(155, 200), rng.randint(50, 120), rng.choice(['Cut', 'Bulk', 'Maintain']),
+                                              rng.randint(1800, 3200), now)], commit=True)
+
+        for offset in range(days):
+            day = first_day + timedelta(days=offset)
+            for meal in range(rng.randint(max(1, foods_per_day - 2), foods_per_day + 2)):
+                label, kcal, protein, carbs, fats, fiber = rng.choice(FOODS)
+                portion = rng.choice([0.5, 1, 1, 1.5, 2])
+                logged_at = datetime(day.year, day.month, day.day, 7 + meal * 3 % 15, rng.randint(0, 59))
+                food_rows.append((user_id, label, round(kcal * portion), round(protein * portion, 2), round(carbs * portion, 2),
+                                  round(fats * portion, 2), round(fiber * portion, 2), portion, 100, 'serving',
+                                  logged_at.strftime("%Y-%m-%d %H:%M:%S")))
+
+        chat_start = datetime.combine(first_day, datetime.min.time())
+        for message in range(chats_per_user):
+            sent_at = chat_start + timedelta(minutes=message * days * 1440 // max(1, chats_per_user))
+            chat_rows.append((user_id, rng.choice(CHAT_LINES), sent_at.strftime("%Y-%m-%d %H:%M:%S"),
+                              'Human' if message % 2 == 0 else 'AI'))
+        flush()
+
+        for plan in range(plans_per_user):
+            workout_plan = {day_number: [{'name': name, 'sets': rng.randint(3, 5), 'reps': rng.choice([5, 8, 10, 12])}
+                                         for name in rng.sample(EXERCISES, 4)]
+                            for day_number in range(1, rng.randint(3, 5) + 1)}
+            db_manager.save_complete_workout_plan(user_id, f"Plan {plan + 1}", workout_plan)
+
+        for session in range(sessions_per_user):
+            performed_at = datetime.combine(first_day + timedelta(days=session * days // max(1, sessions_per_user)),
+                                            datetime.min.time()) + timedelta(hours=18)
+            sets = [{'name': name, 'set_no': set_no, 'weight': rng.randint(20, 140), 'reps': rng.randint(5, 12)}
+                    for name in rng.sample(EXERCISES, 3) for set_no in range(1, 4)]
+            db_manager.save_workout_session(user_id, sets, performed_at=performed_at.strftime("%Y-%m-%d %H:%M:%S"))
+
+        if progress is not None:
+            progress(number + 1, users)
+
+    flush(force=True)
+    # One set-based recompute of daily_totals for the whole seeded span
+    db_manager.rebuild_daily_totals(first_day, date.today())
+    return user_ids
+
+
+def seeded_users(db_manager, limit=None):
+    # (user_id, username) of the synthetic users
+    query = "SELECT id, username FROM userdata WHERE username LIKE %s ORDER BY id"
+    params = (USERNAME_PREFIX + '%',)
+    if limit:
+        query += " LIMIT %s"
+        params += (limit,)
+    return [tuple(row) for row in db_manager.execute_query(query + ";", params=params, fetch='all') or []]
+
+
+# Screen flows: each runs the DatabaseManager calls of one screen the way the app issues them
+
+def login_flow(db_manager, user_id, username, rng):
+    db_manager.get_user_by_username(username)
+    db_manager.get_user(user_id)
+    db_manager.warm_user_cache(user_id)
+
+
+def dashboard_flow(db_manager, user_id, username, rng):
+    today = date.today()
+    db_manager.get_daily_values(user_id, today)
+    db_manager.get_training_summary(user_id, today)
+    db_manager.get_workout_dates(user_id, today.replace(day=1), today)
+
+
+def log_food_flow(db_manager, user_id, username, rng):
+    label, kcal, protein, carbs, fats, fiber = rng.choice(FOODS)
+    db_manager.log_foods(user_id, [{'label': label, 'calories': kcal, 'protein': protein, 'carbs': carbs, 'fats': fats,
+                                    'fiber': fiber, 'portion_size': 1, 'selected_weight': 100, 'unit': 'serving'}])
+    db_manager.get_food_items(user_id, date.today().isoformat())
+
+
+def open_plan_flow(db_manager, user_id, username, rng):
+    plans = db_manager.load_workout_plans(user_id)
+    if plans:
+        days = rng.choice(list(plans.values()))
+        exercises = rng.choice(list(days.values()))
+        db_manager.get_previous_performance(user_id, [exercise['name'] for exercise in exercises])
+
+
+def chat_flow(db_manager, user_id, username, rng):
+    page = db_manager.get_chats_page(user_id, limit=30)
+    if page:
+        last = page[-1]
+        db_manager.get_chats_page(user_id, before_timestamp=last[3], before_chat_id=last[0], limit=30)
+
+
+FLOWS = {
+    'login': login_flow,
+    'dashboard': dashboard_flow,
+    'log_food': log_food_flow,
+    'open_plan': open_plan_flow,
+    'chat': chat_flow,
+}
+# A user session is login -> dashboard -> log food -> open plan; chat is mixed in at this share of sessions
+SESSION = ('login', 'dashboard', 'log_food', 'open_plan')
+CHAT_SHARE = 0.3
+
+
+def _run_threads(db_manager, users, threads, duration, think_time, random_seed):
+    # Returns ({flow: LatencyHistogram}, {flow: errors}, sessions completed)
+    flow_latency = {name: LatencyHistogram() for name in FLOWS}
+    flow_errors = {name: 0 for name in FLOWS}
+    sessions = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(number):
+        rng = random.Random(random_seed * 1000 + number)
+        while time.monotonic() < deadline:
+            user_id, username = rng.choice(users)
+            flows = SESSION + ('chat',) if rng.random() < CHAT_SHARE else SESSION
+            for name in flows:
+                start = time.perf_counter()
+                failed = False
+                try:
+                    FLOWS[name](db_manager, user_id, username, rng)
+                except db_manager.database_errors:
+                    failed = True
+                elapsed = time.perf_counter() - start
+                with lock:
+                    flow_latency[name].record(elapsed)
+                    flow_errors[name] += failed
+                if think_time:
+                    time.sleep(rng.uniform(0, 2 * think_time))
+            with lock:
+                sessions[0] += 1
+
+    workers = [threading.Thread(target=worker, args=(number,), name=f"loadtest-{number}") for number in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return flow_latency, flow_errors, sessions[0]
+
+
+def _process_worker(db_config, users, threads, duration, think_time, random_seed):
+    # Runs in a spawned child process with its own pool; histograms are returned raw so the parent can merge them
+    db_manager = create_database_manager(db_config)
+    query_metrics.reset()
+    flow_latency, flow_errors, sessions = _run_threads(db_manager, users, threads, duration, think_time, random_seed)
+    return flow_latency, flow_errors, sessions, query_metrics.histograms(), db_manager.connection_pool.stats()
+
+
+def run(db_config, threads=8, processes=1, duration=30, think_time=0.0, users=None, random_seed=0):
+    """
+    Drive the screen flows against the database for `duration` seconds from `threads` threads in each of
+    `processes` processes, and return a report dict (see format_report).
+    users is a list of (user_id, username) pairs and defaults to every seeded user.
+    """
+    db_manager = create_database_manager(db_config)
+    users = users or seeded_users(db_manager)
+    if not users:
+        raise ValueError("No seeded users found, run 'manage.py seed' first")
+
+    query_metrics.reset()
+    started = time.monotonic()
+    if processes <= 1:
+        flow_latency, flow_errors, sessions = _run_threads(db_manager, users, threads, duration, think_time, random_seed)
+        pools = [db_manager.connection_pool.stats()]
+    else:
+        # Spawned rather than forked: a forked child would inherit this process's shared pool (or SQLite
+        # connections) and every process would talk over the same sockets
+        with multiprocessing.get_context('spawn').Pool(processes) as process_pool:
+            results = process_pool.starmap(_process_worker, [(db_config, users, threads, duration, think_time, random_seed + number)
+                                                             for number in range(processes)])
+        flow_latency = {name: LatencyHistogram() for name in FLOWS}
+        flow_errors = {name: 0 for name in FLOWS}
+        sessions = 0
+        pools = []
+        for latency, errors, process_sessions, methods, pool in results:
+            for name in FLOWS:
+                flow_latency[name].merge(latency[name])
+                flow_errors[name] += errors[name]
+            sessions += process_sessions
+            query_metrics.merge(methods)
+            pools.append(pool)
+    elapsed = time.monotonic() - started
+
+    snapshot = query_metrics.snapshot()
+    methods = {}
+    for method, stats in snapshot['methods'].items():
+        methods[method] = {'per_second': round(stats['exec']['count'] / elapsed, 1), 'exec': stats['exec'],
+                           'wait': stats['wait'], 'errors': stats['errors']}
+    flows = {name: dict(flow_latency[name].summary(), per_second=round(flow_latency[name].count / elapsed, 1), errors=flow_errors[name])
+             for name in FLOWS if flow_latency[name].count}
+    return {
+        'threads': threads,
+        'processes': processes,
+        'users': len(users),
+        'seconds': round(elapsed, 1),
+        'sessions': sessions,
+        'sessions_per_second': round(sessions / elapsed, 1),
+        'flows': flows,
+        'methods': methods,
+        'pools': pools,
+    }
+
+
+def format_report(report):
+    lines = [f"{report['sessions']} sessions in {report['seconds']}s ({report['sessions_per_second']}/s) from "
+             f"{report['threads']} thread(s) x {report['processes']} process(es) over {report['users']} users", "",
+             f"{'flow':<12}{'/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}"]
+    for name, stats in report['flows'].items():
+        lines.append(f"{name:<12}{stats['per_second']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+                     f"{stats['max_ms']:>10}{stats['errors']:>8}")
+    lines += ["", f"{'method':<28}{'/s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'wait p95':>10}{'wait p99':>10}{'errors':>8}"]
+    for method, stats in sorted(report['methods'].items(), key=lambda item: -item[1]['exec']['p99_ms']):
+        lines.append(f"{method:<28}{stats['per_second']:>8}{stats['exec']['p50_ms']:>10}{stats['exec']['p95_ms']:>10}"
+                     f"{stats['exec']['p99_ms']:>10}{stats['wait']['p95_ms']:>10}{stats['wait']['p99_ms']:>10}{stats['errors']:>8}")
+    lines += ["", "pool: " + "; ".join(json.dumps(pool) for pool in report['pools'])]
+    return "\n".join(lines)
@@ -0,0 +1,176 @@
+# Maintenance commands for the Fitness App database, e.g.
+#   python manage.py migrate
+#   python manage.py rebuild-totals --start 2024-01-01 --end 2024-01-31
+#   python manage.py rebuild-stats
+#   python manage.py export --user <id> --out export/ --format csv
+#   python manage.py import --user <id> --kind foods mfp_export.csv
+#   python manage.py seed --users 10000 && python manage.py loadtest --threads 32 --duration 60
+import argparse
+import json
+from datetime import date
+
+import export
+import importer
+import loadtest
+import migrations
+from database import create_database_manager, load_db_config
+
+
+def migrate(args):
+    # Bring the schema up to date, or just list what would run with --list
+    db_manager = create_database_manager(load_db_config())
+    if args.list:
+        for version, description, _ in migrations.pending_migrations(db_manager):
+            print(f"{version}: {description}")
+        return
+    applied = migrations.migrate(db_manager, target=args.target)
+    print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema is up to date")
+
+
+def rebuild_totals(args):
+    # Recompute daily_totals from food_items for a date range, e.g. after fixing logged foods by hand
+    db_manager = create_database_manager(load_db_config())
+    db_manager.rebuild_daily_totals(args.start, args.end, user_id=args.user)
+    print(f"Rebuilt daily totals from {args.start} to {args.end}")
+
+
+def rebuild_stats(args):
+    # Recompute weekly_stats, exercise_stats and user_streaks from workout_sets
+    db_manager = create_database_manager(load_db_config())
+    users = db_manager.rebuild_training_stats(user_id=args.user)
+    print(f"Rebuilt training statistics for {users} user(s)")
+
+
+def parse_range(value):
+    # table=START:END, either side may be left empty
+    table, _, span = value.partition('=')
+    start, _, end = span.partition(':')
+    if table not in export.EXPORT_TABLES or not _:
+        raise argparse.ArgumentTypeError(f"expected TABLE=START:END with TABLE one of {', '.join(export.EXPORT_TABLES)}")
+    return table, (date.fromisoformat(start) if start else None, date.fromisoformat(end) if end else None)
+
+
+def export_history(args):
+    # Stream a user's history into one gzip file per table; rerunning after an interruption resumes it
+    db_manager = create_database_manager(load_db_config())
+    tables = args.tables or list(export.EXPORT_TABLES)
+    date_ranges = {table: (args.since, args.until) for table in tables}
+    date_ranges.update(dict(args.range))
+
+    def progress(table, rows):
+        print(f"\r{table}: {rows} rows", end='', flush=True)
+
+    exported = export.export_user_history(db_manager, args.user, args.out, fmt=args.format, tables=tables,
+                                          date_ranges=date_ranges, chunk_size=args.chunk_size, progress=progress,
+                                          restart=args.restart)
+    print()
+    for table, rows in exported.items():
+        print(f"{table}: {rows} rows")
+
+
+def import_history(args):
+    # Load a food or weight history CSV exported from another tracker
+    db_manager = create_database_manager(load_db_config())
+
+    def progress(rows, skipped):
+        print(f"\r{rows} rows imported, {skipped} skipped", end='', flush=True)
+
+    try:
+        summary = importer.import_csv(db_manager, args.user, args.path, kind=args.kind, batch_size=args.batch_size,
+                                      load_data=args.load_data, progress=progress)
+    except ValueError as e:
+        raise SystemExit(f"Can't import {args.path}: {e}")
+    print()
+    for line, error in summary['errors']:
+        print(f"line {line}: {error}")
+    if summary['rows']:
+        print(f"Imported {summary['rows']} rows from {summary['first_day']} to {summary['last_day']}")
+
+
+def seed(args):
+    # Fill the database with synthetic users and history for load testing
+    db_manager = create_database_manager(load_db_config())
+
+    def progress(done, total):
+        print(f"\r{done}/{total} users", end='', flush=True)
+
+    user_ids = loadtest.seed(db_manager, users=args.users, days=args.days, foods_per_day=args.foods_per_day,
+                             chats_per_user=args.chats_per_user, plans_per_user=args.plans_per_user,
+                             sessions_per_user=args.sessions_per_user, random_seed=args.random_seed, progress=progress)
+    print()
+    print(f"Seeded {len(user_ids)} users")
+
+
+def run_loadtest(args):
+    # Replay the app's screen flows concurrently and report latency per DatabaseManager method
+    report = loadtest.run(load_db_config(), threads=args.threads, processes=args.processes, duration=args.duration,
+                          think_time=args.think_time, random_seed=args.random_seed)
+    print(loadtest.format_report(report))
+    if args.json:
+        with open(args.json, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fitness App database maintenance")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help="apply pending schema migrations")
+    migrate_parser.add_argument('--target', type=int, help="stop after this migration version")
+    migrate_parser.add_argument('--list', action='store_true', help="only list pending migrations")
+    migrate_parser.set_defaults(func=migrate)
+
+    rebuild = subparsers.add_parser('rebuild-totals', help="recompute daily_totals for a date range")
+    rebuild.add_argument('--start', required=True, type=date.fromisoformat, help="first day (YYYY-MM-DD)")
+    rebuild.add_argument('--end', required=True, type=date.fromisoformat, help="last day (YYYY-MM-DD)")
+    rebuild.add_argument('--user', help="only rebuild this user id")
+    rebuild.set_defaults(func=rebuild_totals)
+
+    stats = subparsers.add_parser('rebuild-stats', help="recompute the training statistics from workout_sets")
+    stats.add_argument('--user', help="only rebuild this user id")
+    stats.set_defaults(func=rebuild_stats)
+
+    export_parser = subparsers.add_parser('export', help="export a user's history as gzipped JSONL or CSV")
+    export_parser.add_argument('--user', required=True, help="user id to export")
+    export_parser.add_argument('--out', required=True, help="directory for the exported files")
+    export_parser.add_argument('--format', choices=export.FORMATS, default='jsonl')
+    export_parser.add_argument('--tables', nargs='+', choices=list(export.EXPORT_TABLES), help="only export these tables")
+    export_parser.add_argument('--since', type=date.fromisoformat, help="first day to export (YYYY-MM-DD)")
+    export_parser.add_argument('--until', type=date.fromisoformat, help="last day to export (YYYY-MM-DD)")
+    export_parser.add_argument('--range', action='append', default=[], type=parse_range, metavar='TABLE=START:END',
+                               help="date range for one table, overrides --since/--until")
+    export_parser.add_argument('--chunk-size', type=int, default=1000, help="rows fetched and written per chunk")
+    export_parser.add_argument('--restart', action='store_true', help="ignore the checkpoint and export from scratch")
+    export_parser.set_defaults(func=export_history)
+
+    import_parser = subparsers.add_parser('import', help="import food or weight history from a CSV export")
+    import_parser.add_argument('path', help="CSV file to import")
+    import_parser.add_argument('--user', required=True, help="user id to import into")
+    import_parser.add_argument('--kind', choices=importer.KINDS, default='foods')
+    import_parser.add_argument('--batch-size', type=int, help="rows validated and inserted per batch")
+    import_parser.add_argument('--load-data', action='store_true', default=None,
+                               help="load batches with LOAD DATA LOCAL INFILE (MySQL only)")
+    import_parser.set_defaults(func=import_history)
+
+    seed_parser = subparsers.add_parser('seed', help="add synthetic users and history for load testing")
+    for option, default in loadtest.SEED_DEFAULTS.items():
+        if option != 'batch_size':
+            seed_parser.add_argument('--' + option.replace('_', '-'), type=int, default=default)
+    seed_parser.add_argument('--random-seed', type=int, default=0)
+    seed_parser.set_defaults(func=seed)
+
+    loadtest_parser = subparsers.add_parser('loadtest', help="run concurrent screen flows against the seeded users")
+    loadtest_parser.add_argument('--threads', type=int, default=8, help="worker threads per process")
+    loadtest_parser.add_argument('--processes', type=int, default=1)
+    loadtest_parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    loadtest_parser.add_argument('--think-time', type=float, default=0.0, help="mean pause between screens in seconds")
+    loadtest_parser.add_argument('--random-seed', type=int, default=0)
+    loadtest_parser.add_argument('--json', help="also write the report to this file")
+    loadtest_parser.set_defaults(func=run_loadtest)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
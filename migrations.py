@@ -0,0 +1,255 @@
+# Versioned schema migrations for the MySQL database, applied in order by `python manage.py migrate`.
+# Each migration is (version, description, steps) where a step is a SQL string or a callable that
+# receives the DatabaseManager. MySQL commits DDL implicitly, so every step is written to be safe to
+# re-run if a migration is interrupted before its version is recorded.
+import logging
+from datetime import datetime
+
+
+def index_exists(db_manager, table, index_name):
+    query = """
+    SELECT 1 FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1;
+    """
+    return db_manager.execute_query(query, params=(table, index_name), fetch='one') is not None
+
+
+def column_exists(db_manager, table, column):
+    query = """
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1;
+    """
+    return db_manager.execute_query(query, params=(table, column), fetch='one') is not None
+
+
+def add_index(table, index_name, columns, unique=False):
+    def step(db_manager):
+        if not index_exists(db_manager, table, index_name):
+            kind = "UNIQUE INDEX" if unique else "INDEX"
+            db_manager.execute_query(f"CREATE {kind} {index_name} ON {table} ({columns});")
+    return step
+
+
+def add_column(table, column, definition):
+    def step(db_manager):
+        if not column_exists(db_manager, table, column):
+            db_manager.execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition};")
+    return step
+
+
+def cascade_foreign_key(table, column, ref_table, ref_column):
+    # Recreate the foreign key on table.column with ON DELETE CASCADE. The original constraints were
+    # created unnamed, so the generated name is looked up in information_schema first.
+    def step(db_manager):
+        query = """
+        SELECT rc.constraint_name, rc.delete_rule
+        FROM information_schema.referential_constraints rc
+        JOIN information_schema.key_column_usage kcu
+            ON kcu.constraint_schema = rc.constraint_schema AND kcu.constraint_name = rc.constraint_name
+        WHERE rc.constraint_schema = DATABASE() AND kcu.table_name = %s AND kcu.column_name = %s
+            AND kcu.referenced_table_name = %s;
+        """
+        constraints = db_manager.execute_query(query, params=(table, column, ref_table), fetch='all') or []
+        if any(delete_rule == 'CASCADE' for name, delete_rule in constraints):
+            return
+        for name, delete_rule in constraints:
+            db_manager.execute_query(f"ALTER TABLE {table} DROP FOREIGN KEY {name};")
+        db_manager.execute_query(f"""
+        ALTER TABLE {table} ADD CONSTRAINT fk_{table}_{column} FOREIGN KEY ({column})
+        REFERENCES {ref_table} ({ref_column}) ON DELETE CASCADE;
+        """)
+    return step
+
+
+def dedupe_daily_totals(db_manager):
+    # Without a unique key, REPLACE INTO kept appending a new cumulative row per logged food.
+    # The largest value for each day is the latest aggregate, so collapse to that before adding the key.
+    if index_exists(db_manager, 'daily_totals', 'uq_daily_totals_user_date'):
+        return
+    db_manager.execute_query("""
+    CREATE TEMPORARY TABLE daily_totals_dedup AS
+    SELECT user_id, date, MAX(total_calories) AS total_calories, MAX(total_protein) AS total_protein,
+        MAX(total_fats) AS total_fats, MAX(total_carbs) AS total_carbs, MAX(daily_target) AS daily_target
+    FROM daily_totals GROUP BY user_id, date;
+    """)
+    db_manager.execute_query("DELETE FROM daily_totals;")
+    db_manager.execute_query("""
+    INSERT INTO daily_totals (user_id, date, total_calories, total_protein, total_fats, total_carbs, daily_target)
+    SELECT user_id, date, total_calories, total_protein, total_fats, total_carbs, daily_target FROM daily_totals_dedup;
+    """)
+    db_manager.execute_query("DROP TEMPORARY TABLE daily_totals_dedup;")
+
+
+def dedupe_exercises(db_manager):
+    # Point plan rows at the lowest id of each exercise name and drop the duplicates, so a unique
+    # index on Name can be added
+    if index_exists(db_manager, 'exercises', 'uq_exercises_name'):
+        return
+    db_manager.execute_query("""
+    UPDATE day_exercises de
+    JOIN exercises e ON e.ExerciseID = de.ExerciseID
+    JOIN (SELECT Name, MIN(ExerciseID) AS keep_id FROM exercises GROUP BY Name) k ON k.Name = e.Name
+    SET de.ExerciseID = k.keep_id
+    WHERE de.ExerciseID <> k.keep_id;
+    """)
+    db_manager.execute_query("""
+    DELETE e FROM exercises e
+    JOIN (SELECT Name, MIN(ExerciseID) AS keep_id FROM exercises GROUP BY Name) k ON k.Name = e.Name
+    WHERE e.ExerciseID <> k.keep_id;
+    """)
+
+
+MIGRATIONS = [
+    (1, "daily_totals: one row per user and day", [
+        dedupe_daily_totals,
+        add_index('daily_totals', 'uq_daily_totals_user_date', 'user_id, date', unique=True),
+    ]),
+    (2, "food_items: stored local_date column indexed with user_id", [
+        add_column('food_items', 'local_date', "DATE AS (DATE(timestamp)) STORED"),
+        add_index('food_items', 'idx_food_items_user_date', 'user_id, local_date'),
+    ]),
+    (3, "chats: newest-first history lookups by user", [
+        add_index('chats', 'idx_chats_user_time', 'user_id, timestamp, chat_id'),
+    ]),
+    (4, "workout plans: lookups by user and plan name", [
+        add_index('workout_plans', 'idx_workout_plans_user_name', 'user_id, plan_name'),
+        add_index('workout_days', 'idx_workout_days_plan_day', 'plan_id, day_number'),
+    ]),
+    (5, "exercises: unique name for bulk upserts", [
+        dedupe_exercises,
+        add_index('exercises', 'uq_exercises_name', 'Name', unique=True),
+    ]),
+    (6, "workout plans: deleting a plan cascades to its days and exercises", [
+        cascade_foreign_key('workout_days', 'plan_id', 'workout_plans', 'plan_id'),
+        cascade_foreign_key('day_exercises', 'day_id', 'workout_days', 'day_id'),
+    ]),
+    (7, "applied_writes: idempotency keys of writes replayed from the outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS applied_writes (
+            idempotency_key CHAR(36) PRIMARY KEY,
+            applied_at DATETIME
+        );
+        """,
+    ]),
+    (8, "workout_sets: set-level workout history", [
+        """
+        CREATE TABLE IF NOT EXISTS workout_sets (
+            set_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            session_id CHAR(36) NOT NULL,
+            user_id CHAR(36) NOT NULL,
+            exercise_id INT NOT NULL,
+            set_no SMALLINT NOT NULL,
+            weight DECIMAL(6,2),
+            reps SMALLINT,
+            e1rm DECIMAL(6,1),
+            timestamp DATETIME NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES userdata(id),
+            FOREIGN KEY (exercise_id) REFERENCES exercises(ExerciseID)
+        );
+        """,
+        add_index('workout_sets', 'idx_workout_sets_user_exercise_time', 'user_id, exercise_id, timestamp'),
+    ]),
+    (9, "training statistics per week, per exercise and streaks", [
+        """
+        CREATE TABLE IF NOT EXISTS weekly_stats (
+            user_id CHAR(36) NOT NULL,
+            week_start DATE NOT NULL,
+            sessions INT NOT NULL,
+            sets INT NOT NULL,
+            reps INT NOT NULL,
+            volume DECIMAL(12,2) NOT NULL,
+            days_mask TINYINT UNSIGNED NOT NULL,
+            PRIMARY KEY (user_id, week_start),
+            FOREIGN KEY (user_id) REFERENCES userdata(id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS exercise_stats (
+            user_id CHAR(36) NOT NULL,
+            exercise_id INT NOT NULL,
+            sessions INT NOT NULL,
+            sets INT NOT NULL,
+            volume DECIMAL(14,2) NOT NULL,
+            best_weight DECIMAL(6,2) NOT NULL,
+            best_e1rm DECIMAL(6,1) NOT NULL,
+            best_e1rm_at DATETIME,
+            last_performed DATETIME,
+            PRIMARY KEY (user_id, exercise_id),
+            FOREIGN KEY (user_id) REFERENCES userdata(id),
+            FOREIGN KEY (exercise_id) REFERENCES exercises(ExerciseID)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_streaks (
+            user_id CHAR(36) PRIMARY KEY,
+            current_streak INT NOT NULL,
+            longest_streak INT NOT NULL,
+            last_week DATE NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES userdata(id)
+        );
+        """,
+    ]),
+    (10, "food_items: surrogate key so exports can resume after the last row written", [
+        add_column('food_items', 'food_item_id', "BIGINT AUTO_INCREMENT PRIMARY KEY FIRST"),
+    ]),
+    (11, "weight_logs: one body weight entry per user and day", [
+        """
+        CREATE TABLE IF NOT EXISTS weight_logs (
+            user_id CHAR(36) NOT NULL,
+            date DATE NOT NULL,
+            weight DECIMAL(5,2) NOT NULL,
+            bodyfat DECIMAL(4,2),
+            PRIMARY KEY (user_id, date),
+            FOREIGN KEY (user_id) REFERENCES userdata(id)
+        );
+        """,
+    ]),
+    (12, "applied_writes: expire old idempotency keys by applied_at", [
+        add_index('applied_writes', 'idx_applied_writes_applied_at', 'applied_at'),
+    ]),
+]
+
+
+def ensure_migrations_table(db_manager):
+    db_manager.execute_query("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255),
+        applied_at DATETIME
+    );
+    """, commit=True)
+
+
+def applied_versions(db_manager):
+    ensure_migrations_table(db_manager)
+    rows = db_manager.execute_query("SELECT version FROM schema_migrations;", fetch='all')
+    return {row[0] for row in rows}
+
+
+def pending_migrations(db_manager):
+    if db_manager.manages_own_schema:
+        return []
+    applied = applied_versions(db_manager)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def migrate(db_manager, target=None):
+    # Apply every pending migration up to `target` (all of them by default) and return their versions
+    if db_manager.manages_own_schema:
+        return []
+    applied = []
+    for version, description, steps in pending_migrations(db_manager):
+        if target is not None and version > target:
+            break
+        logging.info(f"Applying migration {version}: {description}")
+        # One unit of work per migration so temporary tables survive between its steps
+        with db_manager.transaction():
+            for step in steps:
+                if callable(step):
+                    step(db_manager)
+                else:
+                    db_manager.execute_query(step)
+            db_manager.execute_query("INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s);",
+                                     params=(version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+        applied.append(version)
+    return applied
@@ -0,0 +1,177 @@
+# Client for the Edamam food database API.
+# One requests.Session per process keeps TLS connections to the API alive between searches. Every request has
+# separate connect and read timeouts, 429 and 5xx responses are retried with jittered exponential backoff, and
+# a circuit breaker stops calling the API for a while after repeated failures so searches fail fast instead of
+# stacking up behind a degraded upstream.
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from query_metrics import LatencyHistogram
+
+EDAMAM_PARSER_URL = 'https://api.edamam.com/api/food-database/v2/parser'
+
+
+class NutritionAPIError(Exception):
+    """The food database could not be reached or answered with an error."""
+
+
+class CircuitOpenError(NutritionAPIError):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After failure_threshold consecutive failures it opens and rejects calls for
+    reset_timeout seconds, then lets a single trial call through (half open): success closes it again,
+    failure reopens it.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.opens = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self.opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    self.opens += 1
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+
+class EdamamClient:
+    CONNECT_TIMEOUT = 3.05
+    READ_TIMEOUT = 8.0
+    MAX_RETRIES = 2
+    BASE_BACKOFF = 0.25
+    MAX_BACKOFF = 4.0
+    RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, app_id=None, app_key=None, pool_size=4, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, breaker=None):
+        self.app_id = app_id or os.getenv("EDAMAM_APP_ID")
+        self.app_key = app_key or os.getenv("EDAMAM_APP_KEY")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        # Retries are done here rather than by urllib3 so they share the backoff and breaker logic
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.retries = 0
+        self.errors = {}
+        self.short_circuits = 0
+
+    def search(self, query, **params):
+        # Parsed JSON of the parser endpoint for a free-text query
+        params = dict({'app_id': self.app_id, 'app_key': self.app_key, 'ingr': query, 'nutrition-type': 'logging'}, **params)
+        return self.get_json(EDAMAM_PARSER_URL, params=params)
+
+    def get_json(self, url, params=None):
+        if not self.breaker.allow():
+            with self._lock:
+                self.short_circuits += 1
+            raise CircuitOpenError("Food database temporarily unavailable")
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._record(start, type(e).__name__)
+                error, retry_after = NutritionAPIError(f"Food database request failed: {e}"), None
+            else:
+                if response.status_code == 200:
+                    self._record(start, None)
+                    self.breaker.record_success()
+                    return response.json()
+                self._record(start, str(response.status_code))
+                error = NutritionAPIError(f"Food database answered {response.status_code}")
+                if response.status_code not in self.RETRY_STATUSES:
+                    # The request itself is wrong (bad key, bad query); the upstream is healthy
+                    self.breaker.record_success()
+                    raise error
+                retry_after = response.headers.get('Retry-After')
+            if attempt >= self.max_retries:
+                self.breaker.record_failure()
+                raise error
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            time.sleep(self._backoff(attempt, retry_after))
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full jitter, so clients that failed together don't retry together; Retry-After wins when sent
+        if retry_after is not None:
+            try:
+                return min(self.MAX_BACKOFF, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.MAX_BACKOFF, self.BASE_BACKOFF * 2 ** attempt))
+
+    def _record(self, start, error):
+        with self._lock:
+            self.requests += 1
+            self.latency.record(time.perf_counter() - start)
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+        if error is not None:
+            logging.warning(f"Edamam request failed: {error}")
+
+    def stats(self):
+        with self._lock:
+            return dict(self.latency.summary(), requests=self.requests, retries=self.retries, errors=dict(self.errors),
+                        short_circuits=self.short_circuits, breaker=self.breaker.state, breaker_opens=self.breaker.opens)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_nutrition_client():
+    # Created on first search, so the session is shared by every screen
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = EdamamClient()
+    return _client
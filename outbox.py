@@ -0,0 +1,248 @@
+# Durable write-behind outbox. Screens append writes to a local SQLite journal, which takes microseconds and
+# survives restarts, and a background flusher replays them to the database in order, each user's due entries
+# in one transaction. Every entry carries an idempotency key that DatabaseManager.apply_outbox_writes records
+# in applied_writes, so an entry replayed after a crash between applying and removing it is not applied twice.
+# Entries are given up after Outbox.MAX_AGE, which is what lets older keys be pruned from applied_writes.
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from database import OUTBOX_DEFAULTS
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    method TEXT NOT NULL,
+    args TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    dead INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+class ExpiredWriteError(Exception):
+    """The entry was still unsent after Outbox.MAX_AGE; its idempotency key may be gone, so it isn't replayed."""
+
+
+class Outbox:
+    """
+    Local journal of pending writes plus the thread that flushes it.
+    Entries for the same user are applied strictly in the order they were enqueued: when one fails to reach
+    the database, the user's later entries wait for its retry. Other users' entries carry on. An entry the
+    database rejects (constraint violation, bad data) would fail on every retry, so it is marked dead instead.
+    """
+    # DatabaseManager methods that may be journaled; each takes user_id as its first argument
+    METHODS = ('log_foods', 'insert_chat', 'save_complete_workout_plan', 'save_workout_session')
+    BASE_BACKOFF = 1.0
+    MAX_BACKOFF = 300.0
+    # Entries older than this are marked dead instead of replayed. Keys in applied_writes are kept a day
+    # longer (local clock and DST slack), so every entry that may still be replayed finds its key.
+    MAX_AGE = 30 * 24 * 3600
+    KEY_RETENTION = MAX_AGE + 24 * 3600
+    PRUNE_INTERVAL = 3600
+
+    def __init__(self, db_manager, path=OUTBOX_DEFAULTS['outbox_path'], batch_size=OUTBOX_DEFAULTS['outbox_batch_size'],
+                 dispatch=None):
+        self.db_manager = db_manager
+        self.batch_size = batch_size
+        self.dispatch = dispatch or (lambda callback: callback())
+        self._listeners = []
+        self._failure_listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pruned_at = None
+        self._journal = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._journal.execute("PRAGMA journal_mode=WAL;")
+        self._journal.execute("PRAGMA synchronous=NORMAL;")
+        self._journal.executescript(JOURNAL_SCHEMA)
+
+    def enqueue(self, method, user_id, *args):
+        # Append a call of db_manager.<method>(user_id, *args) to the journal and return its idempotency key
+        if method not in self.METHODS:
+            raise ValueError(f"{method} can't be written through the outbox")
+        key = str(uuid.uuid4())
+        with self._lock:
+            self._journal.execute("INSERT INTO outbox (idempotency_key, user_id, method, args, created_at) VALUES (?, ?, ?, ?, ?);",
+                                  (key, user_id, method, json.dumps(args, default=str), time.time()))
+        self._wake.set()
+        return key
+
+    def add_listener(self, callback):
+        # callback(method, user_id, key) is dispatched after each entry reaches the database
+        self._listeners.append(callback)
+
+    def add_failure_listener(self, callback):
+        # callback(method, user_id, key, error) is dispatched when an entry is marked dead
+        self._failure_listeners.append(callback)
+
+    def pending(self, user_id=None):
+        query = "SELECT COUNT(*) FROM outbox WHERE dead = 0"
+        params = ()
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params = (user_id,)
+        with self._lock:
+            return self._journal.execute(query + ";", params).fetchone()[0]
+
+    def pending_writes(self, method, user_id):
+        # Arguments after user_id of the user's entries for method that are still waiting, oldest first
+        with self._lock:
+            rows = self._journal.execute("SELECT args FROM outbox WHERE dead = 0 AND method = ? AND user_id = ? ORDER BY seq;",
+                                         (method, user_id)).fetchall()
+        return [json.loads(args) for (args,) in rows]
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="outbox-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        # Entries still pending stay in the journal and are replayed on the next start
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                delay = self.flush()
+            except Exception as e:
+                logging.error(f"Outbox flush failed: {e}")
+                delay = self.BASE_BACKOFF
+            # Sleep until the next retry is due or a new entry arrives
+            self._wake.wait(delay)
+
+    def flush(self):
+        # Apply every due entry and return the seconds until the next retry is due. Entries are read a batch
+        # at a time, and each user's consecutive due entries of a batch are applied in one transaction.
+        self._prune_applied_keys()
+        blocked_users = set()
+        next_due = None
+        last_seq = 0
+        while not self._stopping:
+            with self._lock:
+                entries = self._journal.execute("""
+                SELECT seq, idempotency_key, user_id, method, args, attempts, next_attempt_at, created_at FROM outbox
+                WHERE dead = 0 AND seq > ? ORDER BY seq LIMIT ?;
+                """, (last_seq, self.batch_size)).fetchall()
+            if not entries:
+                break
+            last_seq = entries[-1][0]
+            now = time.time()
+            runs = {}
+            for seq, key, user_id, method, args, attempts, next_attempt_at, created_at in entries:
+                if user_id in blocked_users:
+                    continue
+                if next_attempt_at > now:
+                    # Waiting out a backoff; later entries of this user must wait behind it
+                    blocked_users.add(user_id)
+                    next_due = next_attempt_at if next_due is None else min(next_due, next_attempt_at)
+                elif now - created_at > self.MAX_AGE:
+                    self._mark_dead(seq, key, user_id, method, ExpiredWriteError(f"unsent for more than {self.MAX_AGE // 86400} days"))
+                else:
+                    runs.setdefault(user_id, []).append((seq, key, user_id, method, json.loads(args), attempts))
+            for user_id, run in runs.items():
+                next_attempt_at = self._apply_run(run)
+                if next_attempt_at is not None:
+                    blocked_users.add(user_id)
+                    next_due = next_attempt_at if next_due is None else min(next_due, next_attempt_at)
+        return None if next_due is None else max(0.0, next_due - time.time())
+
+    def _apply_run(self, run):
+        # Apply one user's consecutive entries in a single transaction. Returns None once they are done with,
+        # or the time the first one's retry is due.
+        if len(run) == 1:
+            return self._apply(*run[0])
+        try:
+            self.db_manager.apply_outbox_writes([(key, method, [user_id] + args) for seq, key, user_id, method, args, attempts in run])
+        except self.db_manager.permanent_errors as e:
+            # One of the entries is rejected; apply them one at a time so only that one is marked dead
+            logging.warning(f"Outbox batch of {len(run)} writes failed, applying them one by one: {e}")
+            return self._apply_each(run)
+        except self.db_manager.database_errors as e:
+            # Nothing was applied; the first entry waits out the backoff and the rest wait behind it
+            seq, key, user_id, method, args, attempts = run[0]
+            return self._retry_later(seq, attempts, e)
+        except Exception as e:
+            logging.warning(f"Outbox batch of {len(run)} writes failed, applying them one by one: {e}")
+            return self._apply_each(run)
+        with self._lock:
+            self._journal.execute(f"DELETE FROM outbox WHERE seq IN ({', '.join(['?'] * len(run))});",
+                                  [entry[0] for entry in run])
+        for seq, key, user_id, method, args, attempts in run:
+            self._notify_applied(method, user_id, key)
+        return None
+
+    def _apply_each(self, run):
+        for entry in run:
+            next_attempt_at = self._apply(*entry)
+            if next_attempt_at is not None:
+                return next_attempt_at
+        return None
+
+    def _apply(self, seq, key, user_id, method, args, attempts):
+        # Returns None once the entry is done with, or the time its retry is due
+        try:
+            self.db_manager.apply_outbox_write(key, method, [user_id] + args)
+        except self.db_manager.permanent_errors as e:
+            # Rejected by the database, e.g. a foreign key to a user that doesn't exist: no retry will succeed
+            return self._mark_dead(seq, key, user_id, method, e)
+        except self.db_manager.database_errors as e:
+            return self._retry_later(seq, attempts, e)
+        except Exception as e:
+            # The entry itself is bad
+            return self._mark_dead(seq, key, user_id, method, e)
+        with self._lock:
+            self._journal.execute("DELETE FROM outbox WHERE seq = ?;", (seq,))
+        self._notify_applied(method, user_id, key)
+        return None
+
+    def _retry_later(self, seq, attempts, error):
+        # The server is unreachable or busy: retry with exponential backoff and jitter
+        backoff = min(self.MAX_BACKOFF, self.BASE_BACKOFF * 2 ** attempts) * random.uniform(0.5, 1.0)
+        next_attempt_at = time.time() + backoff
+        with self._lock:
+            self._journal.execute("UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ? WHERE seq = ?;",
+                                  (next_attempt_at, str(error), seq))
+        return next_attempt_at
+
+    def _notify_applied(self, method, user_id, key):
+        for listener in self._listeners:
+            self.dispatch(lambda listener=listener: listener(method, user_id, key))
+
+    def _prune_applied_keys(self):
+        # Expire idempotency keys no replay can need any more, at most once per PRUNE_INTERVAL
+        if self._pruned_at is not None and time.monotonic() - self._pruned_at < self.PRUNE_INTERVAL:
+            return
+        try:
+            self.db_manager.prune_applied_writes(datetime.now() - timedelta(seconds=self.KEY_RETENTION))
+        except self.db_manager.database_errors as e:
+            logging.warning(f"Couldn't expire old outbox keys: {e}")
+            return
+        self._pruned_at = time.monotonic()
+
+    def _mark_dead(self, seq, key, user_id, method, error):
+        # Park the entry so it doesn't hold up the user's later writes; it stays in the journal for inspection
+        logging.error(f"Outbox entry {key} ({method}) can't be applied: {error}")
+        with self._lock:
+            self._journal.execute("UPDATE outbox SET attempts = attempts + 1, dead = 1, last_error = ? WHERE seq = ?;",
+                                  (str(error), seq))
+        for listener in self._failure_listeners:
+            self.dispatch(lambda listener=listener: listener(method, user_id, key, error))
+        return None
@@ -0,0 +1,89 @@
+# Opt-in read-through cache for DatabaseManager reads.
+# Entries are keyed by (query, params, fetch), expire after a per-query TTL, are evicted least recently used
+# first, and are tagged with the tables the query reads so a write to any of them drops the entry.
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Table names following FROM/JOIN in a read, and the table a write statement modifies
+READ_TABLES = re.compile(r"\b(?:from|join)\s+`?(\w+)`?", re.IGNORECASE)
+WRITE_TABLE = re.compile(r"^\s*(?:insert\s+(?:ignore\s+)?into|replace\s+into|update|delete\s+from)\s+`?(\w+)`?", re.IGNORECASE)
+
+
+def read_tables(query):
+    return frozenset(table.lower() for table in READ_TABLES.findall(query))
+
+
+def write_table(query):
+    match = WRITE_TABLE.match(query)
+    return match.group(1).lower() if match else None
+
+
+class QueryCache:
+    def __init__(self, max_entries=256, default_ttl=30):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, tags, value)
+        self._keys_by_tag = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, so a read that raced a write is not stored
+        self.version = 0
+
+    def get(self, key):
+        # Returns (True, value) on a hit and (False, None) on a miss
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[2]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, tags, ttl=None, version=None):
+        # Pass the version read before running the query; the value is dropped if a write happened since
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, tags, value)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            self.version += 1
+            for tag in tags:
+                for key in self._keys_by_tag.pop(tag, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+
+    def _remove(self, key):
+        expires_at, tags, value = self._entries.pop(key)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations}
@@ -0,0 +1,178 @@
+# Per-method latency histograms and a slow-query log for DatabaseManager.
+# Every execute_query/execute_many call is recorded under the name of the DatabaseManager method that
+# issued it, with the time spent waiting for a pooled connection kept apart from execution time.
+import copy
+import json
+import logging
+import math
+import threading
+from collections import deque
+from datetime import datetime
+
+
+class LatencyHistogram:
+    """
+    Fixed-size histogram with log-spaced buckets from 10 microseconds to about 100 seconds.
+    Percentiles are read back as the upper edge of their bucket, i.e. within 10% of the true value,
+    and memory stays constant however many samples are recorded.
+    """
+    MIN_SECONDS = 0.00001
+    GROWTH = 1.1
+    BUCKETS = 170
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds <= self.MIN_SECONDS:
+            index = 0
+        else:
+            index = min(self.BUCKETS, int(math.log(seconds / self.MIN_SECONDS, self.GROWTH)) + 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.max, self.MIN_SECONDS * self.GROWTH ** index)
+        return self.max
+
+    def merge(self, other):
+        # Fold in a histogram recorded elsewhere, e.g. by another load-test process
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self):
+        # Milliseconds, rounded for reading in a dump file
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(50) * 1000, 3),
+            'p95_ms': round(self.percentile(95) * 1000, 3),
+            'p99_ms': round(self.percentile(99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+
+class QueryMetrics:
+    def __init__(self, slow_query_ms=200, slow_log_size=200):
+        self.slow_query_ms = slow_query_ms
+        self.explain_slow_queries = False
+        self._lock = threading.Lock()
+        self._methods = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        self._dump_timer = None
+        self._dump_stopped = None
+
+    def configure(self, slow_query_ms=None, explain_slow_queries=None):
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        if explain_slow_queries is not None:
+            self.explain_slow_queries = explain_slow_queries
+
+    def record(self, method, wait_seconds, exec_seconds, failed=False):
+        with self._lock:
+            stats = self._methods.get(method)
+            if stats is None:
+                stats = self._methods[method] = {'wait': LatencyHistogram(), 'exec': LatencyHistogram(), 'errors': 0}
+            stats['wait'].record(wait_seconds)
+            stats['exec'].record(exec_seconds)
+            if failed:
+                stats['errors'] += 1
+
+    def is_slow(self, exec_seconds):
+        return self.slow_query_ms is not None and exec_seconds * 1000 >= self.slow_query_ms
+
+    def log_slow_query(self, method, query, params, exec_seconds, explain=None):
+        entry = {
+            'at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'method': method,
+            'exec_ms': round(exec_seconds * 1000, 3),
+            'query': ' '.join(query.split()),
+            'params': repr(params)[:500],
+            'explain': explain,
+        }
+        with self._lock:
+            self.slow_queries.append(entry)
+
+    def snapshot(self):
+        with self._lock:
+            methods = {method: {'exec': stats['exec'].summary(), 'wait': stats['wait'].summary(), 'errors': stats['errors']}
+                       for method, stats in self._methods.items()}
+            slow_queries = list(self.slow_queries)
+        return {'taken_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'methods': methods, 'slow_queries': slow_queries}
+
+    def histograms(self):
+        # Picklable copy of the raw per-method histograms, to be merged into another process's QueryMetrics
+        with self._lock:
+            return copy.deepcopy(self._methods)
+
+    def merge(self, methods):
+        with self._lock:
+            for method, other in methods.items():
+                stats = self._methods.get(method)
+                if stats is None:
+                    stats = self._methods[method] = {'wait': LatencyHistogram(), 'exec': LatencyHistogram(), 'errors': 0}
+                stats['wait'].merge(other['wait'])
+                stats['exec'].merge(other['exec'])
+                stats['errors'] += other['errors']
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self.slow_queries.clear()
+
+    def dump(self, path, extra=None):
+        # One JSON snapshot per line, so a file collected over a session can be diffed between runs
+        snapshot = self.snapshot()
+        if extra:
+            snapshot.update(extra)
+        with open(path, 'a') as dump_file:
+            dump_file.write(json.dumps(snapshot, default=str) + '\n')
+
+    def start_periodic_dump(self, path, interval=60, extra=None):
+        # extra is a callable returning more fields for each snapshot, e.g. pool statistics
+        # A failed dump (full disk, a broken extra callable) is logged and the next one still runs
+        stopped = threading.Event()
+
+        def run():
+            try:
+                self.dump(path, extra() if extra else None)
+            except Exception:
+                logging.exception(f"Error dumping query metrics to {path}")
+            finally:
+                if not stopped.is_set():
+                    schedule()
+
+        def schedule():
+            self._dump_timer = threading.Timer(interval, run)
+            self._dump_timer.daemon = True
+            self._dump_timer.start()
+
+        self.stop_periodic_dump()
+        self._dump_stopped = stopped
+        schedule()
+
+    def stop_periodic_dump(self):
+        if self._dump_stopped is not None:
+            self._dump_stopped.set()
+            self._dump_stopped = None
+        if self._dump_timer is not None:
+            self._dump_timer.cancel()
+            self._dump_timer = None
+
+
+# Shared by every DatabaseManager in the process
+query_metrics = QueryMetrics()
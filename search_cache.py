@@ -0,0 +1,278 @@
+# Two-tier cache for food search results.
+# Edamam hints are slimmed to the fields FoodSearch.unpack_food_data reads and the first result page of a query
+# is stored under the normalized query, with whether more pages follow: first in an in-memory LRU, then in a
+# size-bounded SQLite file that survives restarts. Concurrent lookups of the same query share one upstream
+# request, upstream calls are capped per minute, and when the API is down or the cap is reached an expired
+# entry is served rather than nothing. Later pages are fetched on demand and not cached. Edamam's link to the
+# next page is bound to its search session and soon expires, so it is only kept in memory for LINK_TTL.
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+from nutrition_client import NutritionAPIError, get_nutrition_client
+
+NUTRIENT_KEYS = ('ENERC_KCAL', 'CHOCDF', 'PROCNT', 'FAT', 'FIBTG')
+
+# Bumped whenever the stored page format changes; a cache file of another version is emptied on open
+DISK_VERSION = 2
+
+# Stands in for the next-page link of a cached page whose link has expired; see FoodSearchCache.next_page
+REFRESH_PREFIX = 'refresh:'
+
+DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    query TEXT PRIMARY KEY,
+    page TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache (accessed_at);
+"""
+
+
+class RateLimitedError(NutritionAPIError):
+    """The per-minute cap on upstream searches was reached and nothing is cached for the query."""
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def slim_page(data):
+    # {'hints': slimmed hints, 'next': URL of the next result page or None}
+    next_link = ((data.get('_links') or {}).get('next') or {}).get('href')
+    return {'hints': slim_hints(data), 'next': next_link}
+
+
+def slim_hints(data):
+    # Keep label, the five nutrients and the measures' label/weight of each hint; the rest of the payload
+    # (images, categories, qualified measures, ...) is most of its size and never read
+    hints = []
+    for hint in data.get('hints') or []:
+        food = hint.get('food')
+        if not isinstance(food, dict):
+            continue
+        nutrients = food.get('nutrients') or {}
+        hints.append({
+            'food': {'label': food.get('label', ''),
+                     'nutrients': {key: nutrients[key] for key in NUTRIENT_KEYS if key in nutrients}},
+            'measures': [{'label': measure.get('label'), 'weight': measure.get('weight')}
+                         for measure in hint.get('measures') or [] if 'weight' in measure],
+        })
+    return hints
+
+
+class DiskStore:
+    """SQLite table of query -> stored page JSON ({'hints', 'more'}), trimmed to max_bytes by least recent access."""
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute("PRAGMA synchronous=NORMAL;")
+        if self._db.execute("PRAGMA user_version;").fetchone()[0] != DISK_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS search_cache;")
+            self._db.execute(f"PRAGMA user_version = {DISK_VERSION};")
+        self._db.executescript(DISK_SCHEMA)
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM search_cache;").fetchone()[0]
+
+    def get(self, query):
+        # Returns (page, stored_at) or None
+        with self._lock:
+            row = self._db.execute("SELECT page, stored_at FROM search_cache WHERE query = ?;", (query,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE search_cache SET accessed_at = ? WHERE query = ?;", (time.time(), query))
+        return json.loads(row[0]), row[1]
+
+    def put(self, query, page, stored_at):
+        payload = json.dumps(page, separators=(',', ':'))
+        with self._lock:
+            old = self._db.execute("SELECT size FROM search_cache WHERE query = ?;", (query,)).fetchone()
+            self._db.execute("REPLACE INTO search_cache (query, page, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?);",
+                             (query, payload, len(payload), stored_at, time.time()))
+            self.size += len(payload) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self._trim()
+
+    def _trim(self):
+        # Drop the least recently used entries until the store is back under 90% of max_bytes
+        target = self.max_bytes * 0.9
+        for query, size in self._db.execute("SELECT query, size FROM search_cache ORDER BY accessed_at;").fetchall():
+            if self.size <= target:
+                break
+            self._db.execute("DELETE FROM search_cache WHERE query = ?;", (query,))
+            self.size -= size
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM search_cache;")
+            self.size = 0
+
+
+class FoodSearchCache:
+    MEMORY_ENTRIES = 256
+    DISK_MAX_BYTES = 20 * 1024 * 1024
+    TTL = 7 * 24 * 3600
+    LINK_TTL = 300
+    UPSTREAM_PER_MINUTE = 60
+
+    def __init__(self, fetch, fetch_url=None, path='search_cache.db', memory_entries=MEMORY_ENTRIES,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl=TTL, upstream_per_minute=UPSTREAM_PER_MINUTE):
+        # fetch(query) returns the raw API response for a query, fetch_url(url) the response for a next-page link
+        self.fetch = fetch
+        self.fetch_url = fetch_url
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.upstream_per_minute = upstream_per_minute
+        self.disk = DiskStore(path, disk_max_bytes)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # query -> ({'hints', 'more'}, stored_at)
+        self._links = OrderedDict()  # query -> (next-page link, fetched_at), never written to disk
+        self._in_flight = {}  # query -> (Event, result holder)
+        self._upstream_calls = deque()
+        self.stats_counts = {'memory_hits': 0, 'disk_hits': 0, 'upstream': 0, 'shared': 0, 'stale': 0, 'rate_limited': 0}
+
+    def lookup(self, query):
+        # First result page of query ({'hints', 'next'}), from memory, disk or the API
+        key = normalize_query(query)
+        if not key:
+            return {'hints': [], 'next': None}
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            fresh = entry is not None and now - entry[1] < self.ttl
+            if fresh:
+                self._memory.move_to_end(key)
+                self.stats_counts['memory_hits'] += 1
+        if fresh:
+            return self._page(key, entry[0])
+        entry = self.disk.get(key)
+        if entry is not None and now - entry[1] < self.ttl:
+            self._remember(key, *entry)
+            with self._lock:
+                self.stats_counts['disk_hits'] += 1
+            return self._page(key, entry[0])
+        return self._page(key, self._fetch_once(key, stale=entry))
+
+    def _page(self, key, stored):
+        # The stored page with the next-page link while it is fresh, or a refresh token when the link has
+        # expired or was never kept (a page from disk)
+        with self._lock:
+            link = self._links.get(key)
+        if link is not None and time.time() - link[1] < self.LINK_TTL:
+            next_link = link[0]
+        else:
+            next_link = REFRESH_PREFIX + key if stored['more'] else None
+        return {'hints': stored['hints'], 'next': next_link}
+
+    def _fetch_once(self, key, stale=None):
+        # Single flight: the first caller for a query fetches it, concurrent callers wait for that result
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = (threading.Event(), {})
+            else:
+                self.stats_counts['shared'] += 1
+        done, result = flight
+        if not leader:
+            done.wait()
+            if 'error' in result:
+                raise result['error']
+            return result['page']
+        try:
+            result['page'] = self._fetch(key, stale)
+            return result['page']
+        except Exception as e:
+            result['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            done.set()
+
+    def _fetch(self, key, stale):
+        try:
+            self._take_upstream_slot()
+            with self._lock:
+                self.stats_counts['upstream'] += 1
+            page = slim_page(self.fetch(key))
+            fetched_at = time.time()
+        except NutritionAPIError as e:
+            if stale is None:
+                raise
+            # Better an old answer than none while the API is down or the cap is reached
+            logging.info(f"Serving expired search results for {key!r}: {e}")
+            with self._lock:
+                self.stats_counts['stale'] += 1
+            return stale[0]
+        stored = {'hints': page['hints'], 'more': page['next'] is not None}
+        with self._lock:
+            if page['next'] is not None:
+                self._links[key] = (page['next'], fetched_at)
+                self._links.move_to_end(key)
+                while len(self._links) > self.memory_entries:
+                    self._links.popitem(last=False)
+            else:
+                self._links.pop(key, None)
+        self._remember(key, stored, fetched_at)
+        self.disk.put(key, stored, fetched_at)
+        return stored
+
+    def next_page(self, url):
+        # A later result page from its continuation link; counts against the per-minute cap like any search.
+        # A refresh token (a cached first page whose link has expired) re-runs the query for a fresh link first.
+        if url.startswith(REFRESH_PREFIX):
+            key = url[len(REFRESH_PREFIX):]
+            with self._lock:
+                self._links.pop(key, None)
+            url = self._page(key, self._fetch_once(key))['next']
+            if url is None or url.startswith(REFRESH_PREFIX):
+                return {'hints': [], 'next': None}
+        self._take_upstream_slot()
+        with self._lock:
+            self.stats_counts['upstream'] += 1
+        return slim_page(self.fetch_url(url))
+
+    def _take_upstream_slot(self):
+        # Sliding one-minute window over the calls made to the API
+        now = time.monotonic()
+        with self._lock:
+            while self._upstream_calls and now - self._upstream_calls[0] >= 60:
+                self._upstream_calls.popleft()
+            if self.upstream_per_minute and len(self._upstream_calls) >= self.upstream_per_minute:
+                self.stats_counts['rate_limited'] += 1
+                raise RateLimitedError("Too many food searches, try again in a moment")
+            self._upstream_calls.append(now)
+
+    def _remember(self, key, page, stored_at):
+        with self._lock:
+            self._memory[key] = (page, stored_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.stats_counts, memory_entries=len(self._memory), disk_bytes=self.disk.size)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_food_search_cache():
+    # Shared by every FoodSearch screen; searches go through the pooled Edamam client
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FoodSearchCache(lambda query: get_nutrition_client().search(query),
+                                         lambda url: get_nutrition_client().get_json(url))
+    return _cache
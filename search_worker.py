@@ -0,0 +1,80 @@
+# Background runner for searches typed into a text field.
+# Every search gets the next sequence number, and starting one supersedes all earlier ones: a search that hasn't
+# started yet is skipped, one that is running stops at its next page, and results of a superseded search that
+# are already queued for the main thread are dropped there. Only the latest search ever reaches the screen.
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from nutrition_client import NutritionAPIError
+
+
+class SearchWorker:
+    def __init__(self, max_workers=2, dispatch=None):
+        # Two workers, so a new search doesn't have to wait for a superseded one stuck on a slow response
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-worker")
+        self.dispatch = dispatch or (lambda callback: callback())
+        self._lock = threading.Lock()
+        self.sequence = 0
+
+    def submit(self, pages, on_page, on_done=None, on_error=None):
+        # pages() runs on a worker and returns an iterable of result pages; on_page(page), on_done() and
+        # on_error(error) are dispatched only while this is still the latest search. Returns its sequence number.
+        with self._lock:
+            self.sequence += 1
+            sequence = self.sequence
+        self.executor.submit(self._run, sequence, pages, on_page, on_done, on_error)
+        return sequence
+
+    def call(self, func, on_result, on_error=None):
+        # A search that produces a single result: func() runs on a worker, on_result(result) only if still current
+        return self.submit(lambda: (func(),), on_result, on_error=on_error)
+
+    def cancel(self):
+        # Supersede the running search without starting a new one
+        with self._lock:
+            self.sequence += 1
+
+    def is_current(self, sequence):
+        return sequence == self.sequence
+
+    def _run(self, sequence, pages, on_page, on_done, on_error):
+        if not self.is_current(sequence):
+            return
+        iterator = None
+        try:
+            iterator = iter(pages())
+            for page in iterator:
+                if not self.is_current(sequence):
+                    return
+                self._deliver(sequence, on_page, page)
+        except NutritionAPIError as e:
+            # Expected while Edamam is down, rate limited or the circuit is open: no traceback to report
+            self._fail(sequence, on_error, e, logging.warning)
+            return
+        except Exception as e:
+            self._fail(sequence, on_error, e, logging.exception)
+            return
+        finally:
+            # Stop a paging generator so it releases its connection and in-memory pages
+            if hasattr(iterator, 'close'):
+                iterator.close()
+        if on_done is not None:
+            self._deliver(sequence, on_done)
+
+    def _fail(self, sequence, on_error, error, log):
+        if self.is_current(sequence):
+            log(f"Search failed: {error}")
+            if on_error is not None:
+                self._deliver(sequence, on_error, error)
+
+    def _deliver(self, sequence, callback, *args):
+        def apply():
+            # Checked again on the main thread: a newer search may have started while this was queued
+            if self.is_current(sequence):
+                callback(*args)
+        self.dispatch(apply)
+
+    def shutdown(self, wait=False):
+        self.cancel()
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,306 @@
+# Embedded SQLite storage so the app runs without a MySQL server, e.g. on a single device or for local
+# benchmarks. Selected with "backend": "sqlite" (and optionally "sqlite_path") in db_config.json.
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+from database import DatabaseManager
+
+SQLITE_DEFAULT_PATH = 'fitness_app.db'
+
+# Bind values the same way the MySQL connector does, instead of relying on sqlite3's deprecated defaults
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime, lambda value: value.strftime("%Y-%m-%d %H:%M:%S"))
+sqlite3.register_adapter(Decimal, float)
+
+# The MySQL schema from README.md with every migration in migrations.py already applied
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS userdata (
+    id TEXT PRIMARY KEY,
+    username TEXT,
+    email TEXT,
+    password TEXT,
+    gender TEXT,
+    age INTEGER,
+    height REAL,
+    weight REAL,
+    experience_level TEXT,
+    bodyfat REAL,
+    activity_level TEXT,
+    goal TEXT,
+    calories INTEGER,
+    equipment TEXT,
+    training_style TEXT,
+    training_frequency TEXT,
+    timestamp TEXT,
+    prioritized_muscle_groups TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_userdata_username ON userdata (username);
+
+CREATE TABLE IF NOT EXISTS food_items (
+    food_item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT REFERENCES userdata(id),
+    label TEXT,
+    kcal INTEGER,
+    protein REAL,
+    carbs REAL,
+    fats REAL,
+    fiber REAL,
+    portion_size REAL,
+    weight REAL,
+    unit TEXT,
+    timestamp TEXT,
+    local_date TEXT GENERATED ALWAYS AS (date(timestamp)) STORED
+);
+CREATE INDEX IF NOT EXISTS idx_food_items_user_date ON food_items (user_id, local_date);
+
+CREATE TABLE IF NOT EXISTS daily_totals (
+    user_id TEXT REFERENCES userdata(id),
+    total_calories INTEGER,
+    total_protein INTEGER,
+    total_fats INTEGER,
+    total_carbs INTEGER,
+    date TEXT,
+    daily_target TEXT,
+    UNIQUE (user_id, date)
+);
+
+CREATE TABLE IF NOT EXISTS exercises (
+    ExerciseID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Name TEXT NOT NULL COLLATE NOCASE UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS workout_plans (
+    plan_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT REFERENCES userdata(id),
+    plan_name TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_workout_plans_user_name ON workout_plans (user_id, plan_name);
+
+CREATE TABLE IF NOT EXISTS workout_days (
+    day_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plan_id INTEGER REFERENCES workout_plans(plan_id) ON DELETE CASCADE,
+    day_number INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_workout_days_plan_day ON workout_days (plan_id, day_number);
+
+CREATE TABLE IF NOT EXISTS day_exercises (
+    day_exercise_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    day_id INTEGER REFERENCES workout_days(day_id) ON DELETE CASCADE,
+    ExerciseID INTEGER REFERENCES exercises(ExerciseID),
+    sets INTEGER,
+    reps INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_day_exercises_day ON day_exercises (day_id);
+
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT REFERENCES userdata(id),
+    message TEXT NOT NULL,
+    timestamp TEXT,
+    sender TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chats_user_time ON chats (user_id, timestamp, chat_id);
+
+CREATE TABLE IF NOT EXISTS workout_sets (
+    set_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    user_id TEXT NOT NULL REFERENCES userdata(id),
+    exercise_id INTEGER NOT NULL REFERENCES exercises(ExerciseID),
+    set_no INTEGER NOT NULL,
+    weight REAL,
+    reps INTEGER,
+    e1rm REAL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_workout_sets_user_exercise_time ON workout_sets (user_id, exercise_id, timestamp);
+
+CREATE TABLE IF NOT EXISTS weekly_stats (
+    user_id TEXT NOT NULL REFERENCES userdata(id),
+    week_start TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    sets INTEGER NOT NULL,
+    reps INTEGER NOT NULL,
+    volume REAL NOT NULL,
+    days_mask INTEGER NOT NULL,
+    PRIMARY KEY (user_id, week_start)
+);
+
+CREATE TABLE IF NOT EXISTS exercise_stats (
+    user_id TEXT NOT NULL REFERENCES userdata(id),
+    exercise_id INTEGER NOT NULL REFERENCES exercises(ExerciseID),
+    sessions INTEGER NOT NULL,
+    sets INTEGER NOT NULL,
+    volume REAL NOT NULL,
+    best_weight REAL NOT NULL,
+    best_e1rm REAL NOT NULL,
+    best_e1rm_at TEXT,
+    last_performed TEXT,
+    PRIMARY KEY (user_id, exercise_id)
+);
+
+CREATE TABLE IF NOT EXISTS user_streaks (
+    user_id TEXT PRIMARY KEY REFERENCES userdata(id),
+    current_streak INTEGER NOT NULL,
+    longest_streak INTEGER NOT NULL,
+    last_week TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS weight_logs (
+    user_id TEXT NOT NULL REFERENCES userdata(id),
+    date TEXT NOT NULL,
+    weight REAL NOT NULL,
+    bodyfat REAL,
+    PRIMARY KEY (user_id, date)
+);
+
+CREATE TABLE IF NOT EXISTS applied_writes (
+    idempotency_key TEXT PRIMARY KEY,
+    applied_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_applied_writes_applied_at ON applied_writes (applied_at);
+"""
+
+
+@lru_cache(maxsize=512)
+def to_qmark(query):
+    # sqlite3 takes ? placeholders. Caching the translation keeps the SQL text identical between calls,
+    # so sqlite3's statement cache hands back the already prepared statement.
+    return query.replace('%s', '?')
+
+
+class SQLiteConnections:
+    """
+    Stands in for the MySQL pool: one connection per thread, opened on first use and kept for the
+    life of the thread. WAL mode lets readers on other threads carry on while a writer commits.
+    """
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self.opened = 0
+        self.checkouts = 0
+
+    def _open(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                     check_same_thread=False, cached_statements=256)
+        connection.execute("PRAGMA journal_mode=WAL;")
+        connection.execute("PRAGMA synchronous=NORMAL;")
+        connection.execute("PRAGMA foreign_keys=ON;")
+        with self._lock:
+            if not self._schema_ready:
+                connection.executescript(SCHEMA)
+                self._schema_ready = True
+            self.opened += 1
+        return connection
+
+    def acquire(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._open()
+        with self._lock:
+            self.checkouts += 1
+        return connection
+
+    def release(self, connection):
+        pass  # the connection stays with its thread
+
+    @contextmanager
+    def connection(self):
+        yield self.acquire()
+
+    def stats(self):
+        with self._lock:
+            return {'open': self.opened, 'created': self.opened, 'checkouts': self.checkouts}
+
+
+_shared_connections = None
+_shared_connections_lock = threading.Lock()
+
+
+def get_sqlite_connections(db_config):
+    global _shared_connections
+    if _shared_connections is None:
+        with _shared_connections_lock:
+            if _shared_connections is None:
+                _shared_connections = SQLiteConnections(db_config.get('sqlite_path', SQLITE_DEFAULT_PATH),
+                                                        timeout=float(db_config.get('connect_timeout', 10)))
+    return _shared_connections
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    ADD_DAILY_TOTALS_QUERY = """
+    INSERT INTO daily_totals (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, date) DO UPDATE SET total_calories = total_calories + excluded.total_calories,
+        total_protein = total_protein + excluded.total_protein,
+        total_fats = total_fats + excluded.total_fats,
+        total_carbs = total_carbs + excluded.total_carbs;
+    """
+    REBUILD_DAILY_TOTALS_QUERY = """
+    INSERT INTO daily_totals (user_id, date, total_calories, total_protein, total_fats, total_carbs)
+    SELECT user_id, local_date, SUM(kcal), SUM(protein), SUM(fats), SUM(carbs)
+    FROM food_items
+    WHERE local_date >= %s AND local_date <= %s{user_filter}
+    GROUP BY user_id, local_date
+    ON CONFLICT (user_id, date) DO UPDATE SET total_calories = excluded.total_calories,
+        total_protein = excluded.total_protein, total_fats = excluded.total_fats, total_carbs = excluded.total_carbs;
+    """
+    INSERT_EXERCISES_QUERY = "INSERT INTO exercises (Name) VALUES {values} ON CONFLICT (Name) DO NOTHING;"
+    ADD_WEEKLY_STATS_QUERY = """
+    INSERT INTO weekly_stats (user_id, week_start, sessions, sets, reps, volume, days_mask)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, week_start) DO UPDATE SET sessions = sessions + excluded.sessions, sets = sets + excluded.sets,
+        reps = reps + excluded.reps, volume = volume + excluded.volume, days_mask = days_mask | excluded.days_mask;
+    """
+    ADD_EXERCISE_STATS_QUERY = """
+    INSERT INTO exercise_stats (user_id, exercise_id, sessions, sets, volume, best_weight, best_e1rm, best_e1rm_at, last_performed)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (user_id, exercise_id) DO UPDATE SET sessions = sessions + excluded.sessions, sets = sets + excluded.sets,
+        volume = volume + excluded.volume, best_weight = MAX(best_weight, excluded.best_weight),
+        best_e1rm_at = CASE WHEN excluded.best_e1rm > best_e1rm THEN excluded.best_e1rm_at ELSE best_e1rm_at END,
+        best_e1rm = MAX(best_e1rm, excluded.best_e1rm),
+        last_performed = MAX(last_performed, excluded.last_performed);
+    """
+    UPSERT_WEIGHT_LOGS_QUERY = """
+    INSERT INTO weight_logs (user_id, date, weight, bodyfat) VALUES (%s, %s, %s, %s)
+    ON CONFLICT (user_id, date) DO UPDATE SET weight = excluded.weight, bodyfat = COALESCE(excluded.bodyfat, bodyfat);
+    """
+    EXPLAIN_PREFIX = "EXPLAIN QUERY PLAN "
+
+    manages_own_schema = True
+    supports_load_data = False
+
+    @property
+    def connection_pool(self):
+        return get_sqlite_connections(self.db_config)
+
+    @property
+    def database_errors(self):
+        return (sqlite3.Error,)
+
+    @property
+    def permanent_errors(self):
+        return (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.ProgrammingError)
+
+    def _begin(self, connection):
+        # IMMEDIATE takes the write lock up front, so two writers never deadlock upgrading from a read lock
+        connection.execute("BEGIN IMMEDIATE;")
+
+    def _prepare(self, query):
+        return to_qmark(query)
+
+    @staticmethod
+    def _drain_cursor(cursor):
+        pass  # sqlite3 cursors only ever have one result set
+
+    def _stream_cursor(self, connection):
+        return connection.cursor()  # sqlite3 cursors already step through rows lazily
+
+    def _close_stream(self, connection, cursor):
+        cursor.close()
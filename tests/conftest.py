@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import sqlite_backend
+
+
+@pytest.fixture
+def db_manager(tmp_path, monkeypatch):
+    # A fresh embedded database for every test; the connection set and the exercise id map are process-wide
+    monkeypatch.setattr(sqlite_backend, '_shared_connections', None)
+    monkeypatch.setattr(database, '_exercise_ids', {})
+    monkeypatch.setattr(database, '_exercise_ids_warmed', False)
+    manager = database.create_database_manager({'backend': 'sqlite', 'sqlite_path': str(tmp_path / 'fitness.db')})
+    manager.insert_user_id('u1')
+    return manager
@@ -0,0 +1,34 @@
+def add_chats(db_manager, user_id, count):
+    # Three messages per second, so pages break inside groups of equal timestamps
+    for i in range(count):
+        db_manager.insert_chat(user_id, f"message {i}", 'user' if i % 2 else 'bot', timestamp=f"2024-05-01 10:00:{i // 3:02d}")
+
+
+def all_pages(db_manager, user_id, limit):
+    pages = [db_manager.get_chats_page(user_id, limit=limit)]
+    while len(pages[-1]) == limit:
+        last = pages[-1][-1]
+        pages.append(db_manager.get_chats_page(user_id, before_timestamp=last[3], before_chat_id=last[0], limit=limit))
+    return pages
+
+
+def test_pages_walk_back_through_history_without_gaps_or_repeats(db_manager):
+    add_chats(db_manager, 'u1', 20)
+    pages = all_pages(db_manager, 'u1', limit=7)
+    assert [len(page) for page in pages] == [7, 7, 6]
+    messages = [row[2] for page in pages for row in page]
+    assert messages == [f"message {i}" for i in reversed(range(20))]
+
+
+def test_first_page_is_the_newest_messages(db_manager):
+    add_chats(db_manager, 'u1', 5)
+    page = db_manager.get_chats_page('u1', limit=2)
+    assert [(row[2], row[4]) for row in page] == [('message 4', 'bot'), ('message 3', 'user')]
+
+
+def test_pages_only_hold_the_users_own_messages(db_manager):
+    db_manager.insert_user_id('u2')
+    add_chats(db_manager, 'u1', 4)
+    add_chats(db_manager, 'u2', 3)
+    assert {row[1] for page in all_pages(db_manager, 'u2', limit=2) for row in page} == {'u2'}
+    assert db_manager.get_chats_page('u3') == []
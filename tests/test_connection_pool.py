@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+import database
+from database import PoolTimeoutError, SharedConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.connected = True
+        self.in_transaction = False
+        self.rollbacks = 0
+        self.reconnects = 0
+
+    def close(self):
+        self.closed = True
+
+    def is_connected(self):
+        return self.connected
+
+    def reconnect(self, attempts=1):
+        self.reconnects += 1
+        self.connected = True
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.in_transaction = False
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    opened = []
+
+    def connect(**kwargs):
+        opened.append(FakeConnection())
+        return opened[-1]
+    monkeypatch.setattr(database.mysql.connector, 'connect', connect)
+    return opened
+
+
+def make_pool(**options):
+    config = {'host': 'db', 'pool_size': 2, 'max_overflow': 1, 'checkout_timeout': 0.05, 'pool_recycle': 0}
+    config.update(options)
+    return SharedConnectionPool(config)
+
+
+def test_connections_are_reused_most_recent_first(connections):
+    pool = make_pool()
+    first = pool.acquire()
+    second = pool.acquire()
+    pool.release(first)
+    pool.release(second)
+    assert pool.acquire() is second
+    assert len(connections) == 2
+
+
+def test_overflow_connections_are_closed_when_returned(connections):
+    pool = make_pool()
+    held = [pool.acquire() for _ in range(3)]
+    assert pool.stats()['open'] == 3
+    for connection in held:
+        pool.release(connection)
+    stats = pool.stats()
+    assert (stats['open'], stats['idle'], stats['in_use']) == (2, 2, 0)
+    assert held[2].closed
+
+
+def test_checkout_times_out_when_pool_and_overflow_are_in_use(connections):
+    pool = make_pool()
+    held = [pool.acquire() for _ in range(3)]
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    pool.release(held[0])
+    assert pool.acquire() is held[0]
+
+
+def test_waiting_checkout_gets_a_released_connection(connections):
+    pool = make_pool(checkout_timeout=1)
+    held = [pool.acquire() for _ in range(3)]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert pool.stats()['waiting'] == 1
+    pool.release(held[1])
+    waiter.join(1)
+    assert got == [held[1]]
+
+
+def test_release_ends_open_transactions(connections):
+    pool = make_pool()
+    connection = pool.acquire()
+    connection.in_transaction = True
+    pool.release(connection)
+    assert connection.rollbacks == 1
+
+
+def test_dropped_connections_are_reconnected_and_old_ones_recycled(connections):
+    pool = make_pool(pool_recycle=0.05)
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.connected = False
+    assert pool.acquire() is connection
+    assert connection.reconnects == 1
+    pool.release(connection)
+    time.sleep(0.06)
+    recycled = pool.acquire()
+    assert recycled is not connection and connection.closed
+    assert pool.stats()['recycled'] == 1
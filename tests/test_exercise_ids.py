@@ -0,0 +1,52 @@
+import pytest
+
+import database
+
+
+def count_queries(db_manager, monkeypatch):
+    queries = []
+    execute_query = db_manager.execute_query
+
+    def counting(query, *args, **kwargs):
+        queries.append(query.split()[0])
+        return execute_query(query, *args, **kwargs)
+    monkeypatch.setattr(db_manager, 'execute_query', counting)
+    return queries
+
+
+def test_unknown_exercises_are_created_with_one_insert_and_one_select(db_manager, monkeypatch):
+    db_manager.warm_exercise_cache()
+    queries = count_queries(db_manager, monkeypatch)
+    ids = db_manager.resolve_exercise_ids(['Squat', 'Bench Press', 'Squat', 'Deadlift'])
+    assert queries == ['INSERT', 'SELECT']
+    assert list(ids) == ['Squat', 'Bench Press', 'Deadlift'] and len(set(ids.values())) == 3
+
+    queries.clear()
+    assert db_manager.resolve_exercise_ids(['Deadlift', 'Squat']) == {'Deadlift': ids['Deadlift'], 'Squat': ids['Squat']}
+    assert queries == []
+
+
+def test_catalog_is_warmed_with_one_query(db_manager, monkeypatch):
+    squat = db_manager.get_or_create_exercise('Squat')
+    monkeypatch.setattr(database, '_exercise_ids', {})
+    monkeypatch.setattr(database, '_exercise_ids_warmed', False)
+    queries = count_queries(db_manager, monkeypatch)
+    assert db_manager.get_or_create_exercise('Squat') == squat
+    assert queries == ['SELECT']
+
+
+def test_names_differing_only_in_case_share_the_stored_row(db_manager):
+    squat = db_manager.get_or_create_exercise('Squat')
+    assert db_manager.get_or_create_exercise('squat') == squat
+    assert db_manager.execute_query("SELECT COUNT(*) FROM exercises;", fetch='one')[0] == 1
+
+
+def test_ids_created_in_a_rolled_back_transaction_are_not_cached(db_manager):
+    db_manager.warm_exercise_cache()
+    with pytest.raises(RuntimeError):
+        with db_manager.transaction():
+            db_manager.resolve_exercise_ids(['Lunge'])
+            raise RuntimeError("save failed")
+    assert 'Lunge' not in database._exercise_ids
+    assert db_manager.lookup_exercise_id('Lunge') is None
+    assert db_manager.get_or_create_exercise('Lunge') is not None
@@ -0,0 +1,87 @@
+import gzip
+import json
+from datetime import date
+
+import pytest
+
+import export
+from importer import import_csv
+
+
+@pytest.fixture
+def food_history(db_manager, tmp_path):
+    lines = ["Date,Time,Food,Calories,Protein (g),Carbohydrates (g),Fat (g)"]
+    lines += [f"2024-01-{day:02d},08:{minute:02d},Oats {day}-{minute},{300 + minute},10,50,6"
+              for day in range(1, 11) for minute in range(5)]
+    (tmp_path / 'foods.csv').write_text("\n".join(lines) + "\n", encoding='utf-8')
+    return import_csv(db_manager, 'u1', str(tmp_path / 'foods.csv'), batch_size=7)
+
+
+def read_jsonl(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as export_file:
+        return [json.loads(line) for line in export_file]
+
+
+def test_export_writes_every_row_in_key_order(db_manager, food_history, tmp_path):
+    exported = export.export_user_history(db_manager, 'u1', str(tmp_path / 'out'), tables=['food_items'], chunk_size=8)
+    assert exported == {'food_items': 50}
+    rows = read_jsonl(tmp_path / 'out' / 'food_items.jsonl.gz')
+    assert len(rows) == 50
+    assert [row['food_item_id'] for row in rows] == sorted(row['food_item_id'] for row in rows)
+
+
+def test_interrupted_export_resumes_without_duplicates(db_manager, food_history, tmp_path, monkeypatch):
+    out_dir = str(tmp_path / 'out')
+    stream_query = db_manager.stream_query
+
+    def interrupted(query, params=(), chunk_size=1000):
+        for i, rows in enumerate(stream_query(query, params, chunk_size=chunk_size)):
+            if i == 3:
+                raise KeyboardInterrupt
+            yield rows
+    monkeypatch.setattr(db_manager, 'stream_query', interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        export.export_user_history(db_manager, 'u1', out_dir, tables=['food_items'], chunk_size=8)
+    checkpoint = json.loads((tmp_path / 'out' / export.CHECKPOINT_FILE).read_text())
+    assert checkpoint['tables']['food_items']['rows'] == 24
+
+    monkeypatch.setattr(db_manager, 'stream_query', stream_query)
+    assert export.export_user_history(db_manager, 'u1', out_dir, tables=['food_items'], chunk_size=8) == {'food_items': 50}
+    rows = read_jsonl(tmp_path / 'out' / 'food_items.jsonl.gz')
+    assert len({row['food_item_id'] for row in rows}) == len(rows) == 50
+
+
+def test_empty_tables_export_valid_gzip_files(db_manager, tmp_path):
+    out_dir = tmp_path / 'out'
+    assert export.export_user_history(db_manager, 'u1', str(out_dir), tables=['chats']) == {'chats': 0}
+    assert read_jsonl(out_dir / 'chats.jsonl.gz') == []
+    export.export_user_history(db_manager, 'u1', str(tmp_path / 'csv'), fmt='csv', tables=['chats'])
+    with gzip.open(tmp_path / 'csv' / 'chats.csv.gz', 'rt', encoding='utf-8') as export_file:
+        assert export_file.read().splitlines() == ['chat_id,timestamp,sender,message']
+
+
+def test_export_date_range_and_csv(db_manager, food_history, tmp_path):
+    ranges = {'food_items': (date(2024, 1, 2), date(2024, 1, 3))}
+    exported = export.export_user_history(db_manager, 'u1', str(tmp_path / 'out'), fmt='csv', tables=['food_items'],
+                                          date_ranges=ranges)
+    assert exported == {'food_items': 10}
+    with gzip.open(tmp_path / 'out' / 'food_items.csv.gz', 'rt', encoding='utf-8') as export_file:
+        lines = export_file.read().splitlines()
+    assert lines[0].startswith('food_item_id,label') and len(lines) == 11
+
+
+def test_checkpoint_of_another_date_range_or_format_starts_over(db_manager, food_history, tmp_path):
+    out_dir = str(tmp_path / 'out')
+    first = {'food_items': (date(2024, 1, 2), date(2024, 1, 3))}
+    assert export.export_user_history(db_manager, 'u1', out_dir, tables=['food_items'], date_ranges=first) == {'food_items': 10}
+    # A finished export for another range is not reused: the file is rewritten with the new range's rows
+    later = {'food_items': (date(2024, 1, 5), None)}
+    assert export.export_user_history(db_manager, 'u1', out_dir, tables=['food_items'], date_ranges=later) == {'food_items': 30}
+    rows = read_jsonl(tmp_path / 'out' / 'food_items.jsonl.gz')
+    assert len(rows) == 30 and min(row['local_date'] for row in rows) == '2024-01-05'
+    checkpoint = json.loads((tmp_path / 'out' / export.CHECKPOINT_FILE).read_text())
+    assert checkpoint['tables']['food_items']['date_range'] == ['2024-01-05', None]
+
+    assert export.export_user_history(db_manager, 'u1', out_dir, fmt='csv', tables=['food_items'],
+                                      date_ranges=later) == {'food_items': 30}
+    assert json.loads((tmp_path / 'out' / export.CHECKPOINT_FILE).read_text())['format'] == 'csv'
@@ -0,0 +1,40 @@
+import pytest
+
+from food_catalog import FoodCatalog
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    return FoodCatalog()
+
+
+def labels(hints):
+    return [hint['food']['label'] for hint in hints]
+
+
+def test_every_typed_word_must_prefix_a_word_of_the_name(catalog):
+    results = labels(catalog.search('chick bre'))
+    assert results[:2] == ['Chicken breast, cooked', 'Chicken breast, raw']
+    assert 'Chicken thigh, cooked' not in results
+
+
+def test_names_starting_with_the_query_rank_first(catalog):
+    results = labels(catalog.search('egg'))
+    assert results[0].startswith('Egg')
+    assert set(results) >= {'Egg, boiled', 'Egg, fried', 'Egg, scrambled', 'Egg white'}
+
+
+def test_misspellings_fall_back_to_trigrams(catalog):
+    assert labels(catalog.search('bananna'))[0] == 'Banana'
+    assert catalog.search('xqzv') == []
+
+
+def test_results_have_the_shape_of_slimmed_hints(catalog):
+    hint = catalog.search('apple', limit=1)[0]
+    assert set(hint['food']['nutrients']) == {'ENERC_KCAL', 'PROCNT', 'CHOCDF', 'FAT', 'FIBTG'}
+    assert all(measure['weight'] > 0 for measure in hint['measures'])
+
+
+def test_empty_query_and_limit(catalog):
+    assert catalog.search('  ') == []
+    assert len(catalog.search('c', limit=3)) == 3
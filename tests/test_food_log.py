@@ -0,0 +1,46 @@
+from datetime import date
+
+import pytest
+
+
+def food(label, calories, protein=10.126, carbs=20.5, fats=3.333):
+    return {'label': label, 'calories': calories, 'protein': protein, 'carbs': carbs, 'fats': fats, 'fiber': 1,
+            'portion_size': 100, 'selected_weight': 1, 'unit': 'g'}
+
+
+def totals(db_manager, day):
+    rows = db_manager.get_daily_values('u1', day)
+    return tuple(float(value) for value in rows[0][1:]) if rows else None
+
+
+def test_log_foods_inserts_every_item_and_adds_to_the_days_totals(db_manager):
+    db_manager.log_foods('u1', [food('Oats', 150.4), food('Milk', 60)], logged_at='2024-03-01 08:00:00')
+    db_manager.log_foods('u1', [food('Rice', 215.6)], logged_at='2024-03-01 13:00:00')
+    db_manager.log_foods('u1', [food('Eggs', 200)], logged_at='2024-03-02 08:00:00')
+    assert [row[1] for row in db_manager.get_food_items('u1', '2024-03-01')] == ['Oats', 'Milk', 'Rice']
+    # kcal rounds to whole calories and the macros to two decimals, as the food_items columns do
+    assert totals(db_manager, '2024-03-01') == pytest.approx((150 + 60 + 216, 30.39, 9.99, 61.5))
+    assert totals(db_manager, '2024-03-02') == pytest.approx((200, 10.13, 3.33, 20.5))
+
+
+def test_rebuild_daily_totals_reproduces_the_incremental_totals(db_manager):
+    db_manager.log_foods('u1', [food('Oats', 150.4, protein=5.555), food('Milk', 60)], logged_at='2024-03-01 08:00:00')
+    db_manager.log_foods('u1', [food('Rice', 215.6, fats=0.005)], logged_at='2024-03-01 13:00:00')
+    db_manager.log_foods('u1', [food('Eggs', 200)], logged_at='2024-03-02 08:00:00')
+    incremental = {day: totals(db_manager, day) for day in ('2024-03-01', '2024-03-02')}
+
+    db_manager.execute_query("UPDATE daily_totals SET total_calories = 0, total_protein = 999;", commit=True)
+    db_manager.rebuild_daily_totals(date(2024, 3, 1), date(2024, 3, 2), user_id='u1')
+    assert {day: totals(db_manager, day) for day in incremental} == incremental
+
+
+def test_rebuild_zeroes_days_whose_foods_were_deleted(db_manager):
+    db_manager.log_foods('u1', [food('Oats', 150)], logged_at='2024-03-01 08:00:00')
+    db_manager.execute_query("DELETE FROM food_items WHERE user_id = %s;", params=('u1',), commit=True)
+    db_manager.rebuild_daily_totals(date(2024, 3, 1), date(2024, 3, 1))
+    assert totals(db_manager, '2024-03-01') == (0, 0, 0, 0)
+
+
+def test_empty_log_writes_nothing(db_manager):
+    db_manager.log_foods('u1', [], logged_at='2024-03-01 08:00:00')
+    assert totals(db_manager, '2024-03-01') is None
@@ -0,0 +1,67 @@
+from datetime import date
+
+import pytest
+
+from importer import import_csv
+
+
+def write_csv(path, text):
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_import_writes_rows_and_rebuilds_daily_totals(db_manager, tmp_path):
+    lines = ["Date,Time,Food,Calories,Protein (g),Carbohydrates (g),Fat (g)"]
+    lines += [f"2024-01-{day:02d},08:{minute:02d},Oats {day}-{minute},{300 + minute},10,50,6"
+              for day in range(1, 11) for minute in range(5)]
+    summary = import_csv(db_manager, 'u1', write_csv(tmp_path / 'foods.csv', "\n".join(lines) + "\n"), batch_size=7)
+    assert summary['rows'] == 50 and summary['skipped'] == 0
+    assert (summary['first_day'], summary['last_day']) == ('2024-01-01', '2024-01-10')
+    assert len(db_manager.get_food_items('u1', '2024-01-03')) == 5
+    totals = db_manager.get_daily_values('u1', '2024-01-03')[0]
+    assert totals[1] == sum(300 + minute for minute in range(5))
+
+
+def test_invalid_rows_are_skipped_and_reported(db_manager, tmp_path):
+    path = write_csv(tmp_path / 'foods.csv', "Date,Calories\n2024-02-01,200\nnot a date,100\n2024-02-02,-5\n2024-02-02,\"1,000\"\n")
+    summary = import_csv(db_manager, 'u1', path)
+    assert summary['rows'] == 2
+    assert [line for line, message in summary['errors']] == [3, 4]
+
+
+def test_rows_with_surplus_or_missing_fields(db_manager, tmp_path):
+    # Only Date and Calories are mapped; the long row's surplus values must not be read as optional fields
+    path = write_csv(tmp_path / 'foods.csv', "Date,Calories,Notes\n2024-02-01,200,ok,extra,more\n2024-02-02\n")
+    summary = import_csv(db_manager, 'u1', path)
+    assert summary['rows'] == 1
+    assert summary['errors'] == [(3, 'missing value')]
+    food = db_manager.get_food_items('u1', '2024-02-01')[0]
+    assert (food[1], food[2]) == ('Imported food', 200)
+
+
+def test_header_without_required_columns_is_rejected(db_manager, tmp_path):
+    with pytest.raises(ValueError, match="no column for calories; found date, food"):
+        import_csv(db_manager, 'u1', write_csv(tmp_path / 'foods.csv', "Date,Food\n2024-02-01,Oats\n"))
+    with pytest.raises(ValueError, match="no column for weight"):
+        import_csv(db_manager, 'u1', write_csv(tmp_path / 'weights.csv', "Date,Notes\n2024-02-01,x\n"), kind='weights')
+
+
+def test_weights_in_pounds_are_converted(db_manager, tmp_path):
+    path = write_csv(tmp_path / 'weights.csv', "Date,Weight (lbs),Body Fat (%)\n2024-01-01,180,20%\n2024-01-02,,\n")
+    summary = import_csv(db_manager, 'u1', path, kind='weights')
+    assert summary['rows'] == 1 and summary['skipped'] == 1
+    assert [(str(day)[:10], float(weight), float(bodyfat)) for day, weight, bodyfat in
+            db_manager.get_weight_logs('u1', date(2024, 1, 1), date(2024, 1, 31))] == [('2024-01-01', 81.65, 20.0)]
+
+
+def test_values_outside_the_column_ranges_are_skipped(db_manager, tmp_path):
+    path = write_csv(tmp_path / 'foods.csv', "Date,Calories,Protein (g),Fiber,Weight (g)\n"
+                     "2024-02-01,200,999.99,5,9999.99\n2024-02-01,200,1000,5,100\n2024-02-01,200,10,-1,100\n"
+                     "2024-02-01,200,10,5,10000\n2024-02-01,inf,10,5,100\n")
+    summary = import_csv(db_manager, 'u1', path)
+    assert summary['rows'] == 1
+    assert [line for line, message in summary['errors']] == [3, 4, 5, 6]
+    assert summary['errors'][0][1] == "protein 1000 out of range 0-999.99"
+    weights = write_csv(tmp_path / 'weights.csv', "Date,Weight,Body Fat\n2024-01-01,80,150\n2024-01-02,80,15\n")
+    summary = import_csv(db_manager, 'u1', weights, kind='weights')
+    assert summary['rows'] == 1 and summary['errors'] == [(2, "body fat 150 out of range 0-99.99")]
@@ -0,0 +1,14 @@
+import loadtest
+
+
+def test_run_over_several_processes_merges_their_reports(db_manager):
+    users = loadtest.seed(db_manager, users=3, days=5, foods_per_day=2, chats_per_user=5, plans_per_user=1,
+                          sessions_per_user=2)
+    assert len(loadtest.seeded_users(db_manager)) == len(users) == 3
+
+    report = loadtest.run(db_manager.db_config, threads=2, processes=2, duration=1)
+    assert report['processes'] == 2 and len(report['pools']) == 2
+    assert report['sessions'] > 0
+    assert all(stats['errors'] == 0 for stats in report['flows'].values())
+    assert sum(stats['count'] for stats in report['flows'].values()) >= report['sessions']
+    assert report['methods']
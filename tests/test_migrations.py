@@ -0,0 +1,109 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+
+import migrations
+
+
+class RecordingManager:
+    """Runs migrations against an in-memory catalog of what exists instead of a MySQL server."""
+    manages_own_schema = False
+
+    def __init__(self, applied=(), indexes=(), columns=(), fail_on=None):
+        self.applied = set(applied)
+        self.indexes = set(indexes)
+        self.columns = set(columns)
+        self.fail_on = fail_on
+        self.statements = []
+        self.transactions = 0
+
+    @contextmanager
+    def transaction(self):
+        self.transactions += 1
+        applied = set(self.applied)
+        try:
+            yield
+        except Exception:
+            self.applied = applied
+            raise
+
+    def execute_query(self, query, params=(), commit=False, fetch=None):
+        query = " ".join(query.split())
+        if 'information_schema.statistics' in query:
+            return (1,) if tuple(params) in self.indexes else None
+        if 'information_schema.columns' in query:
+            return (1,) if tuple(params) in self.columns else None
+        if 'information_schema.referential_constraints' in query:
+            return []
+        if query.startswith('SELECT version FROM schema_migrations'):
+            return [(version,) for version in sorted(self.applied)]
+        if query.startswith('INSERT INTO schema_migrations'):
+            self.applied.add(params[0])
+            return None
+        if self.fail_on is not None and self.fail_on in query:
+            raise RuntimeError("server went away")
+        match = re.match(r"CREATE (?:UNIQUE )?INDEX (\w+) ON (\w+)", query)
+        if match:
+            self.indexes.add((match.group(2), match.group(1)))
+        match = re.match(r"ALTER TABLE (\w+) ADD COLUMN (\w+)", query)
+        if match:
+            self.columns.add((match.group(1), match.group(2)))
+        self.statements.append(query)
+        return None
+
+
+def all_versions():
+    return [migration[0] for migration in migrations.MIGRATIONS]
+
+
+def test_versions_are_unique_and_increasing():
+    versions = all_versions()
+    assert versions == sorted(set(versions))
+
+
+def test_migrate_applies_every_pending_migration_in_one_transaction_each():
+    manager = RecordingManager()
+    assert migrations.migrate(manager) == all_versions()
+    assert manager.applied == set(all_versions())
+    assert manager.transactions == len(all_versions())
+    assert migrations.pending_migrations(manager) == []
+    assert migrations.migrate(manager) == []
+
+
+def test_migrate_stops_at_target_and_skips_applied_versions():
+    manager = RecordingManager(applied={1})
+    assert migrations.migrate(manager, target=3) == [2, 3]
+    assert [migration[0] for migration in migrations.pending_migrations(manager)] == all_versions()[3:]
+
+
+def test_steps_skip_indexes_and_columns_that_already_exist():
+    # As after a migration that was interrupted before its version was recorded
+    manager = RecordingManager(indexes={('chats', 'idx_chats_user_time')},
+                               columns={('food_items', 'local_date')})
+    migrations.migrate(manager, target=3)
+    assert not any('idx_chats_user_time' in statement or 'ADD COLUMN local_date' in statement
+                   for statement in manager.statements)
+    assert any('idx_food_items_user_date' in statement for statement in manager.statements)
+
+
+def test_failed_migration_is_not_recorded():
+    manager = RecordingManager(fail_on='idx_chats_user_time')
+    with pytest.raises(RuntimeError):
+        migrations.migrate(manager)
+    assert manager.applied == {1, 2}
+
+
+def test_sqlite_backend_creates_its_own_schema(db_manager):
+    assert migrations.migrate(db_manager) == []
+    assert migrations.pending_migrations(db_manager) == []
+
+
+def test_sqlite_schema_has_every_table_the_migrations_create(db_manager):
+    created = set()
+    for version, description, steps in migrations.MIGRATIONS:
+        for step in steps:
+            if isinstance(step, str):
+                created.update(re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)", step))
+    tables = {row[0] for row in db_manager.execute_query("SELECT name FROM sqlite_master WHERE type = 'table';", fetch='all')}
+    assert created <= tables
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+import requests
+
+from nutrition_client import CircuitBreaker, CircuitOpenError, EdamamClient, NutritionAPIError
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.headers = {}
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = EdamamClient(app_id='id', app_key='key', max_retries=2,
+                          breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.05))
+    monkeypatch.setattr(client, '_backoff', lambda attempt, retry_after=None: 0)
+    return client
+
+
+def answer(client, monkeypatch, *responses):
+    calls = []
+    responses = list(responses)
+
+    def get(url, params=None, timeout=None):
+        calls.append(url)
+        result = responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    monkeypatch.setattr(client.session, 'get', get)
+    return calls
+
+
+def test_breaker_opens_after_repeated_failures_and_closes_after_a_good_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+    assert not breaker.allow()  # one trial at a time
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.opens == 2
+
+
+def test_server_errors_and_timeouts_are_retried(client, monkeypatch):
+    calls = answer(client, monkeypatch, FakeResponse(503), requests.Timeout("read timed out"),
+                   FakeResponse(200, {'hints': []}))
+    assert client.search('apple') == {'hints': []}
+    assert len(calls) == 3
+    assert client.stats()['retries'] == 2
+    assert client.breaker.state == 'closed'
+
+
+def test_client_errors_are_not_retried(client, monkeypatch):
+    calls = answer(client, monkeypatch, FakeResponse(401))
+    with pytest.raises(NutritionAPIError):
+        client.search('apple')
+    assert len(calls) == 1
+    assert client.breaker.state == 'closed'
+
+
+def test_open_breaker_fails_fast(client, monkeypatch):
+    calls = answer(client, monkeypatch, *[FakeResponse(503)] * 6)
+    for _ in range(2):
+        with pytest.raises(NutritionAPIError):
+            client.search('apple')
+    assert len(calls) == 6
+    with pytest.raises(CircuitOpenError):
+        client.search('apple')
+    assert len(calls) == 6
+    assert client.stats()['short_circuits'] == 1
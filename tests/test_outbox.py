@@ -0,0 +1,169 @@
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from outbox import ExpiredWriteError, Outbox
+
+
+@pytest.fixture
+def outbox(db_manager, tmp_path):
+    return Outbox(db_manager, path=str(tmp_path / 'outbox.db'))
+
+
+def messages(db_manager):
+    # Oldest first
+    return [row[2] for row in reversed(db_manager.get_chats_by_user_id('u1'))]
+
+
+def journal(outbox):
+    return outbox._journal.execute("SELECT method, user_id, attempts, dead, last_error FROM outbox ORDER BY seq;").fetchall()
+
+
+def test_entries_are_applied_in_order_and_removed(db_manager, outbox):
+    applied = []
+    outbox.add_listener(lambda method, user_id, key: applied.append((method, key)))
+    first = outbox.enqueue('insert_chat', 'u1', 'hello', 'Human', '2024-01-01 10:00:00')
+    second = outbox.enqueue('insert_chat', 'u1', 'hi there', 'AI', '2024-01-01 10:00:01')
+    assert outbox.flush() is None
+    assert applied == [('insert_chat', first), ('insert_chat', second)]
+    assert journal(outbox) == []
+    assert messages(db_manager) == ['hello', 'hi there']
+
+
+def test_pending_writes_lists_waiting_entries_of_the_user(outbox):
+    plan = {'1': [{'name': 'Bench', 'sets': 3, 'reps': 10}]}
+    outbox.enqueue('save_complete_workout_plan', 'u1', 'Push', plan)
+    outbox.enqueue('insert_chat', 'u1', 'hello', 'Human', '2024-01-01 10:00:00')
+    outbox.enqueue('save_complete_workout_plan', 'u2', 'Pull', plan)
+    assert outbox.pending_writes('save_complete_workout_plan', 'u1') == [['Push', plan]]
+    outbox.flush()
+    assert outbox.pending_writes('save_complete_workout_plan', 'u1') == []
+
+
+def test_replayed_entry_is_not_applied_twice(db_manager, outbox):
+    key = outbox.enqueue('insert_chat', 'u1', 'hello', 'Human', '2024-01-01 10:00:00')
+    assert db_manager.apply_outbox_write(key, 'insert_chat', ['u1', 'hello', 'Human', '2024-01-01 10:00:00'])
+    outbox.flush()
+    assert len(db_manager.get_chats_by_user_id('u1')) == 1
+
+
+def test_rejected_entry_is_dead_lettered_without_blocking_later_entries(db_manager, outbox):
+    failed = []
+    outbox.add_failure_listener(lambda method, user_id, key, error: failed.append((key, type(error))))
+    bad = outbox.enqueue('insert_chat', 'missing-user', 'hello', 'Human', '2024-01-01 10:00:00')
+    outbox.enqueue('insert_chat', 'missing-user', 'again', 'Human', '2024-01-01 10:00:01')
+    outbox.enqueue('insert_chat', 'u1', 'hello', 'Human', '2024-01-01 10:00:02')
+    assert outbox.flush() is None
+    assert failed[0] == (bad, sqlite3.IntegrityError)
+    assert [row[:4] for row in journal(outbox)] == [('insert_chat', 'missing-user', 1, 1),
+                                                    ('insert_chat', 'missing-user', 1, 1)]
+    assert 'FOREIGN KEY' in journal(outbox)[0][4]
+    assert outbox.pending() == 0
+    assert len(db_manager.get_chats_by_user_id('u1')) == 1
+
+
+def test_unreachable_database_is_retried_and_blocks_the_users_later_entries(db_manager, outbox, monkeypatch):
+    failed = []
+    outbox.add_failure_listener(lambda *args: failed.append(args))
+    apply_write = db_manager.apply_outbox_write
+    apply_writes = db_manager.apply_outbox_writes
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(db_manager, 'apply_outbox_write', locked)
+    monkeypatch.setattr(db_manager, 'apply_outbox_writes', locked)
+    outbox.enqueue('insert_chat', 'u1', 'first', 'Human', '2024-01-01 10:00:00')
+    outbox.enqueue('insert_chat', 'u1', 'second', 'Human', '2024-01-01 10:00:01')
+    delay = outbox.flush()
+    assert 0 < delay <= Outbox.BASE_BACKOFF
+    assert [row[2:4] for row in journal(outbox)] == [(1, 0), (0, 0)]
+    assert failed == []
+
+    # Once the database is back and the backoff has passed, both entries go through in order
+    monkeypatch.setattr(db_manager, 'apply_outbox_write', apply_write)
+    monkeypatch.setattr(db_manager, 'apply_outbox_writes', apply_writes)
+    outbox._journal.execute("UPDATE outbox SET next_attempt_at = 0;")
+    assert outbox.flush() is None
+    assert journal(outbox) == []
+    assert messages(db_manager) == ['first', 'second']
+
+
+def record_batches(db_manager, monkeypatch):
+    batches = []
+    apply_writes = db_manager.apply_outbox_writes
+
+    def recording(writes):
+        batches.append([key for key, method, args in writes])
+        return apply_writes(writes)
+    monkeypatch.setattr(db_manager, 'apply_outbox_writes', recording)
+    return batches
+
+
+def test_each_users_due_entries_are_applied_in_one_transaction(db_manager, outbox, monkeypatch):
+    db_manager.insert_user_id('u2')
+    batches = record_batches(db_manager, monkeypatch)
+    applied = []
+    outbox.add_listener(lambda method, user_id, key: applied.append(key))
+    keys = [outbox.enqueue('insert_chat', user_id, f"{user_id} {i}", 'Human', f"2024-01-01 10:00:0{i}")
+            for i in range(3) for user_id in ('u1', 'u2')]
+    assert outbox.flush() is None
+    assert batches == [keys[0::2], keys[1::2]]
+    assert applied == keys[0::2] + keys[1::2]
+    assert journal(outbox) == []
+    assert messages(db_manager) == ['u1 0', 'u1 1', 'u1 2']
+
+
+def test_batches_skip_entries_already_applied(db_manager, outbox):
+    key = outbox.enqueue('insert_chat', 'u1', 'hello', 'Human', '2024-01-01 10:00:00')
+    outbox.enqueue('insert_chat', 'u1', 'again', 'Human', '2024-01-01 10:00:01')
+    db_manager.apply_outbox_write(key, 'insert_chat', ['u1', 'hello', 'Human', '2024-01-01 10:00:00'])
+    outbox.flush()
+    assert messages(db_manager) == ['hello', 'again']
+
+
+def test_rejected_entry_in_a_batch_is_dead_lettered_alone(db_manager, outbox, monkeypatch):
+    failed = []
+    outbox.add_failure_listener(lambda method, user_id, key, error: failed.append(key))
+    insert_chat = db_manager.insert_chat
+
+    def strict(user_id, message, sender, timestamp=None):
+        if message == 'bad':
+            raise sqlite3.IntegrityError("CHECK constraint failed")
+        insert_chat(user_id, message, sender, timestamp)
+    monkeypatch.setattr(db_manager, 'insert_chat', strict)
+    outbox.enqueue('insert_chat', 'u1', 'first', 'Human', '2024-01-01 10:00:00')
+    bad = outbox.enqueue('insert_chat', 'u1', 'bad', 'Human', '2024-01-01 10:00:01')
+    outbox.enqueue('insert_chat', 'u1', 'third', 'Human', '2024-01-01 10:00:02')
+    assert outbox.flush() is None
+    assert failed == [bad]
+    assert [row[:4] for row in journal(outbox)] == [('insert_chat', 'u1', 1, 1)]
+    assert messages(db_manager) == ['first', 'third']
+
+
+def test_entries_older_than_max_age_are_given_up(db_manager, outbox):
+    failed = []
+    outbox.add_failure_listener(lambda method, user_id, key, error: failed.append((key, type(error))))
+    old = outbox.enqueue('insert_chat', 'u1', 'old', 'Human', '2024-01-01 10:00:00')
+    outbox.enqueue('insert_chat', 'u1', 'new', 'Human', '2024-01-01 10:00:01')
+    outbox._journal.execute("UPDATE outbox SET created_at = ? WHERE idempotency_key = ?;", (time.time() - Outbox.MAX_AGE - 1, old))
+    assert outbox.flush() is None
+    assert failed == [(old, ExpiredWriteError)]
+    assert messages(db_manager) == ['new']
+
+
+def test_keys_older_than_the_retention_are_pruned_once_per_interval(db_manager, outbox):
+    def applied_keys():
+        return {row[0] for row in db_manager.execute_query("SELECT idempotency_key FROM applied_writes;", fetch='all')}
+    expired = (datetime.now() - timedelta(seconds=Outbox.KEY_RETENTION + 60)).strftime("%Y-%m-%d %H:%M:%S")
+    recent = (datetime.now() - timedelta(seconds=Outbox.MAX_AGE)).strftime("%Y-%m-%d %H:%M:%S")
+    db_manager.execute_many("INSERT INTO applied_writes (idempotency_key, applied_at) VALUES (%s, %s);",
+                            [('expired', expired), ('recent', recent)], commit=True)
+    outbox.flush()
+    assert applied_keys() == {'recent'}
+
+    db_manager.execute_query("INSERT INTO applied_writes (idempotency_key, applied_at) VALUES (%s, %s);",
+                             params=('expired again', expired), commit=True)
+    outbox.flush()
+    assert 'expired again' in applied_keys()
@@ -0,0 +1,49 @@
+def add_plan(db_manager, plan_name, days):
+    plan_id = db_manager.create_workout_plan('u1', plan_name)
+    for day_number, exercises in days.items():
+        day_id = db_manager.add_workout_day(plan_id, day_number)
+        for name, sets, reps in exercises:
+            db_manager.add_exercise_to_day(day_id, db_manager.get_or_create_exercise(name), sets, reps)
+
+
+def count_queries(db_manager, monkeypatch):
+    queries = []
+    execute_query = db_manager.execute_query
+
+    def counting(query, *args, **kwargs):
+        queries.append(query)
+        return execute_query(query, *args, **kwargs)
+    monkeypatch.setattr(db_manager, 'execute_query', counting)
+    return queries
+
+
+def test_every_plan_is_loaded_with_one_query(db_manager, monkeypatch):
+    add_plan(db_manager, 'Push', {1: [('Bench Press', 3, 8), ('Dips', 3, 10)], 2: [('Overhead Press', 4, 6)]})
+    add_plan(db_manager, 'Pull', {1: [('Pull Up', 5, 5)]})
+    queries = count_queries(db_manager, monkeypatch)
+    plans = db_manager.load_workout_plans('u1')
+    assert len(queries) == 1
+    assert plans == {
+        'Push': {1: [{'name': 'Bench Press', 'sets': 3, 'reps': 8}, {'name': 'Dips', 'sets': 3, 'reps': 10}],
+                 2: [{'name': 'Overhead Press', 'sets': 4, 'reps': 6}]},
+        'Pull': {1: [{'name': 'Pull Up', 'sets': 5, 'reps': 5}]},
+    }
+    assert list(plans) == ['Push', 'Pull']
+
+
+def test_plans_and_days_without_rows_are_kept(db_manager):
+    add_plan(db_manager, 'Empty', {})
+    add_plan(db_manager, 'Rest day', {1: [], 2: [('Squat', 3, 5)]})
+    plans = db_manager.load_workout_plans('u1')
+    assert plans['Empty'] == {}
+    assert plans['Rest day'] == {1: [], 2: [{'name': 'Squat', 'sets': 3, 'reps': 5}]}
+
+
+def test_retrieve_workout_plan_reads_one_plan_of_one_user(db_manager):
+    add_plan(db_manager, 'Push', {1: [('Bench Press', 3, 8)]})
+    add_plan(db_manager, 'Pull', {1: [('Pull Up', 5, 5)]})
+    db_manager.insert_user_id('u2')
+    db_manager.create_workout_plan('u2', 'Push')
+    assert db_manager.retrieve_workout_plan('u1', 'Push') == {1: [{'name': 'Bench Press', 'sets': 3, 'reps': 8}]}
+    assert db_manager.retrieve_workout_plan('u2', 'Push') == {}
+    assert db_manager.retrieve_workout_plan('u1', 'Legs') == {}
@@ -0,0 +1,94 @@
+import pytest
+
+
+PLAN = {
+    '1': [{'name': 'Squat', 'sets': 3, 'reps': 5}, {'name': 'Bench Press', 'sets': 3, 'reps': 8}],
+    '2': [{'name': 'Deadlift', 'sets': 1, 'reps': 5}],
+}
+
+
+def stored(db_manager, plan_name='Strength'):
+    return db_manager.load_workout_plans('u1', plan_name=plan_name).get(plan_name)
+
+
+def test_new_plan_is_saved_with_every_day_and_exercise(db_manager):
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    assert stored(db_manager) == {int(day): exercises for day, exercises in PLAN.items()}
+
+
+def test_failed_save_leaves_no_partial_plan(db_manager, monkeypatch):
+    def fail(rows):
+        raise RuntimeError("connection lost")
+    monkeypatch.setattr(db_manager, 'add_exercises_to_days', fail)
+    with pytest.raises(RuntimeError):
+        db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    assert stored(db_manager) is None
+    assert db_manager.execute_query("SELECT COUNT(*) FROM workout_days;", fetch='one')[0] == 0
+
+
+def test_days_and_exercises_are_inserted_in_one_statement_each(db_manager, monkeypatch):
+    execute_many = db_manager.execute_many
+    batches = []
+
+    def recording(query, seq_params, commit=False):
+        batches.append((query.split()[2], len(seq_params)))
+        return execute_many(query, seq_params, commit=commit)
+    monkeypatch.setattr(db_manager, 'execute_many', recording)
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    assert batches == [('workout_days', 2), ('day_exercises', 3)]
+
+
+def plan_rows(db_manager, plan_name='Strength'):
+    return db_manager.get_plan_rows(db_manager.get_plan_id('u1', plan_name))
+
+
+def record_writes(db_manager, monkeypatch):
+    # First word and table of every statement the save sends, e.g. ('UPDATE', 'day_exercises');
+    # execute_many with no rows sends nothing
+    writes = []
+    for name in ('execute_query', 'execute_many'):
+        original = getattr(db_manager, name)
+
+        def recording(query, params=(), *args, original=original, many=name == 'execute_many', **kwargs):
+            words = query.split()
+            if words[0] != 'SELECT' and not (many and not params):
+                writes.append((words[0], words[2] if words[0] in ('INSERT', 'DELETE') else words[1]))
+            return original(query, params, *args, **kwargs)
+        monkeypatch.setattr(db_manager, name, recording)
+    return writes
+
+
+def test_saving_an_unchanged_plan_writes_nothing(db_manager, monkeypatch):
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    before = plan_rows(db_manager)
+    writes = record_writes(db_manager, monkeypatch)
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    assert writes == []
+    assert plan_rows(db_manager) == before
+
+
+def test_reordered_exercises_are_updated_in_place(db_manager, monkeypatch):
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    ids_before = [row[0] for row in plan_rows(db_manager)[1][1]]
+    reordered = dict(PLAN, **{'1': [PLAN['1'][1], dict(PLAN['1'][0], reps=3)]})
+    writes = record_writes(db_manager, monkeypatch)
+    db_manager.save_complete_workout_plan('u1', 'Strength', reordered)
+    assert writes == [('UPDATE', 'day_exercises')]
+    assert [row[0] for row in plan_rows(db_manager)[1][1]] == ids_before
+    assert stored(db_manager)[1] == reordered['1']
+
+
+def test_removed_exercises_and_days_are_deleted(db_manager):
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    trimmed = {'1': PLAN['1'][:1], '3': [{'name': 'Pull Up', 'sets': 4, 'reps': 6}]}
+    db_manager.save_complete_workout_plan('u1', 'Strength', trimmed)
+    assert stored(db_manager) == {1: PLAN['1'][:1], 3: trimmed['3']}
+    assert db_manager.execute_query("SELECT COUNT(*) FROM workout_days;", fetch='one')[0] == 2
+    assert db_manager.execute_query("SELECT COUNT(*) FROM day_exercises;", fetch='one')[0] == 2
+
+
+def test_other_plans_are_left_alone(db_manager):
+    db_manager.save_complete_workout_plan('u1', 'Strength', PLAN)
+    db_manager.save_complete_workout_plan('u1', 'Cardio', {'1': [{'name': 'Rowing', 'sets': 1, 'reps': 1}]})
+    db_manager.save_complete_workout_plan('u1', 'Strength', {'1': PLAN['1']})
+    assert stored(db_manager, 'Cardio') == {1: [{'name': 'Rowing', 'sets': 1, 'reps': 1}]}
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+import database
+import sqlite_backend
+from query_cache import QueryCache, read_tables, write_table
+
+
+def test_tables_are_read_from_queries():
+    assert read_tables("SELECT * FROM food_items fi JOIN `daily_totals` dt ON dt.user_id = fi.user_id") == \
+        {'food_items', 'daily_totals'}
+    assert write_table("INSERT INTO chats (user_id) VALUES (%s)") == 'chats'
+    assert write_table("  delete from workout_plans WHERE plan_id = %s") == 'workout_plans'
+    assert write_table("SELECT 1") is None
+
+
+def test_entries_expire_and_are_evicted_least_recently_used_first():
+    cache = QueryCache(max_entries=2, default_ttl=30)
+    cache.put('a', 1, {'t'})
+    cache.put('b', 2, {'t'})
+    cache.get('a')
+    cache.put('c', 3, {'t'})
+    assert cache.get('b') == (False, None)
+    assert cache.get('a') == (True, 1)
+    cache.put('d', 4, {'t'}, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get('d') == (False, None)
+
+
+def test_invalidation_drops_only_entries_reading_the_table():
+    cache = QueryCache()
+    cache.put('foods', 1, {'food_items'})
+    cache.put('joined', 2, {'food_items', 'daily_totals'})
+    cache.put('chats', 3, {'chats'})
+    cache.invalidate({'food_items'})
+    assert cache.get('foods') == (False, None)
+    assert cache.get('joined') == (False, None)
+    assert cache.get('chats') == (True, 3)
+
+
+def test_read_that_raced_a_write_is_not_stored():
+    cache = QueryCache()
+    version = cache.version
+    cache.invalidate({'chats'})
+    cache.put('chats', 'stale', {'chats'}, version=version)
+    assert cache.get('chats') == (False, None)
+
+
+@pytest.fixture
+def cached_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(sqlite_backend, '_shared_connections', None)
+    monkeypatch.setattr(database, '_exercise_ids', {})
+    monkeypatch.setattr(database, '_exercise_ids_warmed', False)
+    manager = database.create_database_manager({'backend': 'sqlite', 'sqlite_path': str(tmp_path / 'cached.db'),
+                                                'query_cache': True})
+    manager.insert_user_id('u1')
+    return manager
+
+
+def test_write_invalidates_cached_reads_of_the_table(cached_db):
+    plan = {1: [{'name': 'Bench', 'sets': 3, 'reps': 10}]}
+    cached_db.save_complete_workout_plan('u1', 'Push', plan)
+    assert cached_db.load_workout_plans('u1') == {'Push': plan}
+    hits = cached_db.query_cache.hits
+    assert cached_db.load_workout_plans('u1') == {'Push': plan}
+    assert cached_db.query_cache.hits == hits + 1
+
+    plan[1][0]['sets'] = 5
+    cached_db.save_complete_workout_plan('u1', 'Push', plan)
+    assert cached_db.load_workout_plans('u1') == {'Push': plan}
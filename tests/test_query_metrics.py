@@ -0,0 +1,54 @@
+import json
+import time
+
+from query_metrics import LatencyHistogram, QueryMetrics
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def test_histogram_percentiles_are_within_a_bucket():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    assert histogram.count == 100
+    assert 0.045 <= histogram.percentile(50) <= 0.055
+    assert histogram.percentile(100) == histogram.max == 0.1
+
+
+def test_periodic_dump_survives_a_failing_dump(tmp_path, caplog):
+    metrics = QueryMetrics()
+    path = tmp_path / 'metrics.jsonl'
+    calls = []
+
+    def extra():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("pool gone")
+        return {'call': len(calls)}
+
+    metrics.start_periodic_dump(str(path), interval=0.01, extra=extra)
+    try:
+        wait_for(lambda: path.exists() and path.read_text())
+    finally:
+        metrics.stop_periodic_dump()
+    assert "Error dumping query metrics" in caplog.text
+    assert json.loads(path.read_text().splitlines()[0])['call'] >= 2
+
+
+def test_stop_periodic_dump_stops_rescheduling(tmp_path):
+    metrics = QueryMetrics()
+    path = tmp_path / 'metrics.jsonl'
+    metrics.start_periodic_dump(str(path), interval=0.01)
+    wait_for(lambda: path.exists() and path.read_text())
+    metrics.stop_periodic_dump()
+    time.sleep(0.05)
+    lines = len(path.read_text().splitlines())
+    time.sleep(0.1)
+    assert len(path.read_text().splitlines()) == lines
+    assert metrics._dump_timer is None
@@ -0,0 +1,161 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from nutrition_client import NutritionAPIError
+from search_cache import DiskStore, FoodSearchCache, RateLimitedError, normalize_query, slim_page
+
+
+def response(label, next_link=None):
+    data = {'hints': [{'food': {'label': label, 'nutrients': {'ENERC_KCAL': 52, 'PROCNT': 0.3, 'SUGAR': 10},
+                                'image': 'https://example.com/apple.jpg'},
+                       'measures': [{'label': 'Serving', 'weight': 182, 'uri': 'https://example.com/serving'}]}]}
+    if next_link is not None:
+        data['_links'] = {'next': {'title': 'Next page', 'href': next_link}}
+    return data
+
+
+class Upstream:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.queries = []
+        self.failing = False
+
+    def __call__(self, query):
+        self.queries.append(query)
+        time.sleep(self.delay)
+        if self.failing:
+            raise NutritionAPIError("Food database answered 503")
+        return response(query, next_link=f"next:{query}")
+
+
+@pytest.fixture
+def upstream():
+    return Upstream()
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    def make(fetch, **kwargs):
+        return FoodSearchCache(fetch, fetch_url=lambda url: response(url), path=str(tmp_path / 'search.db'), **kwargs)
+    return make
+
+
+def test_pages_keep_only_the_fields_the_app_reads():
+    assert slim_page(response('apple', 'next-url')) == {
+        'hints': [{'food': {'label': 'apple', 'nutrients': {'ENERC_KCAL': 52, 'PROCNT': 0.3}},
+                   'measures': [{'label': 'Serving', 'weight': 182}]}],
+        'next': 'next-url',
+    }
+    assert normalize_query("  Green   Apple ") == "green apple"
+
+
+def test_lookup_is_served_from_memory_then_disk(upstream, make_cache):
+    cache = make_cache(upstream)
+    page = cache.lookup('Apple')
+    assert cache.lookup('apple ') == page
+    assert upstream.queries == ['apple']
+    assert cache.stats()['memory_hits'] == 1
+
+    # A new process finds the page in the disk store, without Edamam's session-bound next-page link
+    restarted = make_cache(upstream)
+    assert restarted.lookup('apple') == {'hints': page['hints'], 'next': 'refresh:apple'}
+    assert upstream.queries == ['apple']
+    assert restarted.stats()['disk_hits'] == 1
+
+
+def test_expired_entries_are_fetched_again(upstream, make_cache):
+    cache = make_cache(upstream, ttl=0.01)
+    cache.lookup('apple')
+    time.sleep(0.02)
+    cache.lookup('apple')
+    assert upstream.queries == ['apple', 'apple']
+
+
+def test_concurrent_lookups_share_one_upstream_request(make_cache):
+    upstream = Upstream(delay=0.1)
+    cache = make_cache(upstream)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.lookup('banana'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert upstream.queries == ['banana']
+    assert len(results) == 8 and all(result == results[0] for result in results)
+    assert cache.stats()['shared'] == 7
+
+
+def test_rate_limit_serves_stale_results_or_raises(upstream, make_cache):
+    cache = make_cache(upstream, ttl=0.01, upstream_per_minute=1)
+    page = cache.lookup('apple')
+    time.sleep(0.02)
+    assert cache.lookup('apple') == page
+    assert cache.stats()['stale'] == 1
+    with pytest.raises(RateLimitedError):
+        cache.lookup('pear')
+
+
+def test_api_failure_serves_stale_results(upstream, make_cache):
+    cache = make_cache(upstream, ttl=0.01)
+    page = cache.lookup('apple')
+    time.sleep(0.02)
+    upstream.failing = True
+    assert cache.lookup('apple') == page
+    with pytest.raises(NutritionAPIError):
+        cache.lookup('pear')
+
+
+def test_next_page_follows_the_continuation_link(upstream, make_cache):
+    cache = make_cache(upstream)
+    assert cache.lookup('apple')['next'] == 'next:apple'
+    assert cache.next_page('next:apple')['hints'][0]['food']['label'] == 'next:apple'
+
+
+def test_next_page_links_are_not_stored_and_expire_from_memory(upstream, make_cache):
+    cache = make_cache(upstream)
+    cache.lookup('apple')
+    assert cache.disk.get('apple')[0] == {'hints': cache.lookup('apple')['hints'], 'more': True}
+    cache.LINK_TTL = 0
+    assert cache.lookup('apple')['next'] == 'refresh:apple'
+    assert upstream.queries == ['apple']
+
+
+def test_following_an_expired_link_re_runs_the_query_for_a_fresh_one(upstream, make_cache):
+    cache = make_cache(upstream)
+    cache.lookup('apple')
+    restarted = make_cache(upstream)
+    token = restarted.lookup('apple')['next']
+    assert restarted.next_page(token)['hints'][0]['food']['label'] == 'next:apple'
+    assert upstream.queries == ['apple', 'apple']
+    assert restarted.lookup('apple')['next'] == 'next:apple'
+
+
+def test_last_page_has_no_next_link_from_memory_or_disk(make_cache):
+    cache = make_cache(lambda query: response(query))
+    assert cache.lookup('apple')['next'] is None
+    assert make_cache(lambda query: response(query)).lookup('apple')['next'] is None
+
+
+def test_disk_store_is_trimmed_to_its_size_limit(upstream, make_cache):
+    cache = make_cache(upstream, disk_max_bytes=2000)
+    for i in range(20):
+        cache.lookup(f'food {i}')
+    assert cache.disk.size <= 2000
+
+
+def test_disk_store_of_another_version_is_emptied(tmp_path):
+    path = str(tmp_path / 'search.db')
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE search_cache (query TEXT PRIMARY KEY, hints TEXT NOT NULL, size INTEGER NOT NULL, "
+               "stored_at REAL NOT NULL, accessed_at REAL NOT NULL);")
+    db.execute("INSERT INTO search_cache VALUES ('apple', '[]', 2, 0, 0);")
+    db.commit()
+    db.close()
+    store = DiskStore(path, 1024)
+    assert store.get('apple') is None
+    assert store.size == 0
+    store.put('apple', {'hints': [], 'more': False}, 1.0)
+    assert DiskStore(path, 1024).get('apple') == ({'hints': [], 'more': False}, 1.0)
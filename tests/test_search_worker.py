@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+
+from nutrition_client import NutritionAPIError
+from search_worker import SearchWorker
+
+
+class MainThread:
+    """Collects dispatched callbacks so a test can run them the way Clock would."""
+    def __init__(self):
+        self.queue = []
+        self.lock = threading.Lock()
+
+    def __call__(self, callback):
+        with self.lock:
+            self.queue.append(callback)
+
+    def run(self):
+        with self.lock:
+            callbacks, self.queue = self.queue, []
+        for callback in callbacks:
+            callback()
+
+
+def pages(name, count, delay=0.0, started=None):
+    def generate():
+        if started is not None:
+            started.set()
+        for i in range(count):
+            time.sleep(delay)
+            yield f"{name}{i}"
+    return generate
+
+
+def test_pages_and_completion_are_delivered_in_order():
+    main = MainThread()
+    worker = SearchWorker(dispatch=main)
+    results = []
+    worker.submit(pages('a', 3), results.append, on_done=lambda: results.append('done'))
+    worker.executor.shutdown(wait=True)
+    main.run()
+    assert results == ['a0', 'a1', 'a2', 'done']
+
+
+def test_newer_search_supersedes_a_running_one():
+    main = MainThread()
+    worker = SearchWorker(dispatch=main)
+    results = []
+    started = threading.Event()
+    worker.submit(pages('old', 50, delay=0.01, started=started), results.append, on_done=lambda: results.append('old done'))
+    started.wait(1)
+    time.sleep(0.03)
+    worker.submit(pages('new', 2), results.append, on_done=lambda: results.append('new done'))
+    worker.executor.shutdown(wait=True)
+    main.run()
+    assert results == ['new0', 'new1', 'new done']
+
+
+def test_results_queued_before_cancel_are_dropped_on_the_main_thread():
+    main = MainThread()
+    worker = SearchWorker(dispatch=main)
+    results = []
+    worker.call(lambda: 'rows', results.append)
+    worker.executor.shutdown(wait=True)
+    worker.cancel()
+    main.run()
+    assert results == []
+
+
+def test_errors_reach_on_error_of_the_current_search():
+    main = MainThread()
+    worker = SearchWorker(dispatch=main)
+    errors = []
+
+    def failing():
+        raise ValueError("bad page")
+    worker.call(failing, lambda result: None, on_error=errors.append)
+    worker.executor.shutdown(wait=True)
+    main.run()
+    assert [str(error) for error in errors] == ["bad page"]
+
+
+def test_api_errors_are_logged_without_a_traceback(caplog):
+    main = MainThread()
+    worker = SearchWorker(dispatch=main)
+    errors = []
+
+    def unreachable():
+        raise NutritionAPIError("Edamam is unreachable")
+    with caplog.at_level(logging.WARNING):
+        worker.call(unreachable, lambda result: None, on_error=errors.append)
+        worker.executor.shutdown(wait=True)
+    main.run()
+    assert [str(error) for error in errors] == ["Edamam is unreachable"]
+    [record] = caplog.records
+    assert record.levelno == logging.WARNING and record.exc_info is None
+
+
+def test_unexpected_errors_are_logged_with_a_traceback(caplog):
+    worker = SearchWorker(dispatch=MainThread())
+
+    def failing():
+        raise ValueError("bad page")
+    with caplog.at_level(logging.WARNING):
+        worker.call(failing, lambda result: None)
+        worker.executor.shutdown(wait=True)
+    [record] = caplog.records
+    assert record.levelno == logging.ERROR and record.exc_info is not None
@@ -0,0 +1,71 @@
+from datetime import date, datetime
+
+from training_stats import advance_streak, current_streak, summarize_sets, week_start
+
+MONDAY = date(2024, 4, 1)
+
+
+def test_week_start_is_the_monday():
+    assert week_start(date(2024, 4, 7)) == MONDAY
+    assert week_start(MONDAY) == MONDAY
+
+
+def test_summarize_sets_totals_weeks_and_exercises():
+    rows = [
+        ('s1', 1, 100, 5, 116.7, '2024-04-01 18:00:00'),
+        ('s1', 1, 110, 3, 121.0, '2024-04-01 18:00:00'),
+        ('s1', 2, 60, 10, 80.0, '2024-04-01 18:00:00'),
+        ('s2', 1, 105, 5, 122.5, datetime(2024, 4, 3, 18)),
+        ('s3', 2, 65, 8, 82.3, '2024-04-08 18:00:00'),
+    ]
+    weeks, exercises = summarize_sets(rows)
+    assert weeks[MONDAY] == {'sessions': 2, 'sets': 4, 'reps': 23, 'volume': 500 + 330 + 600 + 525, 'days_mask': 0b101}
+    assert weeks[date(2024, 4, 8)]['sessions'] == 1 and weeks[date(2024, 4, 8)]['days_mask'] == 1
+    squat = exercises[1]
+    assert (squat['sessions'], squat['sets'], squat['best_weight'], squat['best_e1rm']) == (2, 3, 110.0, 122.5)
+    assert squat['best_e1rm_at'] == squat['last_performed'] == datetime(2024, 4, 3, 18)
+    assert exercises[2]['last_performed'] == datetime(2024, 4, 8, 18)
+
+
+def test_streak_counts_consecutive_weeks_and_restarts_after_a_gap():
+    streak = None
+    for week in (date(2024, 4, 1), date(2024, 4, 8), date(2024, 4, 15)):
+        streak = advance_streak(streak, week)
+    assert streak == (3, 3, date(2024, 4, 15))
+    # Another session in the same week, or one logged late for an earlier week, changes nothing
+    assert advance_streak(streak, date(2024, 4, 15)) == streak
+    assert advance_streak(streak, date(2024, 4, 8)) == streak
+    streak = advance_streak(streak, date(2024, 5, 6))
+    assert streak == (1, 3, date(2024, 5, 6))
+    assert advance_streak(streak, date(2024, 5, 13)) == (2, 3, date(2024, 5, 13))
+
+
+def test_current_streak_lapses_once_a_whole_week_is_missed():
+    streak = (4, 6, MONDAY)
+    assert current_streak(streak, today=date(2024, 4, 7)) == 4
+    # Last week's workout still counts while this week is under way
+    assert current_streak(streak, today=date(2024, 4, 14)) == 4
+    assert current_streak(streak, today=date(2024, 4, 15)) == 0
+    assert current_streak((4, 6, '2024-04-01'), today=date(2024, 4, 10)) == 4
+    assert current_streak(None, today=MONDAY) == 0
+
+
+def session(name, weight, reps, sets=3):
+    return [{'name': name, 'set_no': number, 'weight': weight, 'reps': reps} for number in range(1, sets + 1)]
+
+
+def test_incremental_stats_match_a_rebuild_from_the_sets(db_manager):
+    db_manager.save_workout_session('u1', session('Squat', 100, 5) + session('Bench Press', 70, 8), performed_at='2024-04-01 18:00:00')
+    db_manager.save_workout_session('u1', session('Squat', 105, 5), performed_at='2024-04-10 18:00:00')
+    db_manager.save_workout_session('u1', session('Squat', 110, 3), performed_at='2024-04-17 18:00:00')
+    today = date(2024, 4, 18)
+    summary = db_manager.get_training_summary('u1', today=today)
+    squat = db_manager.get_exercise_stats('u1', 'Squat')
+    assert summary['sessions_this_week'] == 1 and summary['volume_this_week'] == 990.0
+    assert (summary['current_streak'], summary['longest_streak']) == (3, 3)
+    assert (squat['sessions'], squat['sets'], squat['best_weight']) == (3, 9, 110.0)
+    assert db_manager.get_workout_dates('u1', date(2024, 4, 1), today) == {date(2024, 4, 1), date(2024, 4, 10), date(2024, 4, 17)}
+
+    assert db_manager.rebuild_training_stats('u1') == 1
+    assert db_manager.get_training_summary('u1', today=today) == summary
+    assert db_manager.get_exercise_stats('u1', 'Squat') == squat
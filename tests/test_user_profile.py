@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+
+from database import AsyncDatabaseManager
+from user_profile import User
+
+
+class Trigger:
+    # Stand-in for Clock.create_trigger: fired by the test instead of by the clock
+    def __init__(self, callback, timeout):
+        self.callback = callback
+        self.pending = False
+
+    def __call__(self):
+        self.pending = True
+
+    def cancel(self):
+        self.pending = False
+
+    def fire(self):
+        self.pending = False
+        self.callback(0)
+
+
+class MainThread:
+    # Callbacks dispatched by the database workers wait here until the test runs them
+    def __init__(self):
+        self.callbacks = []
+
+    def __call__(self, callback):
+        self.callbacks.append(callback)
+
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+@pytest.fixture
+def main_thread():
+    return MainThread()
+
+
+@pytest.fixture
+def user(db_manager, main_thread, monkeypatch):
+    async_db = AsyncDatabaseManager(db_manager, max_workers=1, dispatch=main_thread)
+    for name in ('db_manager', 'async_db', 'create_trigger'):
+        monkeypatch.setattr(User, name, None)
+    User.configure(db_manager, async_db, Trigger)
+    yield User('u1')
+    async_db.shutdown(wait=True)
+
+
+def settle(user, main_thread):
+    # Wait for the running save and hand its result to the main thread, as the app's frame loop would
+    while user._saving is not None:
+        user._saving_future.exception()
+        main_thread.run()
+
+
+def stored(db_manager, *columns):
+    return db_manager.execute_query(f"SELECT {', '.join(columns)} FROM userdata WHERE id = %s;", params=('u1',), fetch='one')
+
+
+def record_updates(db_manager, monkeypatch):
+    updates = []
+    update_user_fields = db_manager.update_user_fields
+
+    def recording(user_id, changes):
+        updates.append((dict(changes), threading.current_thread().name))
+        return update_user_fields(user_id, changes)
+    monkeypatch.setattr(db_manager, 'update_user_fields', recording)
+    return updates
+
+
+def test_only_fields_that_change_are_dirty(user):
+    user.goal = 'Lose fat'
+    user.calories = 2200
+    user.calories = 2200
+    user.gender = None
+    assert user._dirty == {'goal', 'calories'}
+    user.load_from_db(('u1', None, 'a@example.com', None, 'F', 30, 170, 60, None, 20, 'low', 'Gain muscle', 2500, None,
+                       None, '3 days a week', None, 'Back'))
+    assert user._dirty == set() and user.calories == 2500
+
+
+def test_save_writes_the_changed_columns_on_a_worker(db_manager, user, main_thread, monkeypatch):
+    updates = record_updates(db_manager, monkeypatch)
+    user.update_goal('Lose fat')
+    user.update_calories(2200)
+    user.save()
+    settle(user, main_thread)
+    assert [changes for changes, thread in updates] == [{'goal': 'Lose fat', 'calories': 2200}]
+    assert updates[0][1].startswith('db-worker')
+    assert stored(db_manager, 'goal', 'calories') == ('Lose fat', 2200)
+    user.save()
+    assert len(updates) == 1
+
+
+def test_scheduled_saves_are_coalesced(db_manager, user, main_thread, monkeypatch):
+    updates = record_updates(db_manager, monkeypatch)
+    user.update_calories(2000)
+    user.update_email('a@example.com')
+    user.update_calories(2100)
+    assert updates == [] and user._save_trigger.pending
+    user._save_trigger.fire()
+    settle(user, main_thread)
+    assert [changes for changes, thread in updates] == [{'calories': 2100, 'email': 'a@example.com'}]
+
+
+def test_save_requested_during_a_save_follows_it_with_the_newer_values(db_manager, user, main_thread, monkeypatch):
+    updates = record_updates(db_manager, monkeypatch)
+    user.calories = 2000
+    user.save()
+    user.calories = 2300
+    user.goal = 'Maintain'
+    user.save()
+    settle(user, main_thread)
+    assert [changes for changes, thread in updates] == [{'calories': 2000}, {'calories': 2300, 'goal': 'Maintain'}]
+    assert stored(db_manager, 'calories', 'goal') == (2300, 'Maintain')
+
+
+def test_failed_save_keeps_the_fields_dirty(db_manager, user, main_thread, monkeypatch):
+    update_user_fields = db_manager.update_user_fields
+
+    def unreachable(user_id, changes):
+        raise db_manager.database_errors[0]("server has gone away")
+    monkeypatch.setattr(db_manager, 'update_user_fields', unreachable)
+    user.calories = 2400
+    user.save()
+    settle(user, main_thread)
+    assert user._dirty == {'calories'}
+
+    monkeypatch.setattr(db_manager, 'update_user_fields', update_user_fields)
+    user.save()
+    settle(user, main_thread)
+    assert user._dirty == set() and stored(db_manager, 'calories') == (2400,)
+
+
+def test_save_now_waits_for_a_running_save_and_writes_the_rest(db_manager, user, main_thread, monkeypatch):
+    updates = record_updates(db_manager, monkeypatch)
+    user.calories = 2000
+    user.save()
+    user.goal = 'Maintain'
+    user.schedule_save()
+    user.save_now()
+    assert [changes for changes, thread in updates] == [{'calories': 2000}, {'goal': 'Maintain'}]
+    assert updates[1][1] == threading.current_thread().name
+    assert not user._save_trigger.pending
+    # Callbacks of the background save arriving afterwards change nothing
+    main_thread.run()
+    assert user._dirty == set() and len(updates) == 2
+    assert stored(db_manager, 'calories', 'goal') == (2000, 'Maintain')
@@ -0,0 +1,52 @@
+def session(name, weights, reps=5):
+    return [{'name': name, 'set_no': number, 'weight': weight, 'reps': reps} for number, weight in enumerate(weights, 1)]
+
+
+def weights(sessions):
+    return [[workout_set['weight'] for workout_set in found['sets']] for found in sessions]
+
+
+def test_last_sessions_are_newest_first_with_their_sets_in_order(db_manager):
+    db_manager.save_workout_session('u1', session('Squat', [100, 100, 95]), performed_at='2024-04-01 18:00:00')
+    db_manager.save_workout_session('u1', session('Squat', [105, 105]) + session('Bench Press', [70]), performed_at='2024-04-03 18:00:00')
+    db_manager.save_workout_session('u1', session('Bench Press', [72.5]), performed_at='2024-04-05 18:00:00')
+    last = db_manager.get_last_sessions('u1', 'Squat', count=5)
+    assert weights(last) == [[105, 105], [100, 100, 95]]
+    assert str(last[0]['timestamp'])[:10] == '2024-04-03'
+    assert [workout_set['set_no'] for workout_set in last[1]['sets']] == [1, 2, 3]
+    assert weights(db_manager.get_last_sessions('u1', 'Squat')) == [[105, 105]]
+    assert db_manager.get_last_sessions('u1', 'Deadlift') == []
+
+
+def test_sessions_saved_in_the_same_second_stay_apart(db_manager):
+    db_manager.save_workout_session('u1', session('Squat', [100, 100]), performed_at='2024-04-01 18:00:00')
+    db_manager.save_workout_session('u1', session('Squat', [60]), performed_at='2024-04-01 18:00:00')
+    last = db_manager.get_last_sessions('u1', 'Squat', count=2)
+    assert weights(last) == [[60], [100, 100]]
+    assert weights(db_manager.get_last_sessions('u1', 'Squat')) == [[60]]
+
+
+def test_a_session_whose_sets_have_different_timestamps_stays_whole(db_manager):
+    db_manager.save_workout_session('u1', session('Squat', [90]), performed_at='2024-03-28 18:00:00')
+    exercise_id = db_manager.get_or_create_exercise('Squat')
+    rows = [('s-long', 'u1', exercise_id, number, 100 + number, 5, 120.0, f"2024-04-01 18:0{number}:00") for number in (1, 2, 3)]
+    db_manager.execute_many("""
+    INSERT INTO workout_sets (session_id, user_id, exercise_id, set_no, weight, reps, e1rm, timestamp)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
+    """, rows, commit=True)
+    last = db_manager.get_last_sessions('u1', 'Squat', count=2)
+    assert [found['session_id'] for found in last][0] == 's-long'
+    assert weights(last) == [[101, 102, 103], [90]]
+    assert str(last[0]['timestamp']).startswith('2024-04-01 18:03')
+
+
+def test_previous_performance_prefills_each_exercise_from_its_last_session(db_manager):
+    db_manager.save_workout_session('u1', session('Squat', [100, 100]) + session('Bench Press', [70]), performed_at='2024-04-01 18:00:00')
+    db_manager.save_workout_session('u1', session('Squat', [110], reps=3), performed_at='2024-04-08 18:00:00')
+    db_manager.insert_user_id('u2')
+    db_manager.save_workout_session('u2', session('Bench Press', [140]), performed_at='2024-04-09 18:00:00')
+    previous = db_manager.get_previous_performance('u1', ['Squat', 'Bench Press', 'Squat', 'Deadlift'])
+    assert previous == {
+        'Squat': [{'set_no': 1, 'weight': 110.0, 'reps': 3, 'e1rm': 121.0}],
+        'Bench Press': [{'set_no': 1, 'weight': 70.0, 'reps': 5, 'e1rm': 81.7}],
+    }
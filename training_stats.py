@@ -0,0 +1,71 @@
+# Aggregation rules for the materialized training statistics (weekly_stats, exercise_stats, user_streaks).
+# DatabaseManager applies them to each saved session inside its transaction, and to a user's whole
+# workout_sets history when the statistics are rebuilt, so both paths produce the same numbers.
+from datetime import date, datetime, timedelta
+
+
+def to_datetime(value):
+    return value if isinstance(value, datetime) else datetime.strptime(str(value), "%Y-%m-%d %H:%M:%S")
+
+
+def week_start(day):
+    # Weeks start on Monday
+    return day - timedelta(days=day.weekday())
+
+
+def summarize_sets(rows):
+    # rows are (session_id, exercise_id, weight, reps, e1rm, timestamp) tuples.
+    # Returns ({week_start: totals}, {exercise_id: totals}) ready to be added to the stored rows.
+    weeks = {}
+    exercises = {}
+    for session_id, exercise_id, weight, reps, e1rm, timestamp in rows:
+        timestamp = to_datetime(timestamp)
+        day = timestamp.date()
+        weight, reps, e1rm = float(weight), int(reps), float(e1rm)
+        volume = weight * reps
+
+        week = weeks.setdefault(week_start(day), {'sessions': set(), 'sets': 0, 'reps': 0, 'volume': 0.0, 'days_mask': 0})
+        week['sessions'].add(session_id)
+        week['sets'] += 1
+        week['reps'] += reps
+        week['volume'] += volume
+        week['days_mask'] |= 1 << day.weekday()
+
+        exercise = exercises.setdefault(exercise_id, {'sessions': set(), 'sets': 0, 'volume': 0.0, 'best_weight': 0.0,
+                                                      'best_e1rm': 0.0, 'best_e1rm_at': timestamp, 'last_performed': timestamp})
+        exercise['sessions'].add(session_id)
+        exercise['sets'] += 1
+        exercise['volume'] += volume
+        exercise['best_weight'] = max(exercise['best_weight'], weight)
+        if e1rm > exercise['best_e1rm']:
+            exercise['best_e1rm'] = e1rm
+            exercise['best_e1rm_at'] = timestamp
+        exercise['last_performed'] = max(exercise['last_performed'], timestamp)
+
+    for totals in list(weeks.values()) + list(exercises.values()):
+        totals['sessions'] = len(totals['sessions'])
+    return weeks, exercises
+
+
+def advance_streak(streak, week):
+    # streak is (current, longest, last_week) or None; returns it after a workout in `week`.
+    # The streak counts consecutive weeks with at least one workout.
+    if streak is None:
+        return 1, 1, week
+    current, longest, last_week = streak
+    if week <= last_week:
+        # Same week, or a session logged late for an earlier week; rebuild-stats recounts those
+        return current, longest, last_week
+    current = current + 1 if week - last_week == timedelta(weeks=1) else 1
+    return current, max(longest, current), week
+
+
+def current_streak(streak, today=None):
+    # The stored streak only ends when the next workout comes in, so a gap up to last week is checked on read
+    if streak is None:
+        return 0
+    current, longest, last_week = streak
+    if isinstance(last_week, str):
+        last_week = date.fromisoformat(last_week)
+    this_week = week_start(today or date.today())
+    return current if this_week - last_week <= timedelta(weeks=1) else 0
@@ -0,0 +1,188 @@
+# The signed-in user's profile with dirty-field tracking.
+# Assigning a profile field marks it dirty, and save() writes only the dirty fields with one UPDATE on a
+# database worker, so the frame loop never waits on the server. schedule_save() coalesces changes made in
+# quick succession into one save. The app hands in its database managers and Clock.create_trigger through
+# User.configure().
+import logging
+
+
+class User:
+    # Profile fields persisted to userdata; assigning any of them marks it dirty until the next save()
+    PROFILE_FIELDS = ('email', 'gender', 'age', 'height', 'weight', 'experience_level', 'bodyfat', 'activity_level',
+                      'goal', 'calories', 'equipment', 'training_style', 'training_frequency', 'prioritized_muscle_groups')
+    # Seconds to wait for more changes before a scheduled save writes them
+    SAVE_DELAY = 0.5
+
+    db_manager = None
+    async_db = None
+    create_trigger = None
+
+    @classmethod
+    def configure(cls, db_manager, async_db, create_trigger):
+        # create_trigger(callback, timeout) returns a callable trigger with cancel(), like Clock.create_trigger
+        cls.db_manager = db_manager
+        cls.async_db = async_db
+        cls.create_trigger = staticmethod(create_trigger)
+
+    def __init__(self, user_id, email=None, gender=None, age=None, height=None, weight=None, experience_level=None, bodyfat=None, activity_level=None, goal=None, calories=None, equipment=None, training_style=None, training_frequency=None, prioritized_muscle_groups=None):
+        self._dirty = set()
+        self._save_trigger = None
+        # Changes of the save running on a database worker, and its future
+        self._saving = None
+        self._saving_future = None
+        self._save_again = False
+        self.user_id = user_id
+        self.preferences = {}
+        self.email = email
+        self.gender = gender
+        self.age = age
+        self.height = height
+        self.weight = weight
+        self.experience_level = experience_level
+        self.bodyfat = bodyfat
+        self.activity_level = activity_level
+        self.goal = goal
+        self.calories = calories
+        self.equipment = equipment
+        self.training_style = training_style
+        self.training_frequency = training_frequency
+        self.prioritized_muscle_groups = prioritized_muscle_groups
+        self._dirty.clear()
+
+    def __setattr__(self, name, value):
+        if name in self.PROFILE_FIELDS and getattr(self, name, None) != value:
+            self._dirty.add(name)
+        super().__setattr__(name, value)
+
+    def load_from_db(self, user_data):
+        if user_data is not None:
+            self.email = user_data[2]
+            self.gender = user_data[4]
+            self.age = user_data[5]
+            self.height = float(user_data[6])
+            self.weight = float(user_data[7])
+            self.experience_level = user_data[8]
+            self.bodyfat = float(user_data[9])
+            self.activity_level = user_data[10]
+            self.goal = user_data[11]
+            self.calories = user_data[12]
+            self.equipment = user_data[13]
+            self.training_style = user_data[14]
+            self.training_frequency = user_data[15]
+            self.prioritized_muscle_groups = user_data[17]
+            # The loaded values are what is stored, so nothing is dirty
+            self._dirty.clear()
+        else:
+            print("No data found")
+
+    def update_email(self, email):
+        self.email = email
+        self.schedule_save()
+
+    def update_gender(self, gender):
+        self.gender = gender
+
+    def update_age(self, age):
+        self.age = age
+
+    def update_height(self, height):
+        self.height = height
+
+    def update_weight(self, weight):
+        self.weight = weight
+
+    def update_experience_level(self, experience_level):
+        self.experience_level = experience_level
+
+    def update_bodyfat(self, bodyfat):
+        self.bodyfat = bodyfat
+
+    def update_activity_level(self, activity_level):
+        self.activity_level = activity_level
+
+    def update_goal(self, goal):
+        self.goal = goal
+
+    def update_calories(self, calories):
+        self.calories = calories
+        self.schedule_save()
+
+    def update_equipment(self, equipment):
+        self.equipment = equipment
+
+    def update_training_style(self, training_style):
+        self.training_style = training_style
+
+    def update_training_frequency(self, training_frequency):
+        self.training_frequency = training_frequency
+
+    def update_prioritized_muscle_groups(self, prioritized_muscle_groups):
+        self.prioritized_muscle_groups = prioritized_muscle_groups
+        # Last step of onboarding: write everything collected so far in one statement
+        self.save()
+
+    def schedule_save(self):
+        # Coalesce changes made in quick succession into a single save
+        if self._save_trigger is None:
+            self._save_trigger = self.create_trigger(lambda dt: self.save(), self.SAVE_DELAY)
+        self._save_trigger()
+
+    def save(self):
+        # Write the dirty fields on a database worker. One save runs at a time so the writes reach the database
+        # in order; a save requested meanwhile runs once it finishes.
+        if self._save_trigger is not None:
+            self._save_trigger.cancel()
+        if self._saving is not None:
+            self._save_again = True
+            return
+        if not self._dirty:
+            return
+        changes = self._take_changes()
+        self._saving = changes
+        self._saving_future = self.async_db.update_user_fields(self.user_id, changes,
+                                                               on_result=lambda result: self._on_saved(changes),
+                                                               on_error=lambda error: self._on_save_failed(changes, error))
+
+    def save_now(self):
+        # Synchronous save for on_stop, when the callbacks of a background save would never run:
+        # waits for a save already running, then writes whatever is still dirty
+        if self._save_trigger is not None:
+            self._save_trigger.cancel()
+        if self._saving is not None:
+            changes, self._saving = self._saving, None
+            self._save_again = False
+            try:
+                self._saving_future.result()
+            except Exception:
+                self._dirty.update(changes)
+        if not self._dirty:
+            return
+        changes = self._take_changes()
+        try:
+            self.db_manager.update_user_fields(self.user_id, changes)
+        except Exception as e:
+            self._dirty.update(changes)
+            logging.error("Error saving user: {}".format(e))
+            raise
+
+    def _take_changes(self):
+        changes = {field: getattr(self, field) for field in self._dirty}
+        self._dirty.clear()
+        return changes
+
+    def _on_saved(self, changes):
+        if self._saving is not changes:
+            # Already settled by save_now
+            return
+        self._saving = None
+        if self._save_again:
+            self._save_again = False
+            self.save()
+
+    def _on_save_failed(self, changes, error):
+        if self._saving is not changes:
+            return
+        self._saving = None
+        self._save_again = False
+        # The worker logged the error; the fields stay dirty so the next save writes them again
+        self._dirty.update(changes)